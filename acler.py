@@ -9,30 +9,71 @@ from __future__ import print_function
 # getting site-packages modules installed at customer location
 from acler.acleritem import AclerItem
 from acler.cisco_custom import parse_cisco
+from acler.protocols import port_range, protos, well_known_ports
 from acler.elapsed_time import elapsed_time                                                                                                        
+from acler.columnar import ColumnarCache, build_columnar_cache
+from acler.inprocess import chunk_records_for_budget, evaluate_working_file, peak_rss, reset_peak_rss
+from acler.progress import ProgressTracker
+from acler.asynclog import start_queue_logging, restart_queue_logging, DebugSampler, JsonLinesFormatter
+from acler.resultsdb import ResultsDB
+from acler.state import RollingState
+from acler.addresses import cidr_to_range
+from acler.daemon import DaemonServer, ENGINES, InventoryCache, WorkingFileCache, socket_in_use, validate_job
+from acler.partitions import build_partition_commands, write_manifest, read_manifest, partitions_for
+from acler.chunks import day_chunk, day_part_chunk, hour_chunk, window_days
+from acler.planner import PullHistory, hour_sizes, plan_window
+from acler.pmap import PmapEvaluator, ADDRESS_MAP, PORT_MAP
+from acler.verdictcache import VerdictCache, chunk_key
+from acler.tracer import NullTracer, Tracer
+from acler.sampling import build_sample_slices, SAMPLE_ORDERS
+from acler.strategies import get_strategy, STRATEGIES
+import atexit
+import copy
+from distutils.spawn import find_executable
 import csv
 from datetime import datetime, date, timedelta
 import logging, logging.handlers
-# not a best practice to import all, but what is called for by SEI docs
-from silk import *
+import math
+import multiprocessing
 import optparse
 import os
 from os.path import expanduser
 import re
+import signal
 import subprocess
 import sys
 import time
 
 # global vars
 aclers = list() # list of AclerItem objects
+infiles = list() # (in-file, column) pairs, indexed by AclerItem source
 setfile = None # silk set file
 mytime = None # clean datetime info for inclusion in file names
 rwfile = None # rwf working file
+rwfiles = list() # rwf working file parts of the current pull
 tmprwfile = None # rwf working file for each acl check
+envrwfile = None # rwf working file narrowed to each acl's envelope
+pmapfiles = dict() # pmap engine prefix map (source, built) file names, by map
+partprefix = None # prefix for the partitioned working files
+manifestfile = None # partitioned working file manifest
+partition_ports = list() # tcp/udp ports that get their own partition
+answer_windows = list() # (days, first day) of each --windows window, shortest first
 desired_types = list() # silk types to track
 options = None # option parsing
 args = None # option parsing
 logger = None # logging handler
+loglistener = None # background log writer
+tracer = NullTracer() # timeline tracing, a Tracer with --trace-file
+progress = None # progress, throughput and eta tracking
+resultsdbs = list() # optional sqlite results stores, one per in-file
+previous_outfiles = dict() # last so-far results CSV written, by in-file
+last_datepart = None # date part of the last results CSV file name
+daemon_options = None # daemon mode defaults for each job
+inventories = None # daemon mode parsed ACL files
+workcache = None # daemon mode recent repo pulls
+jobstream = None # daemon mode function streaming results for a chunk
+verdicts = None # optional persistent per chunk verdicts, --verdict-cache
+rolling = None # rolling incremental per-ACL state
 
 
 def build_set():
@@ -41,7 +82,7 @@ def build_set():
     each assessible acl record. This will be used by the 
     rwfilter pull to build a working file of the traffic we
     need to analyze. This is instead of hitting the repo 
-    numerous times.
+    numerous times. Returns the number of blocks in the set.
     """
 
     global setfile
@@ -49,23 +90,34 @@ def build_set():
     # gather up the smallest ip block from each acl
     blocks = list()
     for i in aclers:
-        if i.assess():
+        if i.assess() and not i.is_port_only():
             a = i.smallest_ip_block()
             blocks.append(a)
 
+    # PySiLK is only imported once there is something to pull, so the
+    # in-files can be validated (--validate-only) without SiLK
+    from silk import IPSet
+
     # build a set file
-    myset = IPSet(blocks)
-    logger.debug("Saving ACL SiLK set file at: %s" % setfile)
-    myset.save(setfile)
+    with tracer.span('build set', blocks=len(blocks)):
+        myset = IPSet(blocks)
+        logger.debug("Saving ACL SiLK set file at: %s", setfile)
+        myset.save(setfile)
+
+    return len(blocks)
 
 
-def aclfile_to_aclers(aclfilename):
+def aclfile_to_aclers(aclfilename, column=None, source=0):
     """
     Read the lines in the acl file and convert each line to an
-    AclerItem, adding each AclerItem to the aclers list.
+    AclerItem, adding each AclerItem to the aclers list. The items
+    are tagged with the source index of the in-file.
     """
 
-    logger.info("Processing %s using column %d for ACL entries." % (aclfilename, options.infilecolumn))
+    if column is None:
+        column = options.infilecolumn
+
+    logger.info("Processing %s using column %d for ACL entries." % (aclfilename, column))
 
     with open(aclfilename, 'rb') as f:
 
@@ -76,11 +128,19 @@ def aclfile_to_aclers(aclfilename):
             i = i + 1 # make one based
 
             # make sure there are enough columns in the row
-            if options.infilecolumn > len(v):
-                msg = "Row %d does not have enough sections to process col %d: %s" % (i, options.infilecolumn, v)
+            if column > len(v):
+                msg = "Row %d does not have enough sections to process col %d: %s" % (i, column, v)
                 logger.error(msg)
                 myname = ' '.join(v)
                 myacler = AclerItem(myname)
+                myacler.source = source
+                myacler.windows = answer_windows or None
+                myacler.full_accounting = options.fullaccounting
+                if options.autonumber:
+                    myacler.line = str(i)
+                    myacler.error = msg
+                    aclers.append(myacler)
+                    continue
                 try:
                     # try to get a line number from first col
                     myint = v[0].strip()
@@ -97,11 +157,19 @@ def aclfile_to_aclers(aclfilename):
                 continue
 
             # convert to zero based for the list
-            col = options.infilecolumn - 1
+            col = column - 1
 
             try:
-                myacler = parse_cisco(v[col])
+                myacler = parse_cisco(v[col], options.portonly)
+                myacler.source = source
+                myacler.port_only = options.portonly
+                myacler.windows = answer_windows or None
+                myacler.full_accounting = options.fullaccounting
                 aclers.append(myacler)
+                if options.autonumber:
+                    # number the rows as csv_add_int.py would
+                    myacler.line = str(i)
+                    continue
                 # try to get a line number from first col
                 myint = v[0].strip()
                 # make sure it's an int
@@ -126,10 +194,43 @@ def get_elapsed_time_since(begin_time):
     return howlong
 
 
-def build_rwfilter_working_file(start, end):
+def run_command(cmd, name, **args):
+    """
+    Run a command (a shell string or an argument list) like os.system,
+    in a trace span with its pid and exit code. Returns the exit code.
+    """
+
+    shell = isinstance(cmd, str)
+    if not shell:
+        args['cmd'] = ' '.join(cmd)
+    else:
+        args['cmd'] = cmd
+    with tracer.span(name, 'subprocess', **args) as span:
+        p = subprocess.Popen(cmd, shell=shell)
+        span.set_arg('pid', p.pid)
+        returncode = p.wait()
+        span.set_arg('exit', returncode)
+    return returncode
+
+
+def read_command(myargs, name, **args):
+    """run_command for an argument list whose output is needed. Returns the (exit code, output)."""
+
+    args['cmd'] = ' '.join(myargs)
+    with tracer.span(name, 'subprocess', **args) as span:
+        p = subprocess.Popen(myargs, stdout=subprocess.PIPE)
+        span.set_arg('pid', p.pid)
+        output = p.communicate()[0]
+        span.set_arg('exit', p.returncode)
+    return (p.returncode, output)
+
+
+def build_rwfilter_working_file(start, end, extra=None):
     """
     Query the repo using the acl address block set and generate
-    a raw/rw working file.
+    a raw/rw working file. Any extra rwfilter args (list) are added
+    to the pull, e.g. to limit time or the number of records.
+    Returns the number of seconds the pull took.
     """
 
     # get wall clock start time
@@ -142,9 +243,12 @@ def build_rwfilter_working_file(start, end):
     --class=%s --type=%s --pass=%s" % (start, end, setfile, \
     protocols, options.silkclass, options.silktypes, rwfile)
 
+    if extra:
+        cmd = "%s %s" % (cmd, ' '.join(extra))
+
     logger.info("Repo pull: %s" % cmd)
 
-    returncode = os.system(cmd)
+    returncode = run_command(cmd, 'repo pull')
 
     howlong = get_elapsed_time_since(t1)
 
@@ -154,6 +258,394 @@ def build_rwfilter_working_file(start, end):
        logger.error("Repo pull rwfilter return code not zero: %s" % returncode)
        sys.exit(returncode)
 
+    return time.time() - t1
+
+
+def get_pull_parts(start, end, extra=None):
+    """
+    Split the pull into (start, end, types) parts for --pull-split,
+    one per desired type or one per hour of a day or part of a day.
+    Record capped pulls and pulls that can't be split are a single part.
+    """
+
+    if options.pulljobs < 2:
+        return [(start, end, options.silktypes)]
+    if extra and [x for x in extra if x.startswith('--max-pass-records')]:
+        # the cap is for the whole pull
+        return [(start, end, options.silktypes)]
+
+    if options.pullsplit == 'hour':
+        (myday, first, last) = (start, 0, 23)
+        if ':' in start and ':' in end:
+            # hours of one day, e.g. the rest of the first day
+            myday = start.split(':')[0]
+            first = int(start.split(':')[1])
+            last = int(end.split(':')[1])
+        if myday == end.split(':')[0] and \
+                not [x for x in (extra or []) if x.startswith('--stime')]:
+            return [("%s:%02d" % (myday, h), "%s:%02d" % (myday, h), options.silktypes)
+                    for h in range(first, last + 1)]
+    elif len(desired_types) > 1 and 'all' not in desired_types:
+        return [(start, end, t) for t in desired_types]
+
+    return [(start, end, options.silktypes)]
+
+
+def build_parallel_working_files(start, end, extra=None):
+    """
+    Fan the repo pull out into per type or per hour rwfilter processes,
+    at most --pull-jobs at a time, each writing one part of the working
+    file. The parts are read as one input afterwards.
+    Returns the number of seconds the pull took.
+    """
+
+    global rwfiles
+
+    t1 = time.time()
+
+    protocols = aclers_assess_protocols()
+    parts = get_pull_parts(start, end, extra)
+
+    if len(parts) == 1:
+        rwfiles = [rwfile]
+        return build_rwfilter_working_file(start, end, extra)
+
+    (myname, myext) = os.path.splitext(rwfile)
+    pending = list()
+    rwfiles = list()
+    for (i, (mystart, myend, mytypes)) in enumerate(parts):
+        partfile = "%s-pull%d%s" % (myname, i, myext)
+        cmd = "rwfilter --start=%s --end=%s --anyset=%s --proto=%s \
+        --class=%s --type=%s --pass=%s" % (mystart, myend, setfile, \
+        protocols, options.silkclass, mytypes, partfile)
+        if extra:
+            cmd = "%s %s" % (cmd, ' '.join(extra))
+        rwfiles.append(partfile)
+        pending.append(cmd)
+
+    logger.info("Repo pull in %d parts by %s, %d at a time" %
+                (len(parts), options.pullsplit, options.pulljobs))
+
+    running = list()
+    started = dict()
+    returncode = 0
+    while pending or running:
+        while pending and len(running) < options.pulljobs and not returncode:
+            cmd = pending.pop(0)
+            logger.info("Repo pull: %s" % cmd)
+            p = subprocess.Popen(cmd, shell=True)
+            started[p.pid] = (cmd, time.time())
+            running.append(p)
+        for p in [x for x in running if x.poll() is not None]:
+            running.remove(p)
+            # on a track of its own, the parts overlap
+            (cmd, mystart) = started[p.pid]
+            tracer.complete('repo pull part', 'subprocess', mystart, time.time(),
+                            {'cmd': cmd, 'pid': p.pid, 'exit': p.returncode}, tid=p.pid)
+            if p.returncode and not returncode:
+                returncode = p.returncode
+                pending = list()
+                for x in running:
+                    x.terminate()
+        time.sleep(0.05)
+
+    howlong = get_elapsed_time_since(t1)
+
+    logger.info("Repo pull rwfilters took %s to run" % howlong)
+
+    if returncode:
+       logger.error("Repo pull rwfilter return code not zero: %s" % returncode)
+       sys.exit(returncode)
+
+    return time.time() - t1
+
+
+def build_port_only_working_file(chunk, extra, portonly):
+    """
+    Pull the chunk for the port-only ACL's: the records of their
+    protocols with any of their ports on either side, capped at
+    --port-only-max-records unless the extra rwfilter args (list)
+    already cap the pull. Returns the (number of seconds the pull
+    took, record cap or None).
+    """
+
+    global rwfiles
+
+    t1 = time.time()
+
+    protocols = sorted(set([a.protocol for a in portonly]))
+    ports = set()
+    for a in portonly:
+        for port in (a.sport, a.dport):
+            if port is not None:
+                ports.add(str(port))
+    ports = sorted(ports, key=port_range)
+
+    myextra = list(extra)
+    cap = None
+    if not [x for x in myextra if x.startswith('--max-pass-records')]:
+        cap = options.portonlymaxrecords
+        myextra.append("--max-pass-records=%d" % cap)
+
+    rwfiles = [rwfile]
+    cmd = "rwfilter --start=%s --end=%s --proto=%s --aport=%s \
+    --class=%s --type=%s --pass=%s %s" % (chunk.start, chunk.end, \
+    ','.join([str(x) for x in protocols]), ','.join(ports), \
+    options.silkclass, options.silktypes, rwfile, ' '.join(myextra))
+
+    logger.info("Port-only pull for %d ACL's: %s" % (len(portonly), cmd))
+
+    returncode = run_command(cmd, 'port-only pull')
+
+    logger.info("Port-only pull rwfilter took %s to run" % get_elapsed_time_since(t1))
+
+    if returncode:
+       logger.error("Port-only pull rwfilter return code not zero: %s" % returncode)
+       sys.exit(returncode)
+
+    return (time.time() - t1, cap)
+
+
+def build_cached_working_file(chunk, extra):
+    """
+    Daemon mode version of build_rwfilter_working_file. If a recent
+    pull of the same chunk covered the set's blocks and protocols, the
+    working file is filtered from it instead of the repo. Otherwise
+    the repo is pulled and the pull is cached, unless it was record
+    capped or the day may still be getting written to.
+    Returns the number of seconds the pull took.
+    """
+
+    global rwfiles
+
+    blocks = [a.smallest_ip_block() for a in aclers if a.assess() and not a.is_port_only()]
+    protocols = aclers_assess_protocols()
+    key = (options.silkclass, options.silktypes, chunk.start, chunk.end, ' '.join(chunk.extra))
+
+    cached = None
+    if not extra or extra == chunk.extra:
+        cached = workcache.find(key, blocks, protocols)
+
+    if cached is None:
+        seconds = build_parallel_working_files(chunk.start, chunk.end, extra)
+        if extra == chunk.extra and chunk.day.date() < date.today():
+            workcache.add(key, rwfiles, blocks, protocols)
+        return seconds
+
+    t1 = time.time()
+    rwfiles = [rwfile]
+    cmd = "rwfilter %s --anyset=%s --pass=%s" % (' '.join(cached), setfile, rwfile)
+    if protocols:
+        cmd = "%s --proto=%s" % (cmd, protocols)
+
+    logger.info("Cached pull: %s" % cmd)
+    returncode = run_command(cmd, 'cached pull')
+    logger.info("Cached pull rwfilter took %s to run" % get_elapsed_time_since(t1))
+
+    if returncode:
+       logger.error("Cached pull rwfilter return code not zero: %s" % returncode)
+       sys.exit(returncode)
+
+    return time.time() - t1
+
+
+def get_repo_files(start, end):
+    """
+    Use rwfglob to find the repo files for the class/types from the
+    YYYY/MM/DD start to end dates and return the list of their paths.
+    """
+
+    myargs = ["rwfglob", "--class=%s" % options.silkclass, "--type=%s" % options.silktypes,
+              "--start-date=%s" % start, "--end-date=%s" % end, "--no-summary"]
+
+    try:
+        (returncode, output) = read_command(myargs, 'rwfglob')
+    except:
+        logger.error("Can not run rwfglob to size repo files for %s-%s" % (start, end))
+        sys.exit(1)
+
+    files = list()
+    for i in output.split("\n"):
+        i = i.strip()
+        if i != '' and os.path.isfile(i):
+            files.append(i)
+    return files
+
+
+def get_repo_day_size(day):
+    """
+    Use rwfglob to find the repo files for the class/types on the
+    datetime day and return their total size in bytes.
+    """
+
+    mydate = day.strftime("%Y/%m/%d")
+    total = sum([os.path.getsize(x) for x in get_repo_files(mydate, mydate)])
+
+    logger.debug("Repo files for %s total %d bytes", mydate, total)
+    return total
+
+
+def merge_ranges(ranges):
+    """Merge (low, high) ranges into a sorted list of disjoint ones"""
+
+    merged = list()
+    for (low, high) in sorted(ranges):
+        if merged and low <= merged[-1][1] + 1:
+            if high > merged[-1][1]:
+                merged[-1] = (merged[-1][0], high)
+        else:
+            merged.append((low, high))
+    return merged
+
+
+def validate_inventory():
+    """
+    Report on the parsed in-files without pulling anything, for
+    --validate-only: parse errors, assessible count, protocol mix, set
+    size, and the pull scope, estimated from the repo file sizes when
+    rwfglob is available. Needs no SiLK, except for the estimate.
+    """
+
+    mynames = ', '.join([x[0] for x in infiles])
+    assessible = [a for a in aclers if a.assess()]
+    unparsed = [a for a in aclers if not a.parsed]
+    notassessed = [a for a in aclers if a.parsed and not a.assessible]
+
+    print("%d ACL lines in %s" % (len(aclers), mynames))
+    print("  %d parsed, %d parse errors, %d parsed but not assessible, %d assessible" %
+          (len(aclers) - len(unparsed), len(unparsed), len(notassessed), len(assessible)))
+
+    errors = dict()
+    for a in unparsed + notassessed:
+        errors[a.error] = errors.get(a.error, 0) + 1
+    if errors:
+        print("Errors:")
+        for error in sorted(errors, key=lambda x: (-errors[x], x)):
+            print("  %6d  %s" % (errors[error], error))
+        print("First lines with errors:")
+        for a in (unparsed + notassessed)[:20]:
+            print("  line %s: %s: %s" % (a.line, a.error, a.acl))
+
+    names = dict()
+    for (name, number) in sorted(protos.items(), reverse=True):
+        names[int(number)] = name
+    mix = dict()
+    for a in assessible:
+        mix[a.protocol] = mix.get(a.protocol, 0) + 1
+    print("Protocol mix:")
+    for proto in sorted(mix, key=lambda x: (-mix[x], x)):
+        print("  %6d  %s" % (mix[proto], names.get(proto, proto)))
+
+    blocks = [a.smallest_ip_block() for a in assessible if not a.is_port_only()]
+    merged = merge_ranges([cidr_to_range(x) for x in blocks])
+    print("Set: %d blocks (%d distinct), %d addresses in %d ranges" %
+          (len(blocks), len(set(blocks)), sum([high - low + 1 for (low, high) in merged]),
+           len(merged)))
+    portonly = len([a for a in assessible if a.is_port_only()])
+    if portonly:
+        print("Port-only: %d ACL's pulled by protocol and port" % portonly)
+
+    days = window_days(options.start, options.end)
+    print("Window: %s to %s, %d days, the first hour and %d day pulls" %
+          (options.start, options.end, len(days), len(days)))
+    if not assessible:
+        print("Pull scope: nothing to pull")
+    elif not options.silkclass or not options.silktypes:
+        print("Pull scope: not estimated, needs -c and -t")
+    elif not find_executable('rwfglob'):
+        print("Pull scope: not estimated, rwfglob not found")
+    else:
+        plan = build_plan()
+        pulls = plan.pulls()
+        print("Pull scope: %d pulls reading %.1f MB from the repo, about %ds" %
+              (plan.num_chunks(), sum([p.repo_bytes * p.groups for p in pulls]) / (1024.0 * 1024),
+               sum([p.seconds for p in pulls])))
+
+
+def build_plan():
+    """
+    Size each hour of the window from the repo files and plan the
+    pulls to keep the working files under --max-working-mb, using the
+    pull history in the results db for the estimates.
+    """
+
+    sizes = hour_sizes(get_repo_files(options.start, options.end))
+
+    history = PullHistory()
+    if options.resultsdb and os.path.exists(options.resultsdb):
+        db = ResultsDB(options.resultsdb)
+        history = PullHistory(db.pull_history(options.silkclass, options.silktypes, options.engine))
+        db.close()
+
+    budget = None
+    if options.maxworkingmb:
+        budget = options.maxworkingmb * 1024 * 1024
+
+    return plan_window(window_days(options.start, options.end), sizes, history, budget,
+                       aclers_assess_count(), options.engine)
+
+
+def split_set_groups(count):
+    """
+    Split the assessible ACL's into count groups of neighbouring
+    address blocks, so each group's set covers less of the repo.
+    """
+
+    mine = [a for a in aclers if a.assess() and not a.is_port_only()]
+    mine.sort(key=lambda a: cidr_to_range(a.smallest_ip_block()))
+    size = int(math.ceil(len(mine) / float(count)))
+    groups = [mine[i:i + size] for i in range(0, len(mine), size)]
+    if not groups:
+        groups = [list()]
+    # port-only ACL's don't add to the set, they go with the first group
+    groups[0].extend([a for a in aclers if a.assess() and a.is_port_only()])
+    return groups
+
+
+def run_planned_pull(pull):
+    """
+    Run one planned pull, once for each group of the ACL set when the
+    set is split, and save each pull's actual volume and timing to the
+    results db for later plans. The chunk is checkpointed once, after
+    every group.
+    """
+
+    if pull.groups > 1:
+        groups = split_set_groups(pull.groups)
+        logger.info("Pulling %s for %d groups of the ACL set" % (pull.chunk.label, len(groups)))
+    else:
+        groups = [None]
+
+    for group in groups:
+        held = list()
+        if group is not None:
+            mine = set([id(a) for a in group])
+            held = [a for a in aclers if a.assess() and id(a) not in mine]
+        for a in held:
+            a.held = True
+        numacls = aclers_assess_count()
+        try:
+            run_chunk(pull.chunk, save=len(groups) == 1)
+        finally:
+            for a in held:
+                a.held = False
+
+        stats = progress.current
+        if resultsdbs and stats.finished is not None:
+            passes = 1
+            if options.engine == 'rwfilter':
+                passes = 2 * numacls
+            eval_seconds = max(0.0, stats.finished - stats.started - stats.pull_seconds)
+            resultsdbs[0].add_pull(options.silkclass, options.silktypes, options.engine,
+                                   pull.chunk.label, pull.repo_bytes, stats.pull_bytes,
+                                   stats.pull_records, stats.pull_seconds, eval_seconds, passes)
+
+        if aclers_assess_count() == 0:
+            break
+
+    if len(groups) > 1:
+        save_chunk(pull.chunk)
+
 
 def how_many_minutes(start_time):
     """
@@ -176,26 +668,509 @@ def get_silk_file_record_count(filename):
     myargs.append("%s" % filename)
 
     try:
-        # python 2.7+
-        rec_count = int(subprocess.check_output(myargs))
-        return rec_count
+        (returncode, output) = read_command(myargs, 'rwfileinfo')
+        return int(output)
     except:
-        # 2.6
+        logger.error("Can not determine record count for silk files")
+        sys.exit(1)
+
+
+def save_chunk(chunk):
+    """Checkpoint the counters and checks for the chunk to the results dbs"""
+
+    for (source, db) in enumerate(resultsdbs):
+        with tracer.span('results db checkpoint'):
+            changed = db.checkpoint(chunk, [a for a in aclers if a.source == source])
+        logger.debug("Saved counters for %d ACL's to the results db", changed)
+
+
+def hold_aclers(items, held):
+    """Leave the AclerItems out of (or put them back in) the pulls"""
+
+    for a in items:
+        a.held = held
+
+
+def check_working_files(pull_seconds):
+    """
+    Check the assessible ACL's against the pulled working file parts,
+    then remove them. Returns the number of records pulled.
+    """
+
+    total_recs = sum([get_silk_file_record_count(x) for x in rwfiles])
+    mybytes = sum([os.path.getsize(x) for x in rwfiles])
+    stats = progress.current
+    progress.pull_done(stats.pull_records + total_recs, stats.pull_seconds + pull_seconds,
+                       stats.pull_bytes + mybytes)
+    logger.info("Repo pull has %d records" % total_recs)
+    if total_recs >= 1:
+        process_aclers(total_recs)
+    unlink_working_files()
+
+    return total_recs
+
+
+def run_chunk(chunk, extra=None, save=True):
+    """
+    Build the set for the remaining ACL's, pull the repo chunk, and
+    check the ACL's against it. Port-only ACL's (--port-only) get their
+    own protocol and port pull of the chunk. Any extra rwfilter args
+    (list) are added to the pulls. Without save, the results dbs are
+    not checkpointed. Returns the (number of set blocks, records pulled).
+    """
+
+    # with --windows, only the ACL's with a window still open on the day
+    notneeded = list()
+    if answer_windows:
+        notneeded = [a for a in aclers if a.assess() and not a.needs_day(chunk.day)]
+        hold_aclers(notneeded, True)
+        if notneeded:
+            logger.info("%d ACL's have an answer for every window with %s in it" %
+                        (len(notneeded), chunk.label))
+    try:
+        with tracer.span("chunk %s" % chunk.label, 'chunk', kind=chunk.kind):
+            return run_chunk_aclers(chunk, extra, save)
+    finally:
+        hold_aclers(notneeded, False)
+
+
+def run_chunk_aclers(chunk, extra=None, save=True):
+    """run_chunk for the ACL's not held out of the chunk"""
+
+    progress.start_chunk(chunk.label, aclers_assess_count())
+
+    myextra = list(chunk.extra)
+    if extra:
+        myextra.extend(extra)
+
+    checked = [a for a in aclers if a.assess()]
+
+    # ACL's with a cached verdict for the chunk are left out of the pull,
+    # only whole chunks are cached
+    cached = list()
+    if verdicts is not None and not myextra:
+        mykey = chunk_key(options.silkclass, options.silktypes, chunk)
+        cached = verdicts.fill(mykey, checked)
+        logger.info("Verdict cache answered %d of %d ACL's for %s (%.1f%% hit rate so far)" %
+                    (len(cached), len(checked), chunk.label, verdicts.hit_rate()))
+    mine = set([id(a) for a in cached])
+    portonly = [a for a in checked if a.is_port_only() and id(a) not in mine]
+    addressed = [a for a in checked if not a.is_port_only() and id(a) not in mine]
+    numblocks = 0
+    total_recs = 0
+    uncounted = list()
+    capped = False
+
+    if addressed:
+        hold_aclers(portonly + cached, True)
         try:
-            p = subprocess.Popen(myargs, stdout=subprocess.PIPE)
-            output = p.communicate()[0]
-            return int(output)
-        except:
-            logger.error("Can not determine record count for silk files")
-            sys.exit(1)
+            numblocks = build_set()
+            if workcache is not None:
+                pull_seconds = build_cached_working_file(chunk, myextra)
+            else:
+                pull_seconds = build_parallel_working_files(chunk.start, chunk.end, myextra)
+            total_recs += check_working_files(pull_seconds)
+        finally:
+            hold_aclers(portonly + cached, False)
+
+    if portonly:
+        hold_aclers(addressed + cached, True)
+        try:
+            (pull_seconds, cap) = build_port_only_working_file(chunk, myextra, portonly)
+            recs = check_working_files(pull_seconds)
+        finally:
+            hold_aclers(addressed + cached, False)
+        total_recs += recs
+        if cap is not None and recs >= cap:
+            # a partial pull can show traffic, but not the lack of it,
+            # and its counters are partial
+            capped = True
+            uncounted = [a for a in portonly if not a.has_records(a.chunk_track)]
+        if uncounted:
+            logger.warning("Port-only pull hit the %d record cap, %s is not counted as checked "
+                           "for %d port-only ACL's" % (cap, chunk.label, len(uncounted)))
+
+    uncounted = set([id(a) for a in uncounted])
+    if verdicts is not None and not myextra:
+        if capped:
+            verdicts.store(mykey, addressed)
+        else:
+            verdicts.store(mykey, portonly + addressed)
+    for a in checked:
+        if id(a) not in uncounted:
+            a.add_check(chunk)
+
+    if jobstream is not None:
+        jobstream(chunk, [a for a in checked if a.has_records()])
+
+    if save:
+        save_chunk(chunk)
+
+    progress.end_chunk(aclers_assess_count())
+    unlink_working_files()
+
+    return (numblocks, total_recs)
+
+
+def run_sample_prepass(slices):
+    """
+    Pull short, spaced, record capped time slices from across the whole
+    window and retire any ACL that shows traffic in them before the
+    day by day pulls begin.
+    """
+
+    start_time = time.time()
+
+    logger.info("Sampling pre-pass: %d slices of %d minutes every %d hours (%s order), max %d records per slice" %
+                (len(slices), options.sampleminutes, options.sampleevery,
+                 options.sampleorder, options.samplemaxrecords))
+
+    acls_before = aclers_assess_count()
+    blocks_after = None
+
+    # the set the day pulls would have used without the pre-pass, sized
+    # up front since a slice may have no addressed ACL's to pull
+    blocks_before = build_set()
+    unlink_file(setfile)
+
+    for s in slices:
+        numentries = aclers_assess_count()
+        if numentries == 0:
+            logger.info("No remaining no-traffic ACL's, ending sampling pre-pass early")
+            break
+
+        logger.info("----- sample %s -----" % s.label)
+        extra = ["--max-pass-records=%d" % options.samplemaxrecords]
+        (numblocks, total_recs) = run_chunk(s, extra)
+        if total_recs >= options.samplemaxrecords:
+            logger.info("Sample pull hit the %d record cap" % options.samplemaxrecords)
+
+    acls_after = aclers_assess_count()
+
+    if acls_after > 0 and blocks_before:
+        blocks_after = build_set()
+        unlink_file(setfile)
+
+    howlong = get_elapsed_time_since(start_time)
+    logger.info("Sampling pre-pass took %s and retired %d of %d ACL's" %
+                (howlong, acls_before - acls_after, acls_before))
+
+    if blocks_before:
+        if blocks_after is None:
+            blocks_after = 0
+        shrink = 100.0 * (blocks_before - blocks_after) / blocks_before
+        logger.info("Day pulls now cover %d ACL's and %d set blocks instead of %d ACL's and %d set blocks (%.1f%% smaller set)" %
+                    (acls_after, blocks_after, acls_before, blocks_before, shrink))
+
+    mydays = "%s-%s-Samples" % (options.start.replace('/',''), options.end.replace('/',''))
+    write_checkpoint(mydays)
+
+
+def init_day_worker():
+    """Pool initializer for the --full-accounting day workers"""
+
+    global loglistener, resultsdbs, verdicts
+
+    loglistener = restart_queue_logging(logger)
+    # the parent's events so far are not this worker's
+    tracer.take()
+    # the parent saves the results
+    resultsdbs = list()
+    # sqlite connections don't survive a fork
+    if verdicts is not None:
+        verdicts = VerdictCache(options.verdictcache, options.verdictcacheentries)
+
+
+def account_day(day):
+    """
+    Full accounting pool worker: pull and check one day, using working
+    file names of its own. Returns the day, the aclers indexes checked,
+    the (index, track) of the ACL's with traffic, the chunk and verdict
+    cache stats, and the trace events.
+    """
+
+    global progress
+
+    try:
+        build_file_names("-%s" % day.strftime("%Y%m%d"))
+        # only this day's counters go back to the parent
+        for a in aclers:
+            a.track = dict()
+            a.pending = dict()
+            a.chunk_track = dict()
+        progress = ProgressTracker(aclers_assess_count(), 1, None, options.progressinterval)
+        if verdicts is not None:
+            (verdicts.hits, verdicts.misses, verdicts.stored, verdicts.evicted) = (0, 0, 0, 0)
+
+        chunk = day_chunk(day)
+        with tracer.span('day worker', day=chunk.label):
+            run_chunk(chunk)
+
+        checked = [i for (i, a) in enumerate(aclers) if a.chunks_checked and a.chunks_checked[-1] is chunk]
+        tracks = [(i, a.track) for (i, a) in enumerate(aclers) if a.has_records()]
+        stats = progress.current
+        verdictstats = None
+        if verdicts is not None:
+            verdictstats = (verdicts.hits, verdicts.misses, verdicts.stored, verdicts.evicted)
+        return (day, checked, tracks, (stats.started, stats.pull_records, stats.pull_seconds,
+                                       stats.pull_bytes, stats.scanned, verdictstats), tracer.take())
+    except SystemExit as e:
+        # a worker that exits never returns its task to the pool
+        raise RuntimeError("Checking %s stopped with exit code %s" % (day.strftime("%Y-%m-%d"), e.code))
+    finally:
+        if loglistener is not None:
+            loglistener.flush()
+
+
+def run_full_accounting(days):
+    """
+    With --full-accounting no ACL retires, so the days don't depend on
+    each other. They are pulled and checked by a pool of --day-jobs
+    worker processes, and each day's counters are merged into the ACL's,
+    in day order, as they come back.
+    """
+
+    days = sorted(days)
+    jobs = min(options.dayjobs, len(days))
+    logger.info("Full accounting of %d days using %d worker processes" % (len(days), jobs))
+    mystartday = options.start.replace('/','')
+
+    # the workers are forked, don't let one copy a half written log record
+    loglistener.flush()
+    pool = multiprocessing.Pool(jobs, init_day_worker)
+    try:
+        for (day, checked, tracks, stats, events) in pool.imap(account_day, days):
+            tracer.extend(events)
+            chunk = day_chunk(day)
+            numentries = aclers_assess_count()
+            (started, records, seconds, mybytes, scanned, verdictstats) = stats
+            if verdictstats is not None:
+                verdicts.hits += verdictstats[0]
+                verdicts.misses += verdictstats[1]
+                verdicts.stored += verdictstats[2]
+                verdicts.evicted += verdictstats[3]
+            progress.start_chunk(chunk.label, numentries)
+            progress.current.started = started
+            progress.pull_done(records, seconds, mybytes)
+            progress.scanned_records(scanned)
+
+            for (i, track) in tracks:
+                for typename in sorted(track):
+                    for (counttype, count) in track[typename].items():
+                        aclers[i].add_track(typename, counttype, count)
+            for i in checked:
+                aclers[i].add_check(chunk)
+
+            save_chunk(chunk)
+
+            progress.end_chunk(numentries)
+            logger.info("%s: %d of %d ACL's saw traffic" % (chunk.label, len(tracks), numentries))
+            write_checkpoint("%s-%s" % (mystartday, day.strftime("%Y%m%d")))
+    except RuntimeError as e:
+        pool.terminate()
+        logger.error(e)
+        sys.exit(1)
+    except (Exception, KeyboardInterrupt):
+        # don't wait in join for the days still queued
+        pool.terminate()
+        raise
+    finally:
+        pool.close()
+        pool.join()
+
+
+def partition_working_file():
+    """
+    Split the working file once into protocol and tcp/udp port
+    partitions and save the manifest. Returns the (ports, partitions)
+    from the manifest.
+    """
+
+    t1 = time.time()
+
+    protocols = [int(x) for x in aclers_assess_protocols().split(',') if x]
+
+    (cmds, partitions, intermediates) = build_partition_commands(rwfiles, partprefix, protocols, partition_ports)
+
+    for cmd in cmds:
+        logger.debug("Partition: %s", cmd)
+        returncode = run_command(cmd, 'partition')
+        if returncode:
+            logger.error("Partition rwfilter return code not zero: %s" % returncode)
+            sys.exit(returncode)
+
+    for i in intermediates:
+        unlink_file(i)
+
+    for p in partitions:
+        if os.path.exists(p.filename):
+            p.records = get_silk_file_record_count(p.filename)
+        else:
+            p.records = 0
+        logger.debug("Partition %s has %d records", p.name, p.records)
+
+    write_manifest(manifestfile, rwfiles, partition_ports, partitions)
+
+    howlong = get_elapsed_time_since(t1)
+    used = len([p for p in partitions if p.records])
+    logger.info("Split working file into %d non-empty partitions in %s" % (used, howlong))
+
+    return read_manifest(manifestfile)
+
+
+def get_acler_input_files(myacler, ports, partitions):
+    """
+    Return the list of working files the acl criteria need to read,
+    either the whole working file or just the matching partitions.
+    """
+
+    if partitions is None:
+        return list(rwfiles)
+    return partitions_for(myacler, ports, partitions)
 
 
-def increment_assessible_acls_check():
-    """Used to track days checked"""
+def process_aclers(total_recs):
+    """Evaluate the assessible ACL's against the working file using the selected engine"""
+
+    with tracer.span('evaluate', engine=options.engine, records=total_recs):
+        if options.engine == 'inprocess':
+            process_aclers_in_process(total_recs)
+        elif options.engine == 'pmap':
+            process_aclers_using_pmap(total_recs)
+        else:
+            process_aclers_using_rwfilter_and_rwuniq(total_recs)
+
+
+def process_aclers_in_process(total_recs):
+    """
+    For each assessible ACL, check the forward and reversed criteria
+    against the working file in-process, reading it in record chunks
+    sized to stay under the --max-memory budget.
+    """
+
+    start_time = time.time()
+    reset_peak_rss()
 
     assessible_aclers = [a for a in aclers if a.assess()]
-    for a in assessible_aclers:
-        a.num_checks += 1
+
+    max_memory = None
+    if options.maxmemory:
+        max_memory = options.maxmemory * 1024 * 1024
+    chunk_records = chunk_records_for_budget(max_memory)
+
+    caches = None
+    if options.columnarcache:
+        caches = get_columnar_caches()
+        logger.info("Processing %d assessible ACL entries in-process, from the columnar caches" %
+                    len(assessible_aclers))
+    else:
+        logger.info("Processing %d assessible ACL entries in-process, %d records per chunk" %
+                    (len(assessible_aclers), chunk_records))
+
+    (evaluator, readers) = evaluate_working_file(rwfiles, assessible_aclers, chunk_records,
+                                                 on_chunk=progress.scanned_records, caches=caches)
+
+    for reader in readers:
+        if not reader.native:
+            logger.info("Read working file with PySiLK: %s" % reader.unsupported)
+        if reader.skipped:
+            logger.info("Skipped %d ipv6 records that don't map to ipv4" % reader.skipped)
+
+    predicates = evaluator.predicates
+    if predicates is None:
+        pass
+    elif evaluator.reused:
+        logger.info("Reused the predicates compiled for the same ACL's")
+    else:
+        logger.info("Compiled %d criteria into %d lookups and %d inline tests in %.3fs" %
+                    (len(predicates.criteria), predicates.lookups, predicates.tests,
+                     predicates.compile_seconds))
+
+    howlong = get_elapsed_time_since(start_time)
+    logger.info("Compared %d ACL's both ways to %d flow records in %d chunks in %s" %
+                (len(assessible_aclers), evaluator.records, evaluator.chunks, howlong))
+
+    peak = peak_rss() / (1024 * 1024)
+    logger.info("Peak RSS %d MB" % peak)
+    if max_memory and peak > options.maxmemory:
+        logger.warning("Peak RSS %d MB was over the --max-memory budget of %d MB" %
+                       (peak, options.maxmemory))
+
+
+def get_columnar_caches():
+    """
+    Return the columnar cache file of each working file part, building
+    it once per pulled chunk. A cache is reused as long as it was built
+    for the same chunk from the same, unmodified working file.
+    """
+
+    key = progress.current.label
+    caches = list()
+    for x in rwfiles:
+        cachefile = "%s.col" % x
+        try:
+            ColumnarCache(cachefile, key=key, source=x).close()
+            logger.debug("Reusing columnar cache %s", cachefile)
+        except (IOError, OSError, ValueError):
+            t1 = time.time()
+            with tracer.span('build columnar cache', file=x):
+                count = build_columnar_cache(x, cachefile, key)
+            logger.info("Built the columnar cache of %d records in %s" %
+                        (count, get_elapsed_time_since(t1)))
+        caches.append(cachefile)
+    return caches
+
+
+def process_aclers_using_pmap(total_recs):
+    """
+    Label the address blocks (and tcp/udp ports) of the assessible ACL's
+    in prefix maps, count the working file records per label pair,
+    protocol and type with a single rwuniq, and add each row to the
+    ACL's it matches, forward and reversed.
+    """
+
+    start_time = time.time()
+
+    assessible_aclers = [a for a in aclers if a.assess()]
+
+    evaluator = PmapEvaluator(assessible_aclers)
+
+    logger.info("Processing %d assessible ACL entries via a prefix map of %d address ranges "
+                "and %d port ranges" %
+                (len(assessible_aclers), len(evaluator.addresses.intervals),
+                 sum([len(x.intervals) for x in evaluator.ports.values()])))
+
+    rwu = ['rwuniq']
+    for (mapname, text) in evaluator.pmaps():
+        (source, built) = pmapfiles[mapname]
+        with open(source, 'w') as f:
+            f.write(text)
+        unlink_file(built)
+
+        cmd = ['rwpmapbuild', "--input-file=%s" % source, "--output-file=%s" % built]
+        logger.debug("Prefix map: %s", ' '.join(cmd))
+        returncode = run_command(cmd, 'rwpmapbuild')
+        if returncode:
+            logger.error("rwpmapbuild error code %s for %s" % (returncode, ' '.join(cmd)))
+            sys.exit(returncode)
+        rwu.append("--pmap-file=%s:%s" % (mapname, built))
+
+    rwu.extend(["--fields=%s" % ','.join(evaluator.fields()), '--values=records,bytes,packets',
+                '--no-titles', '--no-columns', '--no-final-delimiter'])
+    rwu.extend(rwfiles)
+
+    logger.debug("rwuniq: %s", ' '.join(rwu))
+    (returncode, output) = read_command(rwu, 'rwuniq')
+    if returncode:
+        logger.error("rwuniq error code %s for %s" % (returncode, ' '.join(rwu)))
+        sys.exit(returncode)
+    progress.scanned_records(total_recs)
+
+    rows = evaluator.add_rows(output.split("\n"))
+
+    howlong = get_elapsed_time_since(start_time)
+    logger.info("Compared %d ACL's both ways to %d flow records (%d label rows) in %s" %
+                (len(assessible_aclers), total_recs, rows, howlong))
 
 
 def process_aclers_using_rwfilter_and_rwuniq(total_recs):
@@ -203,7 +1178,9 @@ def process_aclers_using_rwfilter_and_rwuniq(total_recs):
     For each assessible ACL, pull a temp rwf file from the repo pull file
     using the ACL criteria and if there are records in it, use rwuniq
     to get the bytes, packets, and records. Do this in both criteria 
-    directions, forward and reversed.
+    directions, forward and reversed. The working file is only read
+    once per ACL, to narrow it to the envelope of both directions, and
+    the two directions read the much smaller envelope file.
     """
 
     start_time = time.time()
@@ -216,31 +1193,72 @@ def process_aclers_using_rwfilter_and_rwuniq(total_recs):
     logger.info("Processing %d assessible ACL entries via rwfilter and rwuniq" % 
                 num_assessible_acls)
 
+    ports = None
+    partitions = None
+    if options.partition:
+        (ports, partitions) = partition_working_file()
+
     mycounter = 0
+    scanned_recs = 0
 
     for a in assessible_aclers:
 
         mycounter += 1
 
+        partfiles = get_acler_input_files(a, ports, partitions)
+        if not partfiles:
+            # no partition can hold traffic for this acl
+            logger.debug("No matching partitions: %s", a.acl, extra={'acl': a.line})
+            continue
+        if partitions is not None:
+            acl_recs = sum([p.records for p in partitions if p.filename in partfiles])
+            scanned_recs += acl_recs
+        else:
+            acl_recs = total_recs
+
+        # Envelope of both directions
+
+        unlink_file(envrwfile)
+
+        rwf = a.get_rwfilter_envelope_criteria()
+
+        # add the working file locations
+        rwf.append("--pass=%s" % envrwfile)
+        rwf.extend(partfiles)
+
+        cmd = ' '.join(rwf)
+        logger.debug("Envelope: %s", cmd, extra={'acl': a.line})
+        returncode = run_command(cmd, 'envelope rwfilter', acl=a.line)
+        if returncode:
+            logger.error("Envelope rwfilter error code %s for %s" % (returncode, cmd))
+            sys.exit(returncode)
+
+        env_recs = get_silk_file_record_count(envrwfile)
+        progress.scanned_records(acl_recs + env_recs * 2)
+        if env_recs == 0:
+            # no traffic either way
+            logger.debug("Empty envelope: %s", a.acl, extra={'acl': a.line})
+            continue
+
         # Forward criteria
 
         unlink_file(tmprwfile)
 
         rwf = a.get_rwfilter_criteria()
 
-        # add the working file locations
+        # add the envelope file location
         rwf.append("--pass=%s" % tmprwfile)
-        rwf.append("%s" % rwfile)
+        rwf.append(envrwfile)
 
-        logger.debug("Forward: %s" % a) 
+        logger.debug("Forward: %s", a.acl, extra={'acl': a.line})
 
         # use rwfilter criteria for this acl to read the working file
         # and create a temporary rwfilter file that rwuniq can read
         # No longer piping this straight to rwuniq so that rwuniq
         # does not get invoked with no-record cases.
         cmd = ' '.join(rwf)
-        logger.debug("Forward: %s" % cmd)
-        returncode = os.system(cmd)
+        logger.debug("Forward: %s", cmd, extra={'acl': a.line})
+        returncode = run_command(cmd, 'forward rwfilter', acl=a.line)
         if returncode:
             logger.error("Forward rwfilter error code %s for %s" % (returncode, cmd))
             sys.exit(returncode)
@@ -253,14 +1271,14 @@ def process_aclers_using_rwfilter_and_rwuniq(total_recs):
 
         rwf = a.get_rwfilter_reversed_criteria()
 
-        # add the working file locations
+        # add the envelope file location
         rwf.append("--pass=%s" % tmprwfile)
-        rwf.append("%s" % rwfile)
+        rwf.append(envrwfile)
 
-        logger.debug("Reversed: %s" % a) 
+        logger.debug("Reversed: %s", a.acl, extra={'acl': a.line})
         cmd = ' '.join(rwf)
-        logger.debug("Reversed: %s" % cmd)
-        returncode = os.system(cmd)
+        logger.debug("Reversed: %s", cmd, extra={'acl': a.line})
+        returncode = run_command(cmd, 'reversed rwfilter', acl=a.line)
         if returncode:
             logger.error("Reversed rwfilter error code %s for %s" % (returncode, cmd))
             sys.exit(returncode)
@@ -269,11 +1287,15 @@ def process_aclers_using_rwfilter_and_rwuniq(total_recs):
 
         if mycounter % 100 == 0:
             howlong = get_elapsed_time_since(start_time)
-            logger.info("Compared %d ACL's both ways to %d flow records in %s" % (mycounter, total_recs, howlong))
+            logger.info("Compared %d ACL's both ways to %d flow records in %s", mycounter, total_recs, howlong)
 
     howlong = get_elapsed_time_since(start_time)
     logger.info("Compared %d ACL's both ways to %d flow records in %s" % (mycounter, total_recs, howlong))
 
+    if partitions is not None and mycounter:
+        logger.info("Partitioning cut the per-ACL scan from %d to an average of %d records" %
+                    (total_recs, scanned_recs / mycounter))
+
 
 def get_rwuniq_info(forward, myacler):
     """Use rwuniq to determine the number of bytes, packets, records for each ACL"""
@@ -286,15 +1308,14 @@ def get_rwuniq_info(forward, myacler):
     total_recs = get_silk_file_record_count(tmprwfile)
 
     if total_recs != 0:
-        p = subprocess.Popen(rwu, stdout=subprocess.PIPE)
-        output = p.communicate()[0]
+        (returncode, output) = read_command(rwu, 'rwuniq', acl=myacler.line)
         mylines = output.split("\n")
 
         for i in mylines:
 
             # push raw rwuniq output to debug
             if i.strip() != '':
-                logger.debug(i)
+                logger.debug("rwuniq: %s", i, extra={'acl': myacler.line})
 
             if i.startswith('type') or i.strip() == '':
                 continue
@@ -313,17 +1334,26 @@ def get_rwuniq_info(forward, myacler):
                 myacler.add_track(mytype, 'RP', int(mypackets)) # Reverse Packets
 
 
-def write_csv_out_file(outfile):
+def write_csv_out_file(outfile, source=0):
     """
     Create a csv output file that contains that originial info but 
-    includes the results of the flow checks.
+    includes the results of the flow checks, for one of the in-files.
     """
 
     logger.info("Writing aggregate CSV out to: %s" % outfile)
 
+    with tracer.span('write csv', outfile=outfile):
+        write_csv_out_rows(outfile, source)
+
+
+def write_csv_out_rows(outfile, source):
+    """Write the rows of write_csv_out_file"""
+
+    myaclers = [x for x in aclers if x.source == source]
+
     # load list with input csv info
     csvin = list()
-    with open(options.infile, 'rb') as rf:
+    with open(infiles[source][0], 'rb') as rf:
         reader = csv.reader(rf)
         for row in reader:
             csvin.append(row)
@@ -335,29 +1365,60 @@ def write_csv_out_file(outfile):
         # iterate csvin and prefix the output with the flow results
         for i,v in enumerate(csvin):
             # get the AclerItem for this line
-            myline = v[0].strip()
-            a = [x for x in aclers if x.line == myline][0]
+            if options.autonumber:
+                myline = str(i + 1)
+                myrow = v
+            else:
+                myline = v[0].strip()
+                myrow = v[1:]
+            a = [x for x in myaclers if x.line == myline][0]
             # prefix is a list of the results data
             prefix = a.get_csv_out_prefix()
             # combine prefix with original minus the orig tracking
             # num row since it's on col one of prefix
             # this keeps tracking num at row one for any restarts
-            writer.writerow(prefix + v[1:])
+            # (auto-numbered rows keep all of their columns)
+            writer.writerow(prefix + myrow)
+
+
+def write_checkpoint(datepart):
+    """
+    Write the so-far results CSV and delete the previous one. With a
+    results db the counters are already saved per chunk, so the CSV is
+    only exported once at the end.
+    """
+
+    global last_datepart
+
+    last_datepart = datepart
+    if rolling is not None:
+        # the state file is the checkpoint, the CSV is written at the end
+        save_rolling_state()
+        return
+    if resultsdbs or jobstream is not None:
+        return
 
+    for source in range(len(infiles)):
+        outfile = get_outfile(datepart, source)
+        write_csv_out_file(outfile, source)
+        unlink_file(previous_outfiles.get(source))
+        previous_outfiles[source] = outfile
 
-def build_file_names():
-    """Create file names with date time component"""
 
-    global mytime, rwfile, setfile, tmprwfile
+def build_file_names(suffix=''):
+    """Create file names with date time component, and a suffix for worker processes"""
+
+    global mytime, rwfile, rwfiles, setfile, tmprwfile, envrwfile, pmapfiles, partprefix, manifestfile
 
     # get current datetime in clean format for file names
     # get the date and time with no seconds
     mytime = datetime.now().isoformat().split('.')[0]
     # remove the separators
-    mytime = mytime.replace(':','').replace('-','')
+    mytime = mytime.replace(':','').replace('-','') + suffix
 
     # working rwfilter pulled raw/rwf binary file
     rwfile = "%s/acler-%s.rwf" % (options.tmpfiledir, mytime)
+    rwfiles = [rwfile]
 
     # silk set file
     setfile = "%s/acler-%s.set" % (options.tmpfiledir, mytime)
@@ -365,6 +1426,19 @@ def build_file_names():
     # temp rwfilter pulled from working file
     tmprwfile = "%s/acler-%s-one-acl-check.rwf" % (options.tmpfiledir, mytime)
 
+    # temp rwfilter pulled from working file for both directions
+    envrwfile = "%s/acler-%s-one-acl-envelope.rwf" % (options.tmpfiledir, mytime)
+
+    # pmap engine prefix map sources and built maps
+    pmapfiles = dict()
+    for mapname in (ADDRESS_MAP, PORT_MAP):
+        pmapfiles[mapname] = ("%s/acler-%s-%s.pmap.txt" % (options.tmpfiledir, mytime, mapname),
+                              "%s/acler-%s-%s.pmap" % (options.tmpfiledir, mytime, mapname))
+
+    # partitioned working files and their manifest
+    partprefix = "%s/acler-%s-part" % (options.tmpfiledir, mytime)
+    manifestfile = "%s/acler-%s-partitions.json" % (options.tmpfiledir, mytime)
+
 
 def aclers_assess_count():
     """Return the count of assessible items in the aclers list"""
@@ -383,9 +1457,13 @@ def aclers_assess_protocols():
     return protocols
     
 
-def get_outfile(datepart):
+def get_outfile(datepart, source=0):
     # get the infile name without extension
-    myname = os.path.splitext(os.path.basename(options.infile))[0] 
+    myname = os.path.splitext(os.path.basename(infiles[source][0]))[0] 
+    # keep in-files with the same name in different dirs apart
+    othernames = [os.path.basename(x[0]) for (i, x) in enumerate(infiles) if i != source]
+    if os.path.basename(infiles[source][0]) in othernames:
+        myname = "%s-in%d" % (myname, source + 1)
     outfilename = "%s-%s-%s.csv" % (myname, datepart, mytime)
     outfile = "%s/%s" % (options.outfiledir, outfilename)
     return outfile
@@ -393,84 +1471,416 @@ def get_outfile(datepart):
 
 def main():
 
-    global options, args
+    global options, args, verdicts
 
     (options, args) = option_and_logging_setup()
 
+    if options.daemon:
+        run_daemon()
+        return
+
     build_file_names()
-    aclfile_to_aclers(options.infile)
+    with tracer.span('parse in-files'):
+        for (source, (infile, column)) in enumerate(infiles):
+            aclfile_to_aclers(infile, column, source)
+    if options.validateonly:
+        validate_inventory()
+        return
+
+    if options.verdictcache:
+        verdicts = VerdictCache(options.verdictcache, options.verdictcacheentries)
+    try:
+        if options.statefile:
+            with tracer.span('rolling run'):
+                run_rolling()
+        else:
+            with tracer.span('window', start=options.start, end=options.end):
+                check_window()
+    finally:
+        if verdicts is not None:
+            logger.info(verdicts.format_stats())
+            verdicts.close()
+
+
+def save_rolling_state():
+    """Fold the current ACL's results into the rolling state and save it"""
+
+    for a in aclers:
+        if a.line in rolling.acls:
+            rolling.update(a)
+    rolling.save()
+
+
+def run_rolling():
+    """
+    Rolling incremental run. Each ACL is only checked for the days since
+    it was last checked, within the --horizon-days window ending at the
+    end date, and ACL's that saw traffic within the horizon are skipped.
+    New and edited lines are checked across the whole horizon.
+    """
+
+    global aclers, rolling
+
+    try:
+        rolling = RollingState(options.statefile, options.silkclass, options.silktypes)
+    except ValueError as e:
+        logger.error(e)
+        sys.exit(1)
+
+    (added, edited, removed) = rolling.reconcile(aclers)
+    logger.info("State file %s: %d ACL's added, %d edited, %d removed since the last run" %
+                (options.statefile, added, edited, removed))
+
+    myend = datetime.strptime(options.end, "%Y/%m/%d")
+    horizon_start = myend - timedelta(days=options.horizondays - 1)
+
+    allaclers = aclers
+    check_from = dict()
+    active = 0
+    for a in allaclers:
+        if not a.assess():
+            continue
+        if rolling.is_active(a.line, horizon_start):
+            a.finished = True
+            active += 1
+        else:
+            check_from[a.line] = rolling.check_from(a.line, horizon_start)
+
+    logger.info("%d ACL's saw traffic since %s and are skipped, %d need checking" %
+                (active, horizon_start.strftime("%Y-%m-%d"), len(check_from)))
+
+    # check each run of days with the ACL's that need them, e.g. the
+    # horizon for new lines, then the new days for everything
+    starts = sorted(set([x for x in check_from.values() if x <= myend]))
+    for (i, mystart) in enumerate(starts):
+        if i + 1 < len(starts):
+            mysegend = starts[i + 1] - timedelta(days=1)
+        else:
+            mysegend = myend
+        aclers = [a for a in allaclers if a.line in check_from and check_from[a.line] <= mystart]
+        if aclers_assess_count() == 0:
+            continue
+        options.start = mystart.strftime("%Y/%m/%d")
+        options.end = mysegend.strftime("%Y/%m/%d")
+        logger.info("Rolling: checking %d ACL's for %s to %s" %
+                    (aclers_assess_count(), options.start, options.end))
+        check_window()
+        save_rolling_state()
+
+    aclers = allaclers
+    options.start = horizon_start.strftime("%Y/%m/%d")
+    options.end = myend.strftime("%Y/%m/%d")
+    save_rolling_state()
+
+    # results over the horizon, with the cumulative history
+    for a in aclers:
+        if a.line in rolling.acls:
+            a.checked_summary = rolling.summary(a.line)
+            if rolling.is_active(a.line, horizon_start):
+                a.track = copy.deepcopy(rolling.acls[a.line]['track'])
+            else:
+                a.track = dict()
+
+    mydayspart = "%s-%s-Rolling" % (options.start.replace('/',''), options.end.replace('/',''))
+    outfile = get_outfile(mydayspart)
+    write_csv_out_file(outfile)
 
-    previous_outfile = None
+
+def check_window():
+    """Check the ACL's in the aclers list against the whole window"""
+
+    global progress, resultsdbs
+
+    mynames = ', '.join([x[0] for x in infiles])
 
     # make sure there's something to work on
     numentries = aclers_assess_count()
     if numentries > 0:
-        logger.info("Found %d assessible ACL lines in %s" % (numentries, options.infile))
-        build_set()
-
-        # first, let's just run the thing for one hour to eliminate 
-        # any huge, constant talkers from the other pulls
-
-        logger.info("First just checking for huge, constant talkers by checking one hour")
-        start = "%s:00" % options.start
-        build_rwfilter_working_file(start, start)
-        total_recs = get_silk_file_record_count(rwfile)
-        logger.info("SiLK working file has %d records" % total_recs)
-        increment_assessible_acls_check()
-        if total_recs >= 1:
-            process_aclers_using_rwfilter_and_rwuniq(total_recs)
-        mydays = options.start.replace('/','')
-        mydayspart = "%s-%s-00HourOnly" % (mydays, mydays)
-        outfile = get_outfile(mydayspart)
-        write_csv_out_file(outfile)
-        previous_outfile = outfile
-        unlink_working_files()
-
-        # now run day by day
-        DATE_FORMAT = "%Y/%m/%d"
-        mystart = datetime.strptime(options.start, DATE_FORMAT)
-        myend = datetime.strptime(options.end, DATE_FORMAT)
-        delta = timedelta(days=1)
-        mystartday = mystart.strftime("%Y%m%d")
-        
-        while mystart <= myend:
-            logger.info("----- %s -----" % mystart.strftime("%Y-%m-%d"))
-            numentries = aclers_assess_count()
-            logger.info("Found %d remaining no-traffic ACL's" % numentries)
-            if numentries > 0:
-                build_set()
-                start = mystart.strftime("%Y/%m/%d")
-                build_rwfilter_working_file(start, start)
-                total_recs = get_silk_file_record_count(rwfile)
-                logger.info("Repo pull has %d records" % total_recs)
-                increment_assessible_acls_check()
-                if total_recs >= 1:
-                    process_aclers_using_rwfilter_and_rwuniq(total_recs)
-                myendday = mystart.strftime("%Y%m%d")
-                mydayspart = "%s-%s" % (mystartday, myendday)
-                outfile = get_outfile(mydayspart)
-                write_csv_out_file(outfile)
-                unlink_file(previous_outfile)
-                previous_outfile = outfile
-
-            # move to the next day
-            mystart += delta
-            
-            # clean up
-            unlink_working_files()
-        
+        logger.info("Found %d assessible ACL lines in %s" % (numentries, mynames))
+
+        plan = None
+        if options.maxworkingmb or options.planonly:
+            with tracer.span('plan'):
+                plan = build_plan()
+            if options.planonly:
+                for line in plan.format():
+                    print(line)
+                return
+            for line in plan.format():
+                logger.info(line)
+
+        if options.resultsdb:
+            # one run per in-file
+            for (source, (infile, column)) in enumerate(infiles):
+                db = ResultsDB(options.resultsdb)
+                run = db.start_run([a for a in aclers if a.source == source], infile, column,
+                                   options.silkclass, options.silktypes,
+                                   options.start, options.end, options.autonumber)
+                resultsdbs.append(db)
+                logger.info("Saving results for %s to %s as run %d" % (infile, options.resultsdb, run))
+
+        slices = list()
+        if options.sampleminutes:
+            slices = build_sample_slices(options.start, options.end,
+                                         options.sampleevery, options.sampleminutes,
+                                         options.sampleorder)
+
+        days = window_days(options.start, options.end)
+        strategy = get_strategy(options.strategy, get_repo_day_size)
+        days = strategy.order(days)
+
+        # samples, the first hour, and the days
+        numchunks = 1 + len(days)
+        if options.fullaccounting:
+            numchunks = len(days)
+        if plan is not None:
+            numchunks = plan.num_chunks()
+        progress = ProgressTracker(numentries, len(slices) + numchunks,
+                                   options.statusfile, options.progressinterval, logger)
+
+        if slices:
+            with tracer.span('sampling pre-pass', slices=len(slices)):
+                run_sample_prepass(slices)
+
+        if options.fullaccounting:
+            # no early retirement to feed, so no first hour, and the
+            # days don't depend on each other
+            run_full_accounting(days)
+        else:
+            # first, let's just run the thing for one hour to eliminate 
+            # any huge, constant talkers from the other pulls
+            # (skipped when the sampling pre-pass already retired everything)
+            firstday = window_days(options.start, options.start)[0]
+            firsthour = False
+            if aclers_assess_count() > 0:
+                logger.info("First just checking for huge, constant talkers by checking one hour")
+                if plan is not None:
+                    run_planned_pull(plan.first_hour)
+                else:
+                    run_chunk(hour_chunk(firstday, 0))
+                firsthour = True
+                mydays = options.start.replace('/','')
+                mydayspart = "%s-%s-00HourOnly" % (mydays, mydays)
+                write_checkpoint(mydayspart)
+
+            # now run day by day, in the order given by the search strategy
+            logger.info("Searching %d days using the %s strategy" % (len(days), strategy.name))
+            mystartday = options.start.replace('/','')
+            done = list()
+
+            for myday in days:
+                logger.info("----- %s -----" % myday.strftime("%Y-%m-%d"))
+                numentries = aclers_assess_count()
+                logger.info("Found %d remaining no-traffic ACL's" % numentries)
+                if numentries > 0:
+                    if plan is not None:
+                        dayplan = plan.for_day(myday)
+                        logger.info("Pulling %d parts using the %s strategy" %
+                                    (len(dayplan.pulls), dayplan.strategy))
+                        for pull in dayplan.pulls:
+                            if aclers_assess_count() > 0:
+                                run_planned_pull(pull)
+                    elif firsthour and myday == firstday:
+                        # the first hour was already checked, and the
+                        # ACL's it retired are done
+                        run_chunk(day_part_chunk(myday, 1, 23))
+                    else:
+                        run_chunk(day_chunk(myday))
+                    done.append(myday)
+                    if strategy.name == 'chronological':
+                        myendday = myday.strftime("%Y%m%d")
+                        mydayspart = "%s-%s" % (mystartday, myendday)
+                    else:
+                        mydayspart = "%s-%s-%dof%dD" % (mystartday, options.end.replace('/',''),
+                                                        len(done), len(days))
+                    write_checkpoint(mydayspart)
+
+        for (source, db) in enumerate(resultsdbs):
+            db.finish_run()
+            # a rolling run writes its CSV once, from the state, after
+            # the last segment
+            if last_datepart and rolling is None:
+                outfile = get_outfile(last_datepart, source)
+                if answer_windows or options.fullaccounting:
+                    # the window columns and day breakdowns come from
+                    # the per day counters in memory
+                    write_csv_out_file(outfile, source)
+                else:
+                    logger.info("Exporting results CSV from the results db to: %s" % outfile)
+                    db.export_csv(db.run, outfile)
+            db.close()
+        resultsdbs = list()
+
+        progress.finish()
+
     else:
-        logger.error("Found no assessible ACL lines in %s" % options.infile)
+        logger.error("Found no assessible ACL lines in %s" % mynames)
+
+
+def load_inventory(path, column):
+    """Daemon mode loader parsing an ACL CSV file to a list of AclerItems"""
+
+    global aclers
+
+    aclers = list()
+    aclfile_to_aclers(path, column)
+    return aclers
+
+
+def run_daemon_job(job, send):
+    """
+    Run one daemon job, streaming a result message for each line as
+    soon as it is known. Job values override the daemon's options.
+    """
+
+    global options, aclers, infiles, desired_types, jobstream, last_datepart
+
+    if job.get('command') == 'status':
+        status = {'type': 'status', 'inventories': len(inventories.inventories),
+                  'inventory_loads': inventories.loads, 'inventory_hits': inventories.hits,
+                  'cached_pulls': len(workcache.pulls), 'pull_hits': workcache.hits,
+                  'pull_misses': workcache.misses}
+        if verdicts is not None:
+            status.update({'verdict_hits': verdicts.hits, 'verdict_misses': verdicts.misses,
+                           'verdict_entries': verdicts.entries()})
+        send(status)
+        return
+
+    if job.get('command', 'check') != 'check':
+        send({'type': 'error', 'error': "Unknown command %s" % job.get('command')})
+        return
+
+    error = validate_job(job)
+    if error:
+        send({'type': 'error', 'error': error})
+        return
+
+    myoptions = copy.copy(daemon_options)
+    myoptions.infile = os.path.abspath(job['infile'])
+    myoptions.infilecolumn = int(job['column'])
+    for (key, attr) in (('start', 'start'), ('end', 'end'), ('class', 'silkclass'),
+                        ('types', 'silktypes'), ('engine', 'engine'), ('strategy', 'strategy')):
+        if job.get(key):
+            setattr(myoptions, attr, job[key])
+    if not myoptions.silkclass or not myoptions.silktypes:
+        send({'type': 'error', 'error': "Job class and types required, the daemon has no defaults"})
+        return
+
+    start_time = time.time()
+    options = myoptions
+    desired_types = [x.strip() for x in options.silktypes.split(',')]
+    infiles = [(options.infile, options.infilecolumn)]
+    last_datepart = None
+
+    try:
+        try:
+            inventory = inventories.get(options.infile, options.infilecolumn)
+        except (IOError, OSError, SystemExit):
+            send({'type': 'error', 'error': "Could not load ACL file %s" % options.infile})
+            return
+
+        lines = job.get('lines') or inventory.lines
+        lines = [str(x).strip() for x in lines]
+        unknown = [x for x in lines if x not in inventory.items]
+        if unknown:
+            send({'type': 'error', 'error': "Lines not in %s: %s" % (options.infile, ','.join(unknown))})
+            return
+
+        aclers = [copy.deepcopy(inventory.items[x]) for x in lines]
+
+        def stream(chunk, retired):
+            for a in retired:
+                send({'type': 'result', 'line': a.line, 'acl': a.acl, 'chunk': chunk.label,
+                      'result': a.get_csv_out_prefix()[1]})
+
+        jobstream = stream
+        build_file_names()
+        try:
+            with tracer.span('daemon job', infile=options.infile, lines=len(aclers)):
+                check_window()
+        except SystemExit:
+            send({'type': 'error', 'error': "Job failed, see the daemon log"})
+            return
+        except Exception as e:
+            logger.exception("Daemon job failed")
+            send({'type': 'error', 'error': "Job failed: %s" % e})
+            return
+        finally:
+            unlink_working_files()
+
+        for a in aclers:
+            if not a.has_records():
+                send({'type': 'result', 'line': a.line, 'acl': a.acl, 'chunk': None,
+                      'result': a.get_csv_out_prefix()[1]})
+        send({'type': 'done', 'lines': len(aclers), 'seconds': round(time.time() - start_time, 3)})
+
+    finally:
+        jobstream = None
+        options = daemon_options
+        aclers = list()
+
+
+def run_daemon():
+    """
+    Serve check jobs on the --daemon Unix socket until killed, keeping
+    the parsed ACL files and recent repo pulls between jobs.
+    """
+
+    global daemon_options, inventories, workcache, verdicts
+
+    if socket_in_use(options.daemon):
+        logger.error("An acler daemon is already listening on %s" % options.daemon)
+        sys.exit(1)
+    unlink_file(options.daemon)
+
+    daemon_options = options
+    inventories = InventoryCache(load_inventory)
+    workcache = WorkingFileCache(options.tmpfiledir, options.daemoncachefiles)
+    if options.verdictcache:
+        verdicts = VerdictCache(options.verdictcache, options.verdictcacheentries)
+
+    server = DaemonServer(options.daemon, run_daemon_job)
+    logger.info("Daemon listening on %s" % options.daemon)
+    # clean up the socket and cached pulls on kill too
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        logger.info("Daemon stopping")
+    finally:
+        server.server_close()
+        workcache.clear()
+        if verdicts is not None:
+            logger.info(verdicts.format_stats())
+            verdicts.close()
+        unlink_file(options.daemon)
 
 
 def unlink_working_files():
     unlink_file(setfile)
+    for x in rwfiles:
+        unlink_file(x)
+        unlink_file("%s.col" % x)
     unlink_file(rwfile)
+    unlink_file("%s.col" % rwfile)
     unlink_file(tmprwfile)
+    unlink_file(envrwfile)
+    for (source, built) in pmapfiles.values():
+        unlink_file(source)
+        unlink_file(built)
+    unlink_partition_files()
+
+
+def unlink_partition_files():
+    if manifestfile and os.path.exists(manifestfile):
+        (ports, partitions) = read_manifest(manifestfile)
+        for p in partitions:
+            unlink_file(p.filename)
+        unlink_file(manifestfile)
 
 
 def unlink_file(myfile):
-    if os.path.exists(myfile):
+    if myfile and os.path.exists(myfile):
         os.remove(myfile)
 
 
@@ -480,12 +1890,13 @@ def option_and_logging_setup():
     use -h for help / option descriptions 
     """
 
-    global desired_types, logger
+    global desired_types, logger, loglistener, tracer, partition_ports, infiles, answer_windows
 
     parser = optparse.OptionParser(usage)
 
-    parser.add_option("-i", "--in-file", dest="infile", help="""CSV file with non-extended Cisco ACL permit entries to check traffic against. First column must include integer line numbers for manual partial completion results reassembly in case the script gets killed and you have to rerun part of the days. Use csv_add_int.py if your CSV doesn't already have these. Use the -I option to specify the column with the ACL entries. Example /path/to/acler.py -i /home/username/my-acls.csv -I 3""")
-    parser.add_option("-I", "--in-file-column", dest="infilecolumn", help="""Use this option to provide the one-based column number that contains the ACL entry""")
+    parser.add_option("-i", "--in-file", action="append", dest="infiles", help="""CSV file with non-extended Cisco ACL permit entries to check traffic against. First column must include integer line numbers for manual partial completion results reassembly in case the script gets killed and you have to rerun part of the days. Use csv_add_int.py if your CSV doesn't already have these. Use the -I option to specify the column with the ACL entries. Repeat -i (and -I) to check several files in one run, sharing each day's repo pull, with a results CSV per file. Example /path/to/acler.py -i /home/username/my-acls.csv -I 3""")
+    parser.add_option("-I", "--in-file-column", action="append", dest="infilecolumns", help="""Use this option to provide the one-based column number that contains the ACL entry. Give it once for all in-files or once per in-file, in the same order.""")
+    parser.add_option("--auto-number", action="store_true", dest="autonumber", help="""Number the in-file rows (one-based) as they are read, the way csv_add_int.py does, for files without line numbers in the first column. The output CSV then keeps all of the original columns after the results.""")
     parser.add_option("-o", "--out-file-dir", dest="outfiledir", help="""Directory where the output file should go. Defaults to home dir if not provided via CLI or env ACLER_OUTFILE_DIR. Example --out-file-dir=/somewhere/acl-stuff""")
     parser.add_option("-L", "--log-file-dir", dest="logfiledir", help="""Directory where the rotating log files should go. Defaults to home dir if not provided via CLI or env ACLER_LOGFILE_DIR. Example -L /path/to/acler/logs""")
     parser.add_option("-T", "--tmp-file-dir", dest="tmpfiledir", help="""Directory where the temp files should go. Must be provided via CLI or env ACLER_TMPFILE_DIR. Example --tmp-file-dir=/fastlargedrive/home/username""")
@@ -493,7 +1904,39 @@ def option_and_logging_setup():
     parser.add_option("-e", "--end", dest="end", help="""Rwfilter end-date (no hour). Example --end=2015/07/30. Defaults to last 14 days.""")
     parser.add_option("-c", "--class", dest="silkclass", help="""Rwfilter class. Example --class=<classname>. Defaults to environment variable ACLER_SILK_CLASS if present.""")
     parser.add_option("-t", "--types", dest="silktypes", help="""Rwfilter types. Example --types=in,out,inweb,outweb. Defaults to environment variable ACLER_SILK_TYPES if present. Check your silk.conf file for available types (usually at /data/silk.conf).""")
+    parser.add_option("--sample-minutes", dest="sampleminutes", default=0, type="int", help="""Run a sampling pre-pass before the day by day pulls, pulling slices of this many minutes (1-60) from across the whole window. Any ACL with traffic in a sample is retired before the day pulls begin. Defaults to 0 (no pre-pass). Example --sample-minutes=5""")
+    parser.add_option("--sample-every", dest="sampleevery", default=3, type="int", help="""Hours between the start of each sample slice. Defaults to 3.""")
+    parser.add_option("--sample-max-records", dest="samplemaxrecords", default=10000, type="int", help="""Maximum number of records pulled for each sample slice. Defaults to 10000.""")
+    parser.add_option("--sample-order", dest="sampleorder", default="spread", help="""Order the sample slices are pulled in: spread (evenly across the window first), chronological, or newest. Defaults to spread.""")
+    parser.add_option("--strategy", dest="strategy", default="chronological", help="""Order the days of the window are searched in: chronological (oldest first), newest (most recent first), busiest (largest repo files first, sized via rwfglob), or bisect (middle first, then the middles of each half). Defaults to chronological.""")
+    parser.add_option("--partition", action="store_true", dest="partition", help="""Split each working file once into protocol partitions (and well-known port partitions for tcp/udp) so each ACL check only reads the partitions its protocol and ports can match.""")
+    parser.add_option("--partition-ports", dest="partitionports", help="""Comma separated list of tcp/udp ports that get their own partition. Defaults to a list of common well-known ports. Example --partition-ports=22,25,53,80,443""")
+    parser.add_option("--engine", dest="engine", default="rwfilter", help="""How the ACL criteria are checked against each working file: rwfilter (an rwfilter and rwuniq per ACL and direction), inprocess (read the working file in record chunks and check every ACL in-process) or pmap (label the ACL blocks and ports in SiLK prefix maps and count every ACL with a single rwuniq). Defaults to rwfilter.""")
+    parser.add_option("--columnar-cache", action="store_true", dest="columnarcache", help="""With the inprocess engine, convert each pulled working file once into a memory-mapped columnar cache in the temp dir (see acler/columnar.py), and find each ACL's rows by binary searching its address block in the cache's sorted sip/dip indexes instead of scanning every record. Building the cache sorts the addresses in memory, so --max-memory does not bound it.""")
+    parser.add_option("--max-memory", dest="maxmemory", type="int", help="""Memory budget in MB for the inprocess engine. The working file is read in record chunks sized to stay under it, so memory use does not grow with the size of the repo pull. Example --max-memory=2048""")
+    parser.add_option("--pull-jobs", dest="pulljobs", default=1, type="int", help="""Number of rwfilter processes to run at once for each repo pull. With more than 1 the pull is split by --pull-split into parts that are pulled in parallel and read as one working file. Record capped sample pulls are never split. Defaults to 1.""")
+    parser.add_option("--pull-split", dest="pullsplit", default="type", help="""How parallel repo pulls are split: type (one rwfilter per type in --types) or hour (one rwfilter per hour of a whole day chunk). Defaults to type.""")
+    parser.add_option("--max-working-mb", dest="maxworkingmb", type="int", help="""Budget in MB for each working file. Before any pull, the repo volume of each hour of the window is sized with rwfglob and estimated from the pull history in the --results-db (if any), and each day is pulled the cheapest way that stays under the budget: one anyset pull, runs of hours (hourly), or runs of hours pulled once per group of the ACL set (split-sets). Example --max-working-mb=2048""")
+    parser.add_option("--plan-only", action="store_true", dest="planonly", help="""Print the pull plan and its estimated cost for the window, and exit without pulling anything.""")
+    parser.add_option("--validate-only", action="store_true", dest="validateonly", help="""Parse the in-files and report the parse errors, assessible count, protocol mix, set size and the pull scope for the window, and exit without pulling anything. Needs no SiLK, except for rwfglob to estimate the pull time (with -c and -t), so inventories can be checked on any workstation. Needs no temp file dir.""")
+    parser.add_option("--port-only", action="store_true", dest="portonly", help="""Assess tcp/udp any to any ACL's with ports (e.g. permit tcp any any eq 8080), which can't be part of the address set pull. Each chunk gets one more rwfilter pull of their protocols and ports, capped by --port-only-max-records.""")
+    parser.add_option("--port-only-max-records", dest="portonlymaxrecords", default=1000000, type="int", help="""Maximum number of records in each port-only pull. When a pull hits it, the chunk is not counted as checked for the port-only ACL's that saw no traffic in it. Defaults to 1000000.""")
+    parser.add_option("--windows", dest="windows", help="""Comma separated list of windows in days, all ending at the end date, to answer from a single scan of the longest one, e.g. traffic in the last 7, 14, 30 and 90 days. The results get one column per window, shortest first, in place of the single results column. Counters are kept per day, and an ACL is searched until every window has an answer, only on the days of windows that don't have one yet. Sets the start date. Example --windows=7,14,30,90""")
+    parser.add_option("--full-accounting", action="store_true", dest="fullaccounting", help="""Complete per day totals for every ACL over the whole window. ACL's never retire, so there is no first hour pull and the days are pulled and checked independently by a pool of --day-jobs processes. The results get a per day breakdown column after the results column.""")
+    parser.add_option("--day-jobs", dest="dayjobs", default=multiprocessing.cpu_count(), type="int", help="""Number of days checked at once with --full-accounting. Defaults to the number of CPU's.""")
+    parser.add_option("--trace-file", dest="tracefile", help="""Write a timeline of the run to this Chrome trace format JSON file at exit, for chrome://tracing or ui.perfetto.dev: nested spans for each phase and chunk, in-process sections such as parsing, set building, evaluation and CSV writes, and every subprocess launch with its command, pid and exit code. Defaults to environment variable ACLER_TRACE_FILE if present. Example --trace-file=/path/to/acler-trace.json""")
+    parser.add_option("--status-file", dest="statusfile", help="""JSON file that is continuously rewritten with the run's progress: ACL's remaining, ACL's retired per chunk, records scanned per second, repo pull throughput, and an ETA for the whole window. Example --status-file=/path/to/acler-status.json""")
+    parser.add_option("--progress-interval", dest="progressinterval", default=60, type="int", help="""Seconds between progress log lines and status file updates. Defaults to 60.""")
+    parser.add_option("--results-db", dest="resultsdb", help="""SQLite database to save the results in. The parsed ACL's are stored once per run and the per chunk, per type counters are appended as each chunk finishes, so checkpoints only write the ACL's that changed. The results CSV is exported from it at the end of the run, and the per chunk history can be queried afterwards with acler/resultsdb.py. Defaults to environment variable ACLER_RESULTS_DB if present. Example --results-db=/path/to/acler-results.db""")
+    parser.add_option("--verdict-cache", dest="verdictcache", help="""SQLite verdict cache shared across runs. The per type counters each ACL gets for a chunk are saved by class, types, chunk and the ACL's normalized criteria, and ACL's with a cached verdict for a chunk get it from the cache and are left out of the pull, so overlapping inventories don't check the same rule against the same days again. Record capped and time limited pulls aren't cached. The hit rate is logged. Defaults to environment variable ACLER_VERDICT_CACHE if present. Example --verdict-cache=/path/to/acler-verdicts.db""")
+    parser.add_option("--verdict-cache-entries", dest="verdictcacheentries", default=1000000, type="int", help="""Most verdicts the verdict cache keeps, the least recently used are evicted past it. Defaults to 1000000.""")
+    parser.add_option("--state-file", dest="statefile", help="""JSON state file for rolling incremental runs, e.g. nightly from cron. It keeps each ACL line's criteria, days checked, last day seen with traffic, and cumulative counters, so each run only pulls the days since the last one, and only for ACL's that haven't seen traffic within --horizon-days. Added and edited lines are picked up automatically and checked across the horizon. The end date defaults to yesterday and the start date is not used. Defaults to environment variable ACLER_STATE_FILE if present. Example --state-file=/path/to/acler-state.json""")
+    parser.add_option("--horizon-days", dest="horizondays", default=14, type="int", help="""Days, ending at the end date, an ACL's last traffic stays current for in rolling runs. Older ACL's are checked again. Defaults to 14.""")
+    parser.add_option("--daemon", dest="daemon", help="""Run as a resident daemon listening for check jobs on this Unix socket, instead of checking an in-file. The daemon keeps parsed ACL files and recent repo pulls in memory between jobs, and the other options become the defaults for each job. Use aclerc.py to submit jobs. Defaults to environment variable ACLER_DAEMON_SOCKET if present. Example --daemon=/tmp/acler.sock""")
+    parser.add_option("--daemon-cache-files", dest="daemoncachefiles", default=8, type="int", help="""Number of recent repo pull working files the daemon keeps in the temp dir for later jobs. Defaults to 8.""")
     parser.add_option("-v", "--verbose", action="store_true", dest="verbose", help="""Bumps the CLI log level from info to debug. Log file is always debug.""")
+    parser.add_option("--debug-sample", dest="debugsample", default=1, type="int", help="""Only keep the per-ACL debug detail (rwfilter commands, raw rwuniq output) for every Nth ACL line, to keep big runs from churning through log rotation. Defaults to 1 (every ACL).""")
+    parser.add_option("--debug-trace", dest="debugtrace", help="""Send the debug detail to this compact JSON lines trace file instead of the rotating log file, which then only gets info and up. Example --debug-trace=/path/to/acler-trace.jsonl""")
 
     (options, args) = parser.parse_args()
 
@@ -527,7 +1970,11 @@ def option_and_logging_setup():
     # create file handler which logs even debug messages
     fh = logging.handlers.RotatingFileHandler(LOG_FILENAME, maxBytes=1000000, backupCount=10)
     # We'll leave the info logged to file at debug and alter the command line based upon cli options
-    fh.setLevel(logging.DEBUG)
+    # unless the debug detail goes to a trace file
+    if options.debugtrace:
+        fh.setLevel(logging.INFO)
+    else:
+        fh.setLevel(logging.DEBUG)
     # create console handler with a higher log level
     ch = logging.StreamHandler()
     if options.verbose:
@@ -540,9 +1987,19 @@ def option_and_logging_setup():
     #ch.setFormatter(chformatter)
     ch.setFormatter(fhformatter)
     fh.setFormatter(fhformatter)
-    # add the handlers to logger
-    logger.addHandler(ch)
-    logger.addHandler(fh)
+    handlers = [ch, fh]
+    if options.debugtrace:
+        th = logging.FileHandler(options.debugtrace)
+        th.setLevel(logging.DEBUG)
+        th.setFormatter(JsonLinesFormatter())
+        handlers.append(th)
+    if options.debugsample < 1:
+        print("Debug sample must be 1 or higher")
+        sys.exit(1)
+    logger.addFilter(DebugSampler(options.debugsample))
+    # the handlers write from a background thread so logging never
+    # blocks the evaluation loops on disk writes or log rotation
+    loglistener = start_queue_logging(logger, handlers)
 
     ##
     ##########
@@ -551,7 +2008,23 @@ def option_and_logging_setup():
     logger.debug("========================== START OF NEW SCRIPT RUN ==============================")
     logger.debug("=================================================================================")
 
-    logger.info("Check the log file at %s for debug-level logging info" % LOG_FILENAME)
+    if options.debugtrace:
+        logger.info("Check the trace file at %s for debug-level logging info" % options.debugtrace)
+    else:
+        logger.info("Check the log file at %s for debug-level logging info" % LOG_FILENAME)
+
+    # multi-window answers, the longest window sets the start date
+    if options.windows:
+        try:
+            options.windows = sorted(set([int(x) for x in options.windows.split(',') if x.strip()]))
+        except ValueError:
+            options.windows = list()
+        if not options.windows or options.windows[0] < 1:
+            logger.error("Windows must be a comma separated list of days, each 1 or higher")
+            sys.exit(1)
+        if options.start:
+            logger.error("The longest of the windows sets the start date, -s can't be used with windows")
+            sys.exit(1)
 
     # for dev, used old LBNL reference silk data files
     # that need back dated query criteria. This is the lazy way
@@ -561,6 +2034,10 @@ def option_and_logging_setup():
         options.start = '2004/12/15'
         options.end   = '2005/01/30'
 
+    # rolling state, needed for the end date default
+    if not options.statefile and os.environ.get('ACLER_STATE_FILE'):
+        options.statefile = os.environ['ACLER_STATE_FILE']
+
     if options.start:
         if not re.match('\d{4}/\d{2}/\d{2}', options.start):
             logger.error('-s parameter :%s: does not match required format: YYYY/MM/DD' % options.start)
@@ -574,10 +2051,19 @@ def option_and_logging_setup():
         if not re.match('\d{4}/\d{2}/\d{2}', options.end):
             logger.error('-e parameter does not match required format: YYYY/MM/DD')
             sys.exit(1)
+    elif options.statefile:
+        # Use yesterday, the last complete day
+        yesterday = date.today() - timedelta(days=1)
+        options.end = yesterday.isoformat().replace('-','/')
     else:
         # Use today
         options.end = date.today().isoformat().replace('-','/')
 
+    if options.windows:
+        myend = datetime.strptime(options.end, "%Y/%m/%d")
+        answer_windows = [(x, myend - timedelta(days=x - 1)) for x in options.windows]
+        options.start = answer_windows[-1][1].strftime("%Y/%m/%d")
+
     # OUTFILE DIR
     if options.outfiledir:
         # if provided on the command line, use it
@@ -589,42 +2075,79 @@ def option_and_logging_setup():
         # or just use their home directory
         options.outfiledir = expanduser('~')
 
-    # make sure the outfilepath exists
-    if not os.path.exists(options.outfiledir):
+    # make sure the outfilepath exists (validation writes nothing)
+    if not options.validateonly and not os.path.exists(options.outfiledir):
         try:
             os.mkdir(options.outfiledir)
         except:
             logger.error("Could not create output file dir: %s" % options.outfiledir)
             sys.exit(1)
 
+    # ROLLING STATE
+    if options.horizondays < 1:
+        logger.error("Horizon days must be 1 or higher")
+        sys.exit(1)
+
+    # DAEMON
+    if not options.daemon and os.environ.get('ACLER_DAEMON_SOCKET'):
+        options.daemon = os.environ['ACLER_DAEMON_SOCKET']
+    if options.daemoncachefiles < 0:
+        logger.error("Daemon cache files must be 0 or higher")
+        sys.exit(1)
+
     # IN FILE
-    if not options.infile:
+    if options.daemon:
+        # each job provides its own
+        options.infiles = list()
+    elif not options.infiles:
         if os.environ.get('ACLER_DEV'):
-            options.infile = 'example-acls.csv'
+            options.infiles = ['example-acls.csv']
         else:
             logger.error("-i / --in-file required.")
             sys.exit(1)
-    if not os.path.exists(options.infile) and not os.path.isfile(options.infile):
-        logger.error("in-file %s does not exist or is not a regular file" % options.infile)
-        sys.exit(1)
+    for i in options.infiles:
+        if not os.path.exists(i) and not os.path.isfile(i):
+            logger.error("in-file %s does not exist or is not a regular file" % i)
+            sys.exit(1)
 
     # IN FILE COLUMN
-    if options.infilecolumn:
+    if options.infilecolumns:
         try:
             # make sure an integer was provided
-            options.infilecolumn = int(options.infilecolumn)
+            options.infilecolumns = [int(x) for x in options.infilecolumns]
         except:
             logger.error("In file column must be an integer")
             sys.exit(1)
 
         # make sure it's a positive integer
-        if not (1 <= options.infilecolumn):
-            logger.error("In file column must be 1 or higher")
-            sys.exit(1)
-    else:
+        for i in options.infilecolumns:
+            if not (1 <= i):
+                logger.error("In file column must be 1 or higher")
+                sys.exit(1)
+    elif not options.daemon:
         logger.error("In file column required. See option -I")
         sys.exit(1)
 
+    if options.infiles:
+        if len(options.infilecolumns) == 1:
+            options.infilecolumns = options.infilecolumns * len(options.infiles)
+        elif len(options.infilecolumns) != len(options.infiles):
+            logger.error("Give -I once for all in-files or once per in-file")
+            sys.exit(1)
+        if options.statefile and len(options.infiles) > 1:
+            logger.error("Rolling state files only support one in-file")
+            sys.exit(1)
+        if len(set([os.path.abspath(x) for x in options.infiles])) != len(options.infiles):
+            logger.error("The same in-file was given more than once")
+            sys.exit(1)
+
+    infiles = list(zip(options.infiles, options.infilecolumns or list()))
+    # the first in-file, for the code paths that only take one
+    options.infile = None
+    options.infilecolumn = None
+    if infiles:
+        (options.infile, options.infilecolumn) = infiles[0]
+
     # TMPFILE DIR
     if options.tmpfiledir:
         # if provided on the command line, use it
@@ -632,12 +2155,12 @@ def option_and_logging_setup():
     elif os.environ.get('ACLER_TMPFILE_DIR'):
         # or if included via .bashrc use it
         options.tmpfiledir = os.environ['ACLER_TMPFILE_DIR']
-    else:
+    elif not options.validateonly:
         logger.error("Temp file dir required. See option -T")
         sys.exit(1)
 
-    # make sure the tmpfilepath exists
-    if not os.path.exists(options.tmpfiledir):
+    # make sure the tmpfilepath exists (validation pulls nothing)
+    if not options.validateonly and not os.path.exists(options.tmpfiledir):
         try:
             os.mkdir(options.tmpfiledir)
         except:
@@ -648,6 +2171,10 @@ def option_and_logging_setup():
     if not options.silkclass:
         if os.environ.get('ACLER_SILK_CLASS'):
             options.silkclass = os.environ['ACLER_SILK_CLASS']
+        elif options.daemon or options.validateonly:
+            # each job must provide it, validation only needs it for
+            # the pull estimate
+            options.silkclass = ''
         else:
             logger.error("Options -c required")
             sys.exit(1)
@@ -661,6 +2188,10 @@ def option_and_logging_setup():
     if not options.silktypes:
         if os.environ.get('ACLER_SILK_TYPES'):
             options.silktypes = os.environ['ACLER_SILK_TYPES']
+        elif options.daemon or options.validateonly:
+            # each job must provide them, validation only needs them
+            # for the pull estimate
+            options.silktypes = ''
         else:
             logger.error("Options -t required")
             sys.exit(1)
@@ -671,6 +2202,115 @@ def option_and_logging_setup():
             logger.error("Invalid character '%s' found in SiLK types, must be A-Za-z0-9-" % i)
             sys.exit(1)
 
+    # partition ports
+    if options.partitionports:
+        try:
+            partition_ports = [int(x) for x in options.partitionports.split(',') if x.strip()]
+        except:
+            logger.error("Partition ports must be a comma separated list of integers")
+            sys.exit(1)
+        for i in partition_ports:
+            if not 0 <= i <= 65535:
+                logger.error("Partition port %d must be 0-65535" % i)
+                sys.exit(1)
+    else:
+        partition_ports = list(well_known_ports)
+
+    # results db
+    if not options.resultsdb and os.environ.get('ACLER_RESULTS_DB'):
+        options.resultsdb = os.environ['ACLER_RESULTS_DB']
+
+    # verdict cache
+    if not options.verdictcache and os.environ.get('ACLER_VERDICT_CACHE'):
+        options.verdictcache = os.environ['ACLER_VERDICT_CACHE']
+    if options.verdictcacheentries < 1:
+        logger.error("Verdict cache entries must be 1 or higher")
+        sys.exit(1)
+
+    # timeline tracing, written at exit so failed runs keep theirs
+    if not options.tracefile and os.environ.get('ACLER_TRACE_FILE'):
+        options.tracefile = os.environ['ACLER_TRACE_FILE']
+    if options.tracefile:
+        tracer = Tracer(options.tracefile)
+        atexit.register(tracer.write)
+
+    # progress reporting
+    if options.progressinterval < 1:
+        logger.error("Progress interval must be 1 second or higher")
+        sys.exit(1)
+
+    # evaluation engine
+    if options.engine not in ENGINES:
+        logger.error("Engine must be rwfilter, inprocess or pmap")
+        sys.exit(1)
+    if options.columnarcache and options.engine != 'inprocess':
+        logger.error("The columnar cache needs the inprocess engine")
+        sys.exit(1)
+    if options.maxmemory is not None and options.maxmemory < 1:
+        logger.error("Max memory must be 1 MB or higher")
+        sys.exit(1)
+
+    # port-only pulls
+    if options.portonlymaxrecords < 1:
+        logger.error("Port-only max records must be 1 or higher")
+        sys.exit(1)
+
+    # pull planning
+    if options.maxworkingmb is not None and options.maxworkingmb < 1:
+        logger.error("Max working file size must be 1 MB or higher")
+        sys.exit(1)
+    if options.planonly and (options.statefile or options.daemon):
+        logger.error("Plan only can't be used with a state file or the daemon")
+        sys.exit(1)
+
+    # in-file validation
+    if options.validateonly and options.daemon:
+        logger.error("Validate only can't be used with the daemon")
+        sys.exit(1)
+
+    # multi-window answers
+    if options.windows and (options.statefile or options.daemon):
+        logger.error("Windows can't be used with a state file or the daemon")
+        sys.exit(1)
+
+    # full accounting
+    if options.dayjobs < 1:
+        logger.error("Day jobs must be 1 or higher")
+        sys.exit(1)
+    if options.fullaccounting and (options.statefile or options.daemon or options.windows or
+                                   options.sampleminutes or options.maxworkingmb or options.planonly):
+        logger.error("Full accounting can't be used with a state file, the daemon, windows, "
+                     "sampling or pull planning")
+        sys.exit(1)
+
+    # parallel repo pulls
+    if options.pulljobs < 1:
+        logger.error("Pull jobs must be 1 or higher")
+        sys.exit(1)
+    if options.pullsplit not in ('type', 'hour'):
+        logger.error("Pull split must be type or hour")
+        sys.exit(1)
+
+    # search strategy
+    if options.strategy not in STRATEGIES:
+        logger.error("Strategy must be one of: %s" % ', '.join(STRATEGIES))
+        sys.exit(1)
+
+    # sampling pre-pass
+    if options.sampleminutes:
+        if not 1 <= options.sampleminutes <= 60:
+            logger.error("Sample minutes must be 1-60")
+            sys.exit(1)
+        if options.sampleevery < 1:
+            logger.error("Sample every hours must be 1 or higher")
+            sys.exit(1)
+        if options.samplemaxrecords < 1:
+            logger.error("Sample max records must be 1 or higher")
+            sys.exit(1)
+        if options.sampleorder not in SAMPLE_ORDERS:
+            logger.error("Sample order must be one of: %s" % ', '.join(SAMPLE_ORDERS))
+            sys.exit(1)
+
     # convert text based info to list
     if ',' in options.silktypes:
         desired_types = [x.strip() for x in options.silktypes.split(',')]
@@ -1,5 +1,10 @@
 #!/usr/bin/python
 
+from datetime import timedelta
+from chunks import DAY, HOUR, SAMPLE, compress_days
+from addresses import cidr_to_range
+from protocols import port_range
+
 class AclerItem(object):
     """
     Class to hold acler data elements
@@ -22,14 +27,34 @@ class AclerItem(object):
         # logic tags
         self.parsed = False
         self.line = None
+        self.source = 0 # index of the in-file this came from
         self.error = None
         self.track = dict() # track counts
+        self.pending = dict() # track counts not yet saved to a results db
         self.assessible = False
-        # repo days checked for this traffic
-        # 1 = one hour
-        # 2- equal number of days + 1
-        self.num_checks = 0
+        # repo chunks (days, first hour, samples) checked for this
+        # traffic, in the order they were checked
+        self.chunks_checked = list()
         self.finished = False
+        # left out of the current pull, when the set is split in groups
+        # or the pull is for the other (address or port-only) path
+        self.held = False
+        # assess any to any entries with ports through the port pull
+        self.port_only = False
+        # memoized get_match_criteria results, by reverse
+        self.match_criteria = dict()
+        # replaces the get_days_checked summary, e.g. from a state file
+        self.checked_summary = None
+        # never retires, checked against every day (--full-accounting)
+        self.full_accounting = False
+        # --windows (days, first day) pairs, ending at the end date, and
+        # the per day counters that answer them
+        self.windows = None
+        self.day_track = dict()
+        # memoized window_answer results, until the next add_check
+        self.window_answers = dict()
+        # counts added since the last add_check
+        self.chunk_track = dict()
 
         if acl is None or acl == '':
             raise ValueError("One Cisco-formatted ACL line required")
@@ -39,10 +64,16 @@ class AclerItem(object):
     def assess(self):
         """Do we need to check the repo for this ACL criteria"""
 
-        if self.has_records():
+        if self.full_accounting:
+            pass
+        elif self.windows is not None:
+            # searched until every window has an answer
+            if None not in [self.window_answer(w) for w in self.windows]:
+                self.finished = True
+        elif self.has_records():
             self.finished = True
 
-        if self.finished:
+        if self.finished or self.held:
             return False
 
         if self.assessible:
@@ -53,11 +84,24 @@ class AclerItem(object):
             if self.sip is not None or self.dip is not None:
                 self.assessible = True
                 return True
+            elif self.port_only and self.is_port_only():
+                self.assessible = True
+                return True
             else:
                 self.error = 'Not assessed due to no sip or dip block'
                 return False
 
 
+    def is_port_only(self):
+        """True for tcp/udp any to any entries with a source or dest port"""
+
+        if self.sip is not None or self.dip is not None:
+            return False
+        if self.protocol not in (6, 17):
+            return False
+        return self.sport is not None or self.dport is not None
+
+
     def add_track(self, typename, counttype, count):
         """Push type-specific counts to a dict of dicts"""
 
@@ -68,17 +112,38 @@ class AclerItem(object):
             
         self.track[typename][counttype] += count
 
+        if typename not in self.pending:
+            self.pending[typename] = { 'FR': 0, 'FB': 0, 'FP': 0, 'RR': 0, 'RB': 0, 'RP': 0 }
+
+        self.pending[typename][counttype] += count
+
+        if typename not in self.chunk_track:
+            self.chunk_track[typename] = { 'FR': 0, 'FB': 0, 'FP': 0, 'RR': 0, 'RB': 0, 'RP': 0 }
+
+        self.chunk_track[typename][counttype] += count
+
+
+    def pop_pending(self):
+        """Return the counts added since the last call and start over"""
+
+        pending = self.pending
+        self.pending = dict()
+        return pending
+
 
     def __repr__(self):
 
         return "<AclerItem: line %s, acl %s, %s>" % (self.line, self.acl, self.format_track())
 
 
-    def has_records(self):
-        """Return True if this item has any silk record data"""
+    def has_records(self, track=None):
+        """Return True if this item (or the given track dict) has any silk record data"""
+
+        if track is None:
+            track = self.track
 
-        for k in self.track:
-            mydict = self.track[k]
+        for k in track:
+            mydict = track[k]
             for key in mydict:
                 if key in ('FR','RR'):
                     if mydict[key] != 0:
@@ -86,13 +151,16 @@ class AclerItem(object):
         return False
 
 
-    def get_types_with_records(self):
+    def get_types_with_records(self, track=None):
         """Returns string of names of silk types that had records"""
 
+        if track is None:
+            track = self.track
+
         s = set()
 
-        for silktype in self.track:
-            mydict = self.track[silktype]
+        for silktype in track:
+            mydict = track[silktype]
             for key in mydict:
                 val = mydict[key]
                 if key in ('FR','RR'):
@@ -102,12 +170,15 @@ class AclerItem(object):
         return ' '.join(sorted(s))
 
 
-    def format_track(self):
-        """Convert the track dict to a readable string"""
+    def format_track(self, track=None):
+        """Convert the track dict (or the given one) to a readable string"""
+
+        if track is None:
+            track = self.track
 
         s = ''
 
-        for silktype in sorted(self.track):
+        for silktype in sorted(track):
 
             # grab these for bytes/packet math
             forward_packets = 0
@@ -116,7 +187,7 @@ class AclerItem(object):
             reverse_bytes = 0
 
             s += " %s[" % silktype
-            mydict = self.track[silktype]
+            mydict = track[silktype]
             for key in sorted(mydict):
                 val = mydict[key]
 
@@ -150,40 +221,168 @@ class AclerItem(object):
             self.protocol, self.sip, self.sport, self.dip, self.dport, \
             self.format_track())
 
+    def add_check(self, chunk):
+        """
+        Record that this item was checked against the repo chunk, and
+        file the counts added since the last check under its day.
+        """
+
+        self.chunks_checked.append(chunk)
+        self.window_answers = dict()
+
+        if self.chunk_track:
+            mytrack = self.day_track.setdefault(chunk.day, dict())
+            for typename in self.chunk_track:
+                counts = mytrack.setdefault(typename, { 'FR': 0, 'FB': 0, 'FP': 0, 'RR': 0, 'RB': 0, 'RP': 0 })
+                for key in counts:
+                    counts[key] += self.chunk_track[typename][key]
+            self.chunk_track = dict()
+
+    def get_window_track(self, window):
+        """Sum the per day counters of the days in the (days, first day) window"""
+
+        track = dict()
+        for day in self.day_track:
+            if day < window[1]:
+                continue
+            for typename in self.day_track[day]:
+                counts = track.setdefault(typename, { 'FR': 0, 'FB': 0, 'FP': 0, 'RR': 0, 'RB': 0, 'RP': 0 })
+                for key in counts:
+                    counts[key] += self.day_track[day][typename][key]
+        return track
+
+    def get_window_days_checked(self, window):
+        """Return the list of days in the window this item was checked for"""
+
+        days = list()
+        for c in self.chunks_checked:
+            if c.kind == DAY and c.day >= window[1] and c.day not in days:
+                days.append(c.day)
+        return days
+
+    def window_answer(self, window):
+        """
+        True if the window saw traffic, False if all of its days were
+        checked without any, or None if it has no answer yet.
+        """
+
+        if window in self.window_answers:
+            return self.window_answers[window]
+
+        answer = None
+        for day in self.day_track:
+            if day >= window[1] and self.has_records(self.day_track[day]):
+                answer = True
+                break
+        if answer is None and len(self.get_window_days_checked(window)) >= window[0]:
+            answer = False
+        self.window_answers[window] = answer
+        return answer
+
+    def needs_day(self, day):
+        """Is the day in a window that has no answer yet"""
+
+        for window in self.windows:
+            if day >= window[1] and self.window_answer(window) is None:
+                return True
+        return False
+
+    def get_window_column(self, window):
+        """Results for one window, e.g. Traffic 3D|types|track, where 3D is the days checked"""
+
+        if not self.assessible:
+            return "Not Assessed||Error %s" % self.error
+
+        checks = "%dD" % len(self.get_window_days_checked(window))
+        answer = self.window_answer(window)
+        if answer:
+            track = self.get_window_track(window)
+            return "Traffic %s|%s|%s" % (checks, self.get_types_with_records(track),
+                                         self.format_track(track))
+        elif answer is None:
+            return "Pending %s||" % checks
+        else:
+            return "No Traffic %s||" % checks
+
     def get_days_checked(self):
-        if self.num_checks == 0:
-            return ''
-        elif self.num_checks == 1:
-            return '1H'
+        """
+        Summarize the chunks checked, e.g. 1H for the first hour only,
+        3S for three samples, or 5D for five days. If the days were not
+        searched oldest to newest without gaps, the days actually
+        covered are included, e.g. 3D[20150728,20150730-20150731]
+        """
+
+        if self.checked_summary is not None:
+            return self.checked_summary
+
+        # a day or hour pulled in parts is still checked once
+        days = list()
+        labels = set()
+        for c in self.chunks_checked:
+            if c.kind == DAY and c.day not in days:
+                days.append(c.day)
+            elif c.kind != DAY:
+                labels.add((c.kind, c.label))
+        hours = [x for x in labels if x[0] == HOUR]
+        samples = [x for x in labels if x[0] == SAMPLE]
+
+        if days:
+            ret = "%dD" % len(days)
+            for i in range(1, len(days)):
+                if days[i] - days[i - 1] != timedelta(days=1):
+                    ret += "[%s]" % compress_days(days)
+                    break
+            return ret
+        elif hours:
+            return "%dH" % len(hours)
+        elif samples:
+            return "%dS" % len(samples)
         else:
-            return "%dD" % (self.num_checks - 1)
+            return ''
 
     def get_csv_out_prefix(self):
         """Dump record info as a list to add to/prefix the CSV infile data"""
 
         ret = list()
+
+        if self.windows is not None:
+            # one column per window, shortest first
+            ret.append(self.line)
+            ret.extend([self.get_window_column(w) for w in self.windows])
+            return ret
+
         checks = self.get_days_checked()
 
         if self.has_records():                                                                                                                    
             # traffic
             ret.append(self.line)
             ret.append("Traffic %s|%s|%s" % (checks, self.get_types_with_records(), self.format_track()))
-            return ret
         elif self.assessible and not self.has_records():
             # no traffic
             ret.append(self.line)
             ret.append("No Traffic %s||" % checks)
-            return ret
         elif not self.assessible:
             # not assessed
             ret.append(self.line)
             ret.append("Not Assessed||Error %s" % self.error)
-            return ret
         else:
             # unknown problem
             ret.append(self.line)
             ret.append("Unknown acler results||" % self.line)
-            return ret
+
+        if self.full_accounting:
+            ret.append(self.get_day_breakdown())
+
+        return ret
+
+    def get_day_breakdown(self):
+        """Per day counters of the days with traffic, e.g. 20150701 in[FR=3 ...]; 20150703 ..."""
+
+        days = list()
+        for day in sorted(self.day_track):
+            if self.has_records(self.day_track[day]):
+                days.append("%s%s" % (day.strftime("%Y%m%d"), self.format_track(self.day_track[day])))
+        return '; '.join(days)
 
     def get_rwfilter_criteria(self):
         """
@@ -239,6 +438,65 @@ class AclerItem(object):
         return items
 
 
+    def get_rwfilter_envelope_criteria(self):
+        """
+        Convert the contained variable values into an rwfilter query
+        string that passes every record the forward or the reversed
+        criteria pass (and possibly a few more), for narrowing the
+        working file before running them.
+        """
+
+        items = list()
+        items.append('rwfilter')
+
+        if self.protocol is not None:
+            items.append("--protocol=%s" % self.protocol)
+
+        block = self.smallest_ip_block()
+        if block is not None:
+            items.append("--any-address=%s" % block)
+
+        ports = set([str(x) for x in (self.sport, self.dport) if x is not None])
+        if ports:
+            items.append("--aport=%s" % ','.join(sorted(ports)))
+
+        return items
+
+
+    def get_match_criteria(self, reverse=False):
+        """
+        Convert the contained variable values into integer ranges for
+        in-process evaluation: (protocol, sip range, sport range, dip
+        range, dport range). Each range is a (low, high) tuple, or None
+        for any. Reversed flips the criteria like
+        get_rwfilter_reversed_criteria does.
+        """
+
+        if reverse in self.match_criteria:
+            return self.match_criteria[reverse]
+
+        sip = dip = sport = dport = None
+
+        if self.sip is not None:
+            sip = cidr_to_range(self.sip)
+
+        if self.sport is not None:
+            sport = port_range(self.sport)
+
+        if self.dip is not None:
+            dip = cidr_to_range(self.dip)
+
+        if self.dport is not None:
+            dport = port_range(self.dport)
+
+        if reverse:
+            criteria = (self.protocol, dip, dport, sip, sport)
+        else:
+            criteria = (self.protocol, sip, sport, dip, dport)
+        self.match_criteria[reverse] = criteria
+        return criteria
+
+
     def smallest_ip_block(self):
         """
         Return the sip or dip, whichever is the smallest network address block. For use in building netflow set
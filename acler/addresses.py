@@ -0,0 +1,52 @@
+#!/usr/bin/python
+
+# Small ipv4 address helpers so acler can do address math without
+# needing SiLK (or any site-packages modules) loaded.
+
+
+def ip_to_int(ip):
+    """Convert a dotted quad ipv4 address to an integer"""
+
+    parts = [int(x) for x in ip.strip().split('.')]
+    if len(parts) != 4:
+        raise ValueError("Not a dotted quad ipv4 address: %s" % ip)
+    for i in parts:
+        if not 0 <= i <= 255:
+            raise ValueError("Not a dotted quad ipv4 address: %s" % ip)
+    (a, b, c, d) = parts
+    return (a << 24) + (b << 16) + (c << 8) + d
+
+
+def int_to_ip(myint):
+    """Convert an integer to a dotted quad ipv4 address"""
+
+    return "%d.%d.%d.%d" % ((myint >> 24) & 255, (myint >> 16) & 255,
+                            (myint >> 8) & 255, myint & 255)
+
+
+def cidr_to_range(block):
+    """
+    Convert an address block (2.2.2.2 or 2.2.0.0/16) to a (low, high)
+    tuple of integers, inclusive. Host bits set in the address are
+    ignored, the same as SiLK does.
+    """
+
+    if '/' in block:
+        (addr, bits) = block.split('/')
+        bits = int(bits)
+    else:
+        (addr, bits) = (block, 32)
+
+    if not 0 <= bits <= 32:
+        raise ValueError("Invalid cidr bits in %s" % block)
+
+    size = 1 << (32 - bits)
+    low = ip_to_int(addr) & ~(size - 1) & 0xFFFFFFFF
+    return (low, low + size - 1)
+
+
+def block_size(block):
+    """Number of addresses in an address block"""
+
+    (low, high) = cidr_to_range(block)
+    return high - low + 1
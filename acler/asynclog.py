@@ -0,0 +1,152 @@
+#!/usr/bin/python
+
+# Non-blocking logging for acler. Log calls only put the record on an
+# in-memory queue; a background thread does the message formatting and
+# the console/file writes (and the log file rotation), so the per-ACL
+# evaluation loop never waits on log I/O. Messages should be logged
+# lazily, e.g. logger.debug("Forward: %s", cmd), with immutable args,
+# since they are formatted later on the writer thread.
+#
+# Also here: a filter that samples per-ACL debug detail, and a JSON
+# lines formatter for routing debug detail to a compact trace file.
+#
+# The QueueHandler and QueueListener in the logging module are 3.2+
+# only (and format in the caller's thread), so small versions are here.
+
+import atexit
+import json
+import logging
+import threading
+
+try:
+    import Queue as queue
+except ImportError:
+    import queue
+
+
+class QueueHandler(logging.Handler):
+    """Handler that only puts records on a queue, never blocking"""
+
+    def __init__(self, myqueue):
+        logging.Handler.__init__(self)
+        self.queue = myqueue
+
+    def emit(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except Exception:
+            self.handleError(record)
+
+
+class QueueListener(object):
+    """
+    Background thread taking records off the queue and passing them to
+    the handlers whose level they meet.
+    """
+
+    _sentinel = None
+
+    def __init__(self, myqueue, handlers):
+        self.queue = myqueue
+        self.handlers = handlers
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._monitor, name='acler-log-writer')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _monitor(self):
+        while True:
+            record = self.queue.get()
+            if record is self._sentinel:
+                break
+            for handler in self.handlers:
+                if record.levelno >= handler.level:
+                    handler.handle(record)
+
+    def stop(self):
+        """Write out everything queued so far and stop the thread"""
+
+        if self._thread is None:
+            return
+        self.queue.put_nowait(self._sentinel)
+        self._thread.join()
+        self._thread = None
+        for handler in self.handlers:
+            handler.flush()
+
+    def flush(self):
+        """Write out everything queued so far and keep going"""
+
+        self.stop()
+        self.start()
+
+
+def start_queue_logging(logger, handlers):
+    """
+    Put the handlers behind a queue on the logger, with a writer thread
+    that is stopped (and so flushed) at exit. Returns the listener.
+    """
+
+    myqueue = queue.Queue()
+    handler = QueueHandler(myqueue)
+    logger.addHandler(handler)
+    listener = QueueListener(myqueue, handlers)
+    handler.listener = listener
+    listener.start()
+    atexit.register(listener.stop)
+    return listener
+
+
+def restart_queue_logging(logger):
+    """
+    In a forked child process, give the logger's queue handler a new
+    queue and writer thread, since the parent's thread is not copied by
+    the fork. Pool workers don't run atexit, so the caller flushes the
+    returned listener. Flush the parent's listener before forking, so
+    its thread isn't holding a handler lock.
+    """
+
+    for handler in logger.handlers:
+        if isinstance(handler, QueueHandler):
+            handler.queue = queue.Queue()
+            handler.listener = QueueListener(handler.queue, handler.listener.handlers)
+            handler.listener.start()
+            return handler.listener
+    return None
+
+
+class DebugSampler(logging.Filter):
+    """
+    Pass per-ACL debug records (logged with extra={'acl': line}) for
+    only every Nth ACL line, so a big run keeps full detail for a
+    sample of the ACL's. Other records always pass.
+    """
+
+    def __init__(self, every):
+        logging.Filter.__init__(self)
+        self.every = every
+
+    def filter(self, record):
+        line = getattr(record, 'acl', None)
+        if line is None or record.levelno > logging.DEBUG or self.every <= 1:
+            return True
+        try:
+            return int(line) % self.every == 0
+        except ValueError:
+            return True
+
+
+class JsonLinesFormatter(logging.Formatter):
+    """One compact JSON object per record, for trace files"""
+
+    def format(self, record):
+        trace = {'t': round(record.created, 6), 'lvl': record.levelname,
+                 'msg': record.getMessage()}
+        line = getattr(record, 'acl', None)
+        if line is not None:
+            trace['acl'] = line
+        if record.exc_info:
+            trace['exc'] = self.formatException(record.exc_info)
+        return json.dumps(trace, sort_keys=True)
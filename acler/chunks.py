@@ -0,0 +1,100 @@
+#!/usr/bin/python
+
+# A chunk is one slice of repo time that gets pulled and checked as a
+# unit: a whole day, the first hour of the first day, or a short sample
+# slice. AclerItems keep the list of chunks they were checked against
+# so the results can report what was actually covered.
+
+from datetime import datetime, timedelta
+
+DATE_FORMAT = "%Y/%m/%d"
+
+# kinds of chunks, in the order they are reported by get_days_checked
+DAY = 'day'
+HOUR = 'hour'
+SAMPLE = 'sample'
+
+
+class Chunk(object):
+    """Just holding the time info for one repo pull"""
+
+    def __init__(self, kind, day, start, end, label, extra=None):
+        self.kind = kind
+        # datetime of the day the chunk falls on
+        self.day = day
+        # rwfilter --start and --end values
+        self.start = start
+        self.end = end
+        # short label for logging, file names and results
+        self.label = label
+        # extra rwfilter args limiting the pull, e.g. --stime
+        if extra is None:
+            extra = list()
+        self.extra = extra
+
+    def __repr__(self):
+        return "<Chunk: %s %s>" % (self.kind, self.label)
+
+
+def day_chunk(day):
+    """Chunk covering a whole day"""
+
+    mydate = day.strftime(DATE_FORMAT)
+    return Chunk(DAY, day, mydate, mydate, day.strftime("%Y%m%d"))
+
+
+def hour_chunk(day, hour):
+    """Chunk covering one hour of a day"""
+
+    myhour = "%s:%02d" % (day.strftime(DATE_FORMAT), hour)
+    label = "%s:%02d" % (day.strftime("%Y%m%d"), hour)
+    return Chunk(HOUR, day, myhour, myhour, label)
+
+
+def day_part_chunk(day, first_hour, last_hour):
+    """
+    Chunk covering hours first_hour to last_hour of a day. It is a day
+    chunk, so a day pulled in several parts is reported as one day.
+    """
+
+    mydate = day.strftime(DATE_FORMAT)
+    label = "%s:%02d" % (day.strftime("%Y%m%d"), first_hour)
+    if last_hour != first_hour:
+        label = "%s-%02d" % (label, last_hour)
+    return Chunk(DAY, day, "%s:%02d" % (mydate, first_hour), "%s:%02d" % (mydate, last_hour), label)
+
+
+def window_days(start, end):
+    """Return the list of datetime days from YYYY/MM/DD start to end inclusive"""
+
+    mystart = datetime.strptime(start, DATE_FORMAT)
+    myend = datetime.strptime(end, DATE_FORMAT)
+    delta = timedelta(days=1)
+
+    days = list()
+    while mystart <= myend:
+        days.append(mystart)
+        mystart += delta
+    return days
+
+
+def compress_days(days):
+    """
+    Convert a list of datetime days to a compact string of runs,
+    e.g. 20150723-20150725,20150728
+    """
+
+    runs = list()
+    for day in sorted(days):
+        if runs and day - runs[-1][1] == timedelta(days=1):
+            runs[-1][1] = day
+        else:
+            runs.append([day, day])
+
+    parts = list()
+    for (first, last) in runs:
+        if first == last:
+            parts.append(first.strftime("%Y%m%d"))
+        else:
+            parts.append("%s-%s" % (first.strftime("%Y%m%d"), last.strftime("%Y%m%d")))
+    return ','.join(parts)
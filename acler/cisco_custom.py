@@ -112,7 +112,9 @@ def get_endpoint():
         # any [eq 25 | range 21 22]
         e.has_netblock = False
         current_token += 1
-        get_port(e)
+        # any can be the last token
+        if current_token < len(tokens):
+            get_port(e)
     elif v == 'host':
         # host 2.2.2.2 [eq 25 | range 21 22]
         e.has_netblock = True
@@ -133,9 +135,10 @@ def get_endpoint():
     return e
 
 
-def parse_cisco(cisco_acl_line): 
+def parse_cisco(cisco_acl_line, port_only=False): 
     """
     Parse the Cisco-formatted ACL entry and return a populated AclerItem class.
+    Any to any entries with ports only parse with port_only (--port-only).
     """
 
     global current_token, tokens
@@ -190,7 +193,8 @@ def parse_cisco(cisco_acl_line):
         source = get_endpoint()
         dest   = get_endpoint()
 
-        if source.has_netblock == False and dest.has_netblock == False:
+        if source.has_netblock == False and dest.has_netblock == False and \
+                (not port_only or (source.has_port == False and dest.has_port == False)):
             myacler.parsed = False
             myacler.error = 'No source or dest network address'
         else:
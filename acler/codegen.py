@@ -0,0 +1,319 @@
+#!/usr/bin/python
+
+# Compiled match predicates for the inprocess engine. Checking each
+# record against each AclerItem's criteria tuple pays for the tuple
+# unpacking, None checks and range calls on every comparison. Instead,
+# the criteria of the active ACL's are turned into Python source, with
+# the address masks and port bounds inlined as integer constants, and
+# compiled once:
+#
+#   - the criteria are grouped by protocol, so a record (or a numpy
+#     chunk's rows of that protocol) is only checked against the ACL's
+#     for its protocol
+#   - within a protocol they are grouped by shape, which fields are a
+#     single value (host, eq port), a range (network, port range) or
+#     any. Large groups whose fields are all single values (host/host,
+#     host/host/port) become one dict lookup keyed on those fields
+#     instead of a comparison per ACL
+#   - everything else becomes inline comparisons, a CIDR block as a
+#     mask and compare
+#
+# The compiled predicates are kept until the active set changes, i.e.
+# until ACL's retire, so the source is only regenerated then.
+
+import time
+
+from silkreader import numpy
+
+try:
+    from itertools import izip
+except ImportError:
+    izip = zip
+
+# all-single-value shape groups at least this big use a dict lookup
+LOOKUP_MIN = 4
+
+# the criteria fields after the protocol, with their bit widths and the
+# local variable names the generated code uses for their columns
+FIELDS = (('sip', 32, 's'), ('sport', 16, 'sp'), ('dip', 32, 'd'), ('dport', 16, 'dp'))
+
+ANY = 'any'
+EQ = 'eq'
+RANGE = 'range'
+
+
+def field_shape(myrange, bits):
+    """any, eq or range for one (low, high) criteria range, None is any"""
+
+    if myrange is None or myrange == (0, (1 << bits) - 1):
+        return ANY
+    if myrange[0] == myrange[1]:
+        return EQ
+    return RANGE
+
+
+def criteria_shape(criteria):
+    """Shape of the (sip, sport, dip, dport) part of a criteria tuple"""
+
+    return tuple(field_shape(myrange, bits) for (myrange, (name, bits, var))
+                 in zip(criteria[1:], FIELDS))
+
+
+def range_test(var, myrange, bits):
+    """Python expression testing var against a (low, high) range"""
+
+    (low, high) = myrange
+    if low == high:
+        return "%s == %d" % (var, low)
+    size = high - low + 1
+    if size & (size - 1) == 0 and low % size == 0:
+        # an aligned block, e.g. a CIDR network
+        return "(%s & %d) == %d" % (var, ((1 << bits) - 1) ^ (size - 1), low)
+    return "%d <= %s <= %d" % (low, var, high)
+
+
+def vector_test(var, myrange, bits):
+    """numpy expression testing the var column against a (low, high) range"""
+
+    (low, high) = myrange
+    if low == high:
+        return "(%s == %d)" % (var, low)
+    size = high - low + 1
+    if size & (size - 1) == 0 and low % size == 0:
+        return "((%s & %d) == %d)" % (var, ((1 << bits) - 1) ^ (size - 1), low)
+    return "(%s >= %d) & (%s <= %d)" % (var, low, var, high)
+
+
+def _isin(values, table):
+    if hasattr(numpy, 'isin'):
+        return numpy.isin(values, table)
+    return numpy.in1d(values, table)
+
+
+def lookup_rows(hits, table, first, columns, rows):
+    """
+    Add (key, row indexes) hits for a lookup group: prefilter the rows
+    on the first column's values, then look up the rest in Python.
+    rows maps the column positions back to the chunk, or None.
+    """
+
+    candidates = numpy.nonzero(_isin(columns[0], first))[0]
+    if not len(candidates):
+        return
+
+    found = dict()
+    if len(columns) == 1:
+        keys = columns[0][candidates].tolist()
+    else:
+        keys = izip(*[c[candidates].tolist() for c in columns])
+    for (j, key) in izip(candidates.tolist(), keys):
+        for k in table.get(key, ()):
+            found.setdefault(k, list()).append(j)
+
+    for (k, js) in found.items():
+        myrows = numpy.array(js, dtype=numpy.intp)
+        if rows is not None:
+            myrows = rows[myrows]
+        hits.append((k, myrows))
+
+
+class PredicateSet(object):
+    """
+    Compiled predicates for a list of criteria tuples (as returned by
+    AclerItem.get_match_criteria). Matches are reported by the index of
+    the criteria in the list.
+    """
+
+    def __init__(self, criteria):
+        self.criteria = criteria
+        self.lookups = 0
+        self.tests = 0
+
+        # protocol (None for any) to shape to [criteria index]
+        groups = dict()
+        for (k, c) in enumerate(criteria):
+            groups.setdefault(c[0], dict()).setdefault(criteria_shape(c), list()).append(k)
+
+        # the lookup tables are named in the generated code
+        self.namespace = {'izip': izip, 'numpy': numpy, 'lookup_rows': lookup_rows}
+
+        # (protocol, [(lookup table name, fields)], [inline criteria index]),
+        # any protocol last
+        self.layout = list()
+        protos = sorted([p for p in groups if p is not None])
+        if None in groups:
+            protos.append(None)
+        for proto in protos:
+            (lookups, inline) = self._split(groups[proto])
+            self.layout.append((proto, [(self._lookup_table(keys, fields), fields)
+                                        for (fields, keys) in lookups], inline))
+            self.tests += len(inline)
+
+        self.python_source = self.build_python()
+        self.numpy_source = None
+        if numpy is not None:
+            self.numpy_source = self.build_numpy()
+
+        start = time.time()
+        exec(compile(self.python_source, '<acler predicates>', 'exec'), self.namespace)
+        if self.numpy_source is not None:
+            exec(compile(self.numpy_source, '<acler vector predicates>', 'exec'), self.namespace)
+        self.compile_seconds = time.time() - start
+
+    def _lookup_table(self, keys, fields):
+        """Name a new lookup table of the fields' values for the criteria keys"""
+
+        table = dict()
+        for k in keys:
+            values = tuple(self.criteria[k][i + 1][0] for i in fields)
+            if len(fields) == 1:
+                values = values[0]
+            table.setdefault(values, list()).append(k)
+        name = "L%d" % len(self.namespace)
+        self.namespace[name] = table
+        self.namespace["V" + name] = sorted(set(self.criteria[k][fields[0] + 1][0] for k in keys))
+        self.lookups += 1
+        return name
+
+    def _split(self, shapes):
+        """(lookup groups, inline criteria) of one protocol's shape groups"""
+
+        lookups = list()
+        inline = list()
+        for shape in sorted(shapes):
+            keys = shapes[shape]
+            fields = [i for (i, s) in enumerate(shape) if s != ANY]
+            if fields and RANGE not in shape and len(keys) >= LOOKUP_MIN:
+                lookups.append((fields, keys))
+            else:
+                inline.extend(keys)
+        return (lookups, inline)
+
+    def _tests(self, k, test):
+        """Inline tests of the criteria's constrained fields"""
+
+        tests = list()
+        for (myrange, (name, bits, var)) in zip(self.criteria[k][1:], FIELDS):
+            if field_shape(myrange, bits) != ANY:
+                tests.append(test(var, myrange, bits))
+        return tests
+
+    def build_python(self):
+        """Source of match_records, a loop over a chunk's columns"""
+
+        lines = ["def match_records(proto, sip, sport, dip, dport, flowtype, nbytes, packets, add):",
+                 "    for (p, s, sp, d, dp, ft, b, pk) in izip(proto, sip, sport, dip, dport,",
+                 "                                             flowtype, nbytes, packets):"]
+
+        first = True
+        for (proto, lookups, inline) in self.layout:
+            # criteria for any protocol are checked after the if/elif
+            indent = "        "
+            if proto is not None:
+                lines.append("        %s p == %d:" % ('if' if first else 'elif', proto))
+                indent = "            "
+                first = False
+
+            for (name, fields) in lookups:
+                key = ', '.join([FIELDS[i][2] for i in fields])
+                if len(fields) > 1:
+                    key = "(%s)" % key
+                lines.extend(["%shits = %s.get(%s)" % (indent, name, key),
+                              "%sif hits is not None:" % indent,
+                              "%s    for k in hits:" % indent,
+                              "%s        add(k, ft, b, pk)" % indent])
+            for k in inline:
+                tests = self._tests(k, range_test)
+                if tests:
+                    lines.extend(["%sif %s:" % (indent, ' and '.join(tests)),
+                                  "%s    add(%d, ft, b, pk)" % (indent, k)])
+                else:
+                    lines.append("%sadd(%d, ft, b, pk)" % (indent, k))
+
+        if len(lines) == 3:
+            lines.append("        pass")
+        return "\n".join(lines) + "\n"
+
+    def build_numpy(self):
+        """Source of match_vectors, which returns (criteria index, row indexes) hits"""
+
+        lines = ["def match_vectors(proto, sip, sport, dip, dport):",
+                 "    hits = list()"]
+
+        for (proto, lookups, inline) in self.layout:
+            if proto is None:
+                lines.extend(["    rows = None",
+                              "    (s, sp, d, dp) = (sip, sport, dip, dport)"])
+                indent = "    "
+                take = "numpy.nonzero(%s)[0]"
+                every = "numpy.arange(len(proto))"
+            else:
+                lines.extend(["    rows = numpy.nonzero(proto == %d)[0]" % proto,
+                              "    if len(rows):",
+                              "        (s, sp, d, dp) = (sip[rows], sport[rows], dip[rows], dport[rows])"])
+                indent = "        "
+                take = "rows[%s]"
+                every = "rows"
+
+            for (name, fields) in lookups:
+                columns = ', '.join([FIELDS[i][2] for i in fields])
+                lines.append("%slookup_rows(hits, %s, V%s, [%s], rows)" %
+                             (indent, name, name, columns))
+            for k in inline:
+                tests = self._tests(k, vector_test)
+                if tests:
+                    lines.extend(["%sx = %s" % (indent, ' & '.join(tests)),
+                                  "%sif x.any():" % indent,
+                                  "%s    hits.append((%d, %s))" % (indent, k, take % 'x')])
+                else:
+                    lines.append("%shits.append((%d, %s))" % (indent, k, every))
+
+        lines.append("    return hits")
+        return "\n".join(lines) + "\n"
+
+    def match_records(self, chunk):
+        """
+        Check a chunk record by record. Returns a dict of (criteria
+        index, flowtype) to [records, bytes, packets].
+        """
+
+        totals = dict()
+
+        def add(k, ft, b, pk):
+            counts = totals.get((k, ft))
+            if counts is None:
+                totals[(k, ft)] = [1, b, pk]
+            else:
+                counts[0] += 1
+                counts[1] += b
+                counts[2] += pk
+
+        self.namespace['match_records'](chunk.proto, chunk.sip, chunk.sport, chunk.dip,
+                                        chunk.dport, chunk.flowtype, chunk.bytes, chunk.packets, add)
+        return totals
+
+    def match_vectors(self, chunk):
+        """Check a chunk of numpy columns. Returns a list of (criteria index, row indexes)."""
+
+        return self.namespace['match_vectors'](chunk.proto, chunk.sip, chunk.sport, chunk.dip,
+                                               chunk.dport)
+
+
+# the last compiled set, reused until the criteria change
+_compiled = dict()
+
+
+def compile_predicates(criteria):
+    """
+    Return the PredicateSet for a list of criteria tuples, compiling it
+    only if the criteria changed since the last call. The second value
+    is True when it was reused.
+    """
+
+    key = tuple(criteria)
+    if key in _compiled:
+        return (_compiled[key], True)
+    predicates = PredicateSet(list(criteria))
+    _compiled.clear()
+    _compiled[key] = predicates
+    return (predicates, False)
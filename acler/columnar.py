@@ -0,0 +1,335 @@
+#!/usr/bin/python
+
+# Memory-mapped columnar cache of the flow records in a SiLK working
+# file. Each field is stored as one fixed-width array, plus row id
+# indexes sorted by sip and dip, so in-process evaluation (and any
+# rerun over the same day) can use zero-copy views and binary search
+# the address range of each AclerItem block instead of rescanning the
+# binary flow file.
+#
+# File layout:
+#   magic (8 bytes), cache version (uint32), metadata length (uint32)
+#   json metadata (record count, byte order, type names, column offsets,
+#                  source file size/mtime and an optional cache key)
+#   columns and indexes, each starting on an 8 byte boundary
+#
+# Only the standard library is used (mmap, struct, array) since
+# site-packages modules can't be counted on at customer locations.
+
+import array
+import bisect
+import json
+import mmap
+import os
+import struct
+import sys
+
+from addresses import cidr_to_range
+from silkreader import read_records
+
+try:
+    xrange
+except NameError:
+    xrange = range
+
+MAGIC = b'ACLERCOL'
+CACHE_VERSION = 1
+HEADER = struct.Struct('<8sII')
+ALIGN = 8
+
+# (column name, bytes per value), in record tuple order
+COLUMNS = [('sip', 4), ('dip', 4), ('sport', 2), ('dport', 2), ('proto', 1),
+           ('bytes', 8), ('packets', 8), ('typeid', 1)]
+
+# (index name, column it sorts), values are 4 byte row ids
+INDEXES = [('sip_order', 'sip'), ('dip_order', 'dip')]
+ROWID_SIZE = 4
+
+STRUCT_CODES = {1: 'B', 2: 'H', 4: 'I', 8: 'Q'}
+
+# rows per write when building the cache
+WRITE_ROWS = 65536
+
+
+def _typecode(size):
+    """array module typecode holding unsigned ints of size bytes"""
+
+    for code in ('B', 'H', 'I', 'L', 'Q'):
+        try:
+            if array.array(code).itemsize == size:
+                return code
+        except ValueError:
+            # no Q typecode before python 3.3
+            pass
+    raise ValueError("No array typecode for %d byte integers" % size)
+
+
+class Column(object):
+    """
+    Zero-copy, read only sequence view of one column in the mapped
+    cache. Slicing returns another view, not a copy.
+    """
+
+    def __init__(self, mm, offset, size, length, endian):
+        self._mm = mm
+        self._offset = offset
+        self._size = size
+        self._len = length
+        self._endian = endian
+        self._struct = struct.Struct("%s%s" % (endian, STRUCT_CODES[size]))
+
+    def __len__(self):
+        return self._len
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            (start, stop, step) = i.indices(self._len)
+            if step != 1:
+                raise ValueError("Column views only support contiguous slices")
+            return Column(self._mm, self._offset + start * self._size, self._size,
+                          max(0, stop - start), self._endian)
+        if i < 0:
+            i += self._len
+        if not 0 <= i < self._len:
+            raise IndexError("Column index out of range")
+        return self._struct.unpack_from(self._mm, self._offset + i * self._size)[0]
+
+    def __iter__(self):
+        for i in xrange(self._len):
+            yield self[i]
+
+    def tolist(self):
+        """Bulk unpack the whole view into a list"""
+        fmt = "%s%d%s" % (self._endian, self._len, STRUCT_CODES[self._size])
+        return list(struct.unpack_from(fmt, self._mm, self._offset))
+
+
+class SortedView(object):
+    """Sequence of column values in index order, for bisect"""
+
+    def __init__(self, values, order):
+        self.values = values
+        self.order = order
+
+    def __len__(self):
+        return len(self.order)
+
+    def __getitem__(self, i):
+        return self.values[self.order[i]]
+
+
+class ColumnarCache(object):
+    """
+    Read only, memory-mapped columnar cache. Raises ValueError for
+    foreign files, other cache versions, and, when key or source are
+    provided, for caches built with another key or from another
+    (or since modified) working file.
+    """
+
+    def __init__(self, filename, key=None, source=None):
+        self.filename = filename
+        self._f = open(filename, 'rb')
+        try:
+            self._mm = mmap.mmap(self._f.fileno(), 0, access=mmap.ACCESS_READ)
+        except Exception:
+            self._f.close()
+            raise ValueError("Can not map columnar cache %s" % filename)
+
+        try:
+            self._load_metadata(key, source)
+        except Exception:
+            self.close()
+            raise
+
+    def _load_metadata(self, key, source):
+        if len(self._mm) < HEADER.size:
+            raise ValueError("Not an acler columnar cache: %s" % self.filename)
+        (magic, version, metalen) = HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC:
+            raise ValueError("Not an acler columnar cache: %s" % self.filename)
+        if version != CACHE_VERSION:
+            raise ValueError("Columnar cache %s is version %d, expected %d" %
+                             (self.filename, version, CACHE_VERSION))
+
+        metadata = self._mm[HEADER.size:HEADER.size + metalen]
+        self.metadata = json.loads(metadata.decode('utf-8'))
+
+        if key is not None and self.metadata.get('key') != key:
+            raise ValueError("Columnar cache %s was built for another key" % self.filename)
+
+        if source is not None:
+            st = os.stat(source)
+            mysource = self.metadata.get('source') or dict()
+            if mysource.get('size') != st.st_size or mysource.get('mtime') != int(st.st_mtime):
+                raise ValueError("Columnar cache %s is stale for %s" % (self.filename, source))
+
+        self.records = self.metadata['records']
+        if self.metadata['byteorder'] == 'little':
+            self._endian = '<'
+        else:
+            self._endian = '>'
+        # json keys are strings
+        self.type_names = dict((int(k), v) for (k, v) in self.metadata['types'].items())
+
+    def close(self):
+        if getattr(self, '_mm', None) is not None:
+            self._mm.close()
+            self._mm = None
+        self._f.close()
+
+    def column(self, name):
+        """Return the zero-copy Column view for a column or index name"""
+
+        if name not in self.metadata['columns']:
+            raise KeyError("No column %s in columnar cache" % name)
+        (offset, size) = self.metadata['columns'][name]
+        return Column(self._mm, offset, size, self.records, self._endian)
+
+    def index_range(self, field, low, high):
+        """
+        Return the (start, stop) positions of the field's sorted index
+        holding the rows with low <= field value <= high.
+        """
+
+        order = self.column("%s_order" % field)
+        view = SortedView(self.column(field), order)
+        start = bisect.bisect_left(view, low)
+        stop = bisect.bisect_right(view, high, start)
+        return (start, stop)
+
+    def rows_for_block(self, field, block):
+        """
+        Return a zero-copy view of the row ids whose sip or dip (field)
+        falls in the address block, e.g. 2.2.0.0/16
+        """
+
+        (low, high) = cidr_to_range(block)
+        (start, stop) = self.index_range(field, low, high)
+        return self.column("%s_order" % field)[start:stop]
+
+
+def _pad(f):
+    """Pad the file to the next ALIGN boundary"""
+    extra = f.tell() % ALIGN
+    if extra:
+        f.write(b'\0' * (ALIGN - extra))
+
+
+def build_columnar_cache(rwfile, cachefile, key=None, records=None):
+    """
+    Convert a SiLK working file to a columnar cache file. records is an
+    optional iterable of (sip, dip, sport, dport, proto, bytes, packets,
+    typename) tuples, which defaults to reading rwfile with the native
+    reader (see silkreader.read_records). Returns the record count.
+    """
+
+    if records is None:
+        records = read_records(rwfile)
+
+    typecodes = dict((size, _typecode(size)) for (name, size) in COLUMNS)
+    rowcode = _typecode(ROWID_SIZE)
+
+    # stream the columns out to temp files, keeping only the addresses
+    # in memory for sorting the indexes
+    tmpfiles = dict()
+    for (name, size) in COLUMNS:
+        tmpfiles[name] = open("%s.%s.tmp" % (cachefile, name), 'w+b')
+
+    sips = array.array(typecodes[4])
+    dips = array.array(typecodes[4])
+    types = dict()
+    count = 0
+
+    try:
+        pending = [array.array(typecodes[size]) for (name, size) in COLUMNS]
+        for rec in records:
+            rec = list(rec)
+            typename = rec[7]
+            if typename not in types:
+                if len(types) > 255:
+                    raise ValueError("Too many SiLK types for the columnar cache")
+                types[typename] = len(types)
+            rec[7] = types[typename]
+            for i in range(len(COLUMNS)):
+                pending[i].append(rec[i])
+            count += 1
+            if count % WRITE_ROWS == 0:
+                sips.extend(pending[0])
+                dips.extend(pending[1])
+                for i, (name, size) in enumerate(COLUMNS):
+                    pending[i].tofile(tmpfiles[name])
+                pending = [array.array(typecodes[size]) for (name, size) in COLUMNS]
+
+        sips.extend(pending[0])
+        dips.extend(pending[1])
+        for i, (name, size) in enumerate(COLUMNS):
+            pending[i].tofile(tmpfiles[name])
+
+        if count >= (1 << (8 * ROWID_SIZE)):
+            raise ValueError("Too many records for the columnar cache: %d" % count)
+
+        # sorted row id indexes
+        indexes = dict()
+        indexes['sip_order'] = array.array(rowcode, sorted(xrange(count), key=sips.__getitem__))
+        indexes['dip_order'] = array.array(rowcode, sorted(xrange(count), key=dips.__getitem__))
+        del sips, dips
+
+        # lay out the data after the header
+        metadata = {'records': count, 'byteorder': sys.byteorder,
+                    'types': dict((str(v), k) for (k, v) in types.items()),
+                    'key': key, 'columns': dict()}
+        if rwfile is not None and os.path.exists(rwfile):
+            st = os.stat(rwfile)
+            metadata['source'] = {'file': rwfile, 'size': st.st_size, 'mtime': int(st.st_mtime)}
+
+        # offsets depend on the metadata length, so size it with room
+        # for the offsets and fix the length up front
+        layout = [(name, size) for (name, size) in COLUMNS] + \
+                 [(name, ROWID_SIZE) for (name, field) in INDEXES]
+        for (name, size) in layout:
+            metadata['columns'][name] = [0, size]
+        metalen = len(json.dumps(metadata)) + 32 * len(layout)
+        offset = HEADER.size + metalen
+        for (name, size) in layout:
+            offset += (ALIGN - offset % ALIGN) % ALIGN
+            metadata['columns'][name] = [offset, size]
+            offset += size * count
+        mymeta = json.dumps(metadata).encode('utf-8')
+        mymeta += b' ' * (metalen - len(mymeta))
+
+        tmpcache = "%s.tmp" % cachefile
+        with open(tmpcache, 'wb') as f:
+            f.write(HEADER.pack(MAGIC, CACHE_VERSION, metalen))
+            f.write(mymeta)
+            for (name, size) in COLUMNS:
+                _pad(f)
+                tmpfiles[name].seek(0)
+                while True:
+                    data = tmpfiles[name].read(1 << 20)
+                    if not data:
+                        break
+                    f.write(data)
+            for (name, field) in INDEXES:
+                _pad(f)
+                indexes[name].tofile(f)
+        os.rename(tmpcache, cachefile)
+
+    finally:
+        for (name, size) in COLUMNS:
+            tmpfiles[name].close()
+            if os.path.exists(tmpfiles[name].name):
+                os.remove(tmpfiles[name].name)
+
+    return count
+
+
+if __name__ == '__main__':
+    # convert a working file and show a quick summary
+    # python acler/columnar.py /path/to/working.rwf /path/to/working.col [block]
+    count = build_columnar_cache(sys.argv[1], sys.argv[2])
+    cache = ColumnarCache(sys.argv[2], source=sys.argv[1])
+    print("%d records, types %s" % (count, cache.type_names))
+    if len(sys.argv) > 3:
+        print("%d rows with sip in %s" % (len(cache.rows_for_block('sip', sys.argv[3])), sys.argv[3]))
+        print("%d rows with dip in %s" % (len(cache.rows_for_block('dip', sys.argv[3])), sys.argv[3]))
+    cache.close()
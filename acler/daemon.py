@@ -0,0 +1,261 @@
+#!/usr/bin/python
+
+# Pieces of the resident daemon mode (acler.py --daemon). The daemon
+# listens on a Unix socket and keeps what every short ad-hoc run would
+# otherwise redo in memory: the parsed ACL inventories (reparsed only
+# when the CSV file changes) and the most recent repo pulls, so a job
+# for lines whose address blocks an earlier pull already covered reads
+# the cached working file instead of the repo.
+#
+# Jobs are one JSON line from the client (see aclerc.py), e.g.
+#   {"command": "check", "infile": "/path/acls.csv", "column": 3,
+#    "lines": ["12", "15"], "start": "2015/07/23", "end": "2015/07/30"}
+# and the daemon streams JSON lines back: a "result" for each line as
+# soon as it is known, then "done" (or "error").
+#
+# Anyone who can connect to the socket can run jobs as the daemon's
+# user, and the daemon opens whatever infile path a job names. The
+# socket is only readable and writable by that user (0600); run the
+# daemon as a user whose files the clients may read anyway.
+
+import json
+import os
+import re
+import shutil
+import socket
+import time
+
+try:
+    import SocketServer as socketserver
+except ImportError:
+    import socketserver
+
+from addresses import cidr_to_range
+from strategies import STRATEGIES
+
+# the --engine choices
+ENGINES = ('rwfilter', 'inprocess', 'pmap')
+
+
+def send(wfile, message):
+    """Write one JSON line message to the client"""
+
+    wfile.write((json.dumps(message, sort_keys=True) + "\n").encode('utf-8'))
+    wfile.flush()
+
+
+def validate_job(job):
+    """Return an error string for a malformed check job, or None"""
+
+    if not isinstance(job, dict):
+        return "Job must be a JSON object"
+    if not job.get('infile'):
+        return "Job infile required"
+    try:
+        if int(job.get('column', 0)) < 1:
+            return "Job column must be 1 or higher"
+    except (TypeError, ValueError):
+        return "Job column must be an integer"
+    for key in ('start', 'end'):
+        if job.get(key) and not re.match(r'^\d{4}/\d{2}/\d{2}$', job[key]):
+            return "Job %s does not match required format: YYYY/MM/DD" % key
+    if job.get('class') and not re.match(r'^[A-Za-z0-9-]+$', job['class']):
+        return "Invalid character found in SiLK class, must be A-Za-z0-9-"
+    if job.get('types') and not re.match(r'^[A-Za-z0-9-,]+$', job['types']):
+        return "Invalid character found in SiLK types, must be A-Za-z0-9-"
+    if job.get('engine') and job['engine'] not in ENGINES:
+        return "Job engine must be one of %s" % ', '.join(ENGINES)
+    if job.get('strategy') and job['strategy'] not in STRATEGIES:
+        return "Job strategy must be one of %s" % ', '.join(STRATEGIES)
+    if job.get('lines') is not None and not isinstance(job['lines'], list):
+        return "Job lines must be a list of line numbers"
+    return None
+
+
+class Inventory(object):
+    """One parsed ACL CSV file, by line number"""
+
+    def __init__(self, path, column, mtime, items):
+        self.path = path
+        self.column = column
+        self.mtime = mtime
+        self.lines = [a.line for a in items]
+        self.items = dict((a.line, a) for a in items)
+        self.loaded = time.time()
+        # warm the match criteria used by the in-process engine
+        for a in items:
+            if a.parsed and a.error is None:
+                a.get_match_criteria(False)
+                a.get_match_criteria(True)
+
+
+class InventoryCache(object):
+    """
+    Parsed ACL inventories by (path, column). loader(path, column)
+    returns the list of AclerItems and is only called again when the
+    file's mtime changes.
+    """
+
+    def __init__(self, loader):
+        self.loader = loader
+        self.inventories = dict()
+        self.hits = 0
+        self.loads = 0
+
+    def get(self, path, column):
+        key = (path, column)
+        mtime = os.path.getmtime(path)
+        inventory = self.inventories.get(key)
+        if inventory is not None and inventory.mtime == mtime:
+            self.hits += 1
+            return inventory
+        inventory = Inventory(path, column, mtime, self.loader(path, column))
+        self.inventories[key] = inventory
+        self.loads += 1
+        return inventory
+
+
+def _blocks_covered(blocks, cached_ranges):
+    for block in blocks:
+        (low, high) = cidr_to_range(block)
+        for (clow, chigh) in cached_ranges:
+            if clow <= low and high <= chigh:
+                break
+        else:
+            return False
+    return True
+
+
+def _protocol_set(protocols):
+    return set([x for x in protocols.split(',') if x])
+
+
+def _remove_files(filenames):
+    for filename in filenames:
+        if os.path.exists(filename):
+            os.remove(filename)
+
+
+class CachedPull(object):
+    """Just holding the info for one cached repo pull"""
+
+    def __init__(self, key, filenames, blocks, protocols):
+        self.key = key
+        self.filenames = filenames
+        self.ranges = [cidr_to_range(b) for b in blocks]
+        self.protocols = _protocol_set(protocols)
+        self.used = time.time()
+
+
+class WorkingFileCache(object):
+    """
+    Least recently used cache of repo pull working files, keyed by
+    class, types and chunk. A cached pull can answer a later pull for
+    the same key if its address blocks and protocols cover the later
+    pull's.
+    """
+
+    def __init__(self, cachedir, maxfiles):
+        self.cachedir = cachedir
+        self.maxfiles = maxfiles
+        self.pulls = list()
+        self.counter = 0
+        self.hits = 0
+        self.misses = 0
+
+    def find(self, key, blocks, protocols):
+        """Return the list of cached working files covering the pull, or None"""
+
+        myprotocols = _protocol_set(protocols)
+        for pull in self.pulls:
+            if pull.key != key:
+                continue
+            if pull.protocols and (not myprotocols or not myprotocols <= pull.protocols):
+                continue
+            if _blocks_covered(blocks, pull.ranges):
+                pull.used = time.time()
+                self.hits += 1
+                return pull.filenames
+        self.misses += 1
+        return None
+
+    def add(self, key, rwfiles, blocks, protocols):
+        """
+        Copy a fresh repo pull (list of working file parts) into the
+        cache, evicting the least recently used
+        """
+
+        if self.maxfiles < 1:
+            return
+        while len(self.pulls) >= self.maxfiles:
+            oldest = min(self.pulls, key=lambda p: p.used)
+            self.pulls.remove(oldest)
+            _remove_files(oldest.filenames)
+
+        self.counter += 1
+        filenames = list()
+        for (i, rwfile) in enumerate(rwfiles):
+            filename = "%s/acler-daemon-cache-%d-%d.rwf" % (self.cachedir, self.counter, i)
+            shutil.copyfile(rwfile, filename)
+            filenames.append(filename)
+        self.pulls.append(CachedPull(key, filenames, blocks, protocols))
+
+    def clear(self):
+        for pull in self.pulls:
+            _remove_files(pull.filenames)
+        self.pulls = list()
+
+
+class JobHandler(socketserver.StreamRequestHandler):
+    """Read one JSON line job and hand it to the server's job function"""
+
+    def handle(self):
+        line = self.rfile.readline()
+        if not line.strip():
+            return
+        mysend = lambda message: send(self.wfile, message)
+        try:
+            job = json.loads(line.decode('utf-8'))
+        except ValueError:
+            mysend({'type': 'error', 'error': 'Job is not valid JSON'})
+            return
+        try:
+            self.server.handle_job(job, mysend)
+        except socket.error:
+            # client went away
+            pass
+
+
+class DaemonServer(socketserver.UnixStreamServer):
+    """
+    Unix socket server running one job at a time, since acler keeps
+    its run state in module globals. Only the daemon's user can connect.
+    """
+
+    def __init__(self, socketpath, handle_job):
+        self.handle_job = handle_job
+        socketserver.UnixStreamServer.__init__(self, socketpath, JobHandler)
+
+    def server_bind(self):
+        # no window where the socket has the umask's permissions
+        umask = os.umask(0o177)
+        try:
+            socketserver.UnixStreamServer.server_bind(self)
+        finally:
+            os.umask(umask)
+        os.chmod(self.server_address, 0o600)
+
+
+def socket_in_use(socketpath):
+    """True if a daemon is already answering on the socket"""
+
+    if not os.path.exists(socketpath):
+        return False
+    s = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        s.connect(socketpath)
+        return True
+    except socket.error:
+        return False
+    finally:
+        s.close()
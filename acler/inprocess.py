@@ -0,0 +1,359 @@
+#!/usr/bin/python
+
+# In-process evaluation of the working file. Instead of one rwfilter
+# and rwuniq per ACL and direction, the working file is read once in
+# fixed-size record chunks (see acler/silkreader.py) and every ACL's
+# forward and reversed criteria are checked against each chunk. The
+# per type records/bytes/packets accumulate across chunks, so memory
+# use depends on the chunk size and not on the size of the repo pull.
+#
+# With a columnar cache of the working file (see acler/columnar.py),
+# each ACL's rows are found by binary searching its address block in
+# the cache's sorted sip/dip indexes instead of scanning every record.
+
+import resource
+
+from codegen import compile_predicates
+from columnar import ColumnarCache
+from silkreader import SilkFlowReader, numpy
+
+# rough resident bytes per record while a chunk is being evaluated,
+# numpy chunks are views plus a few masks, struct chunks hold a Python
+# int per field while unpacking
+NUMPY_BYTES_PER_RECORD = 96
+STRUCT_BYTES_PER_RECORD = 640
+
+MIN_CHUNK_RECORDS = 4096
+DEFAULT_CHUNK_RECORDS = 65536
+
+# rows read at a time from a columnar cache when the criteria have no
+# address block to search for
+CACHE_SCAN_ROWS = 65536
+
+# counter names, in (records, bytes, packets) order, by direction
+FORWARD_COUNTS = ('FR', 'FB', 'FP')
+REVERSE_COUNTS = ('RR', 'RB', 'RP')
+
+
+def _proc_status_bytes(field):
+    """Return a kB value from /proc/self/status in bytes, or None"""
+
+    try:
+        with open('/proc/self/status', 'r') as f:
+            for line in f:
+                if line.startswith(field + ':'):
+                    return int(line.split()[1]) * 1024
+    except (IOError, OSError, ValueError):
+        pass
+    return None
+
+
+def current_rss():
+    """Resident memory of this process in bytes (0 if unknown)"""
+
+    rss = _proc_status_bytes('VmRSS')
+    if rss is None:
+        return 0
+    return rss
+
+
+def peak_rss():
+    """Peak resident memory of this process in bytes"""
+
+    peak = _proc_status_bytes('VmHWM')
+    if peak is None:
+        # kB on Linux
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    return peak
+
+
+def reset_peak_rss():
+    """
+    Reset the peak resident memory mark (Linux 4.0+) so the peak can be
+    reported per day. Returns False if it could not be reset.
+    """
+
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except (IOError, OSError):
+        return False
+
+
+def chunk_records_for_budget(max_memory):
+    """
+    Return the number of records per chunk that keeps evaluation under
+    max_memory bytes, on top of what the process already uses. None
+    means no budget.
+    """
+
+    if not max_memory:
+        return DEFAULT_CHUNK_RECORDS
+
+    if numpy is not None:
+        per_record = NUMPY_BYTES_PER_RECORD
+    else:
+        per_record = STRUCT_BYTES_PER_RECORD
+
+    budget = max_memory - current_rss()
+    return max(MIN_CHUNK_RECORDS, budget // per_record)
+
+
+def _in_range(myrange, value):
+    return myrange is None or myrange[0] <= value <= myrange[1]
+
+
+def match_rows_python(chunk, criteria):
+    """Return the list of chunk row indexes matching the criteria"""
+
+    (proto, sip, sport, dip, dport) = criteria
+    rows = list()
+    for (i, (p, s, sp, d, dp)) in enumerate(zip(chunk.proto, chunk.sip, chunk.sport,
+                                                chunk.dip, chunk.dport)):
+        if proto is not None and p != proto:
+            continue
+        if _in_range(sip, s) and _in_range(sport, sp) and \
+                _in_range(dip, d) and _in_range(dport, dp):
+            rows.append(i)
+    return rows
+
+
+def match_rows_numpy(chunk, criteria):
+    """Return a boolean numpy mask of the chunk rows matching the criteria"""
+
+    (proto, sip, sport, dip, dport) = criteria
+    mask = numpy.ones(chunk.count, dtype=bool)
+    if proto is not None:
+        mask &= chunk.proto == proto
+    for (column, myrange) in ((chunk.sip, sip), (chunk.sport, sport),
+                              (chunk.dip, dip), (chunk.dport, dport)):
+        if myrange is not None:
+            mask &= (column >= myrange[0]) & (column <= myrange[1])
+    return mask
+
+
+def match_rows_columnar(cache, criteria):
+    """
+    Return the list of columnar cache row ids matching the criteria,
+    searching the narrower of the sip and dip sorted indexes
+    """
+
+    (proto, sip, sport, dip, dport) = criteria
+
+    candidates = None
+    for (field, myrange) in (('sip', sip), ('dip', dip)):
+        if myrange is None:
+            continue
+        (start, stop) = cache.index_range(field, myrange[0], myrange[1])
+        if candidates is None or stop - start < len(candidates):
+            candidates = cache.column("%s_order" % field)[start:stop]
+
+    protos = cache.column('proto')
+    checks = [(cache.column(name), myrange) for (name, myrange) in
+              (('sip', sip), ('sport', sport), ('dip', dip), ('dport', dport))
+              if myrange is not None]
+
+    if candidates is not None:
+        rows = list()
+        for i in candidates.tolist():
+            if proto is not None and protos[i] != proto:
+                continue
+            for (column, myrange) in checks:
+                if not myrange[0] <= column[i] <= myrange[1]:
+                    break
+            else:
+                rows.append(i)
+        return rows
+
+    # no address block, scan the needed columns a slice at a time
+    rows = list()
+    for start in range(0, cache.records, CACHE_SCAN_ROWS):
+        stop = min(start + CACHE_SCAN_ROWS, cache.records)
+        myprotos = protos[start:stop].tolist()
+        values = [(column[start:stop].tolist(), myrange) for (column, myrange) in checks]
+        for j in range(stop - start):
+            if proto is not None and myprotos[j] != proto:
+                continue
+            for (myvalues, myrange) in values:
+                if not myrange[0] <= myvalues[j] <= myrange[1]:
+                    break
+            else:
+                rows.append(start + j)
+    return rows
+
+
+def aggregate_cache_rows(cache, rows):
+    """Return a dict of type name to [records, bytes, packets] for columnar cache row ids"""
+
+    totals = dict()
+    typeids = cache.column('typeid')
+    mybytes = cache.column('bytes')
+    packets = cache.column('packets')
+    for i in rows:
+        typeid = typeids[i]
+        typename = cache.type_names.get(typeid, str(typeid))
+        if typename not in totals:
+            totals[typename] = [0, 0, 0]
+        mytotal = totals[typename]
+        mytotal[0] += 1
+        mytotal[1] += mybytes[i]
+        mytotal[2] += packets[i]
+    return totals
+
+
+def aggregate_rows(chunk, rows, type_names):
+    """
+    Return a dict of type name to [records, bytes, packets] for the
+    matching rows (list of indexes or numpy mask)
+    """
+
+    totals = dict()
+
+    if numpy is not None and hasattr(rows, 'dtype'):
+        # a boolean mask or an array of row indexes
+        if not len(rows) or (rows.dtype == bool and not rows.any()):
+            return totals
+        flowtypes = chunk.flowtype[rows]
+        mybytes = chunk.bytes[rows].astype(numpy.uint64)
+        packets = chunk.packets[rows].astype(numpy.uint64)
+        for ft in numpy.unique(flowtypes):
+            m = flowtypes == ft
+            totals[type_names.get(int(ft), str(ft))] = [int(m.sum()), int(mybytes[m].sum()),
+                                                        int(packets[m].sum())]
+        return totals
+
+    for i in rows:
+        typename = type_names.get(chunk.flowtype[i], str(chunk.flowtype[i]))
+        if typename not in totals:
+            totals[typename] = [0, 0, 0]
+        mytotal = totals[typename]
+        mytotal[0] += 1
+        mytotal[1] += chunk.bytes[i]
+        mytotal[2] += chunk.packets[i]
+    return totals
+
+
+class ChunkedEvaluator(object):
+    """
+    Accumulate the forward and reversed per type counts for a list of
+    AclerItems across record chunks. Unless compiled is False, the
+    criteria are checked with predicates generated for the items (see
+    acler/codegen.py) instead of one at a time.
+    """
+
+    def __init__(self, items, compiled=True):
+        self.items = items
+        self.criteria = [(i.get_match_criteria(False), i.get_match_criteria(True)) for i in items]
+        self.records = 0
+        self.chunks = 0
+
+        self.predicates = None
+        self.reused = False
+        if compiled:
+            # forward criteria of item i at 2 * i, reversed at 2 * i + 1
+            (self.predicates, self.reused) = compile_predicates(
+                [c for pair in self.criteria for c in pair])
+
+    def evaluate(self, chunk, type_names):
+        """Check every item both ways against one chunk"""
+
+        if self.predicates is not None:
+            self.evaluate_compiled(chunk, type_names)
+        else:
+            self.evaluate_interpreted(chunk, type_names)
+
+        self.records += chunk.count
+        self.chunks += 1
+
+    def evaluate_compiled(self, chunk, type_names):
+        if numpy is not None and hasattr(chunk.proto, 'dtype'):
+            for (k, rows) in self.predicates.match_vectors(chunk):
+                names = (FORWARD_COUNTS, REVERSE_COUNTS)[k % 2]
+                for (typename, counts) in aggregate_rows(chunk, rows, type_names).items():
+                    for (name, count) in zip(names, counts):
+                        self.items[k // 2].add_track(typename, name, count)
+            return
+
+        for ((k, ft), counts) in sorted(self.predicates.match_records(chunk).items()):
+            names = (FORWARD_COUNTS, REVERSE_COUNTS)[k % 2]
+            typename = type_names.get(ft, str(ft))
+            for (name, count) in zip(names, counts):
+                self.items[k // 2].add_track(typename, name, count)
+
+    def evaluate_cache(self, cache):
+        """Check every item both ways against a whole ColumnarCache"""
+
+        for (item, (forward, reverse)) in zip(self.items, self.criteria):
+            for (criteria, names) in ((forward, FORWARD_COUNTS), (reverse, REVERSE_COUNTS)):
+                rows = match_rows_columnar(cache, criteria)
+                for (typename, counts) in aggregate_cache_rows(cache, rows).items():
+                    for (name, count) in zip(names, counts):
+                        item.add_track(typename, name, count)
+
+        self.records += cache.records
+        self.chunks += 1
+
+    def evaluate_interpreted(self, chunk, type_names):
+        if numpy is not None and hasattr(chunk.proto, 'dtype'):
+            match_rows = match_rows_numpy
+        else:
+            match_rows = match_rows_python
+
+        for (item, (forward, reverse)) in zip(self.items, self.criteria):
+            for (criteria, names) in ((forward, FORWARD_COUNTS), (reverse, REVERSE_COUNTS)):
+                rows = match_rows(chunk, criteria)
+                for (typename, counts) in aggregate_rows(chunk, rows, type_names).items():
+                    for (name, count) in zip(names, counts):
+                        item.add_track(typename, name, count)
+
+
+def evaluate_working_file(rwfile, items, chunk_records, silkconf=None, on_chunk=None,
+                          caches=None):
+    """
+    Evaluate the items against rwfile (or a list of working file parts,
+    read as one input) in chunks of chunk_records records. on_chunk is
+    called with the record count after each chunk. caches is an
+    optional list of columnar cache files of the working files, used
+    instead of reading them. Returns the ChunkedEvaluator and the list
+    of SilkFlowReaders used, one per file read.
+    """
+
+    if isinstance(rwfile, list):
+        rwfiles = rwfile
+    else:
+        rwfiles = [rwfile]
+
+    # the caches are searched, not scanned
+    evaluator = ChunkedEvaluator(items, compiled=not caches)
+    readers = list()
+
+    for (i, myfile) in enumerate(rwfiles):
+        if caches:
+            cache = ColumnarCache(caches[i], source=myfile)
+            try:
+                evaluator.evaluate_cache(cache)
+            finally:
+                cache.close()
+            if on_chunk is not None:
+                on_chunk(cache.records)
+            continue
+
+        # read instead of map so resident memory stays bounded by the chunk
+        reader = SilkFlowReader(myfile, chunk_records, silkconf, mapped=False)
+        if reader.native and not reader.type_names:
+            # can't name the types without silk.conf, let PySiLK do it
+            reader.close()
+            reader = SilkFlowReader(myfile, chunk_records, force_silk=True)
+            reader.unsupported = 'no silk.conf type names'
+        readers.append(reader)
+
+        try:
+            for chunk in reader.chunks():
+                evaluator.evaluate(chunk, reader.type_names)
+                if on_chunk is not None:
+                    on_chunk(chunk.count)
+        finally:
+            reader.close()
+
+    return (evaluator, readers)
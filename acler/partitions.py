@@ -0,0 +1,189 @@
+#!/usr/bin/python
+
+# Split the day's working file once into protocol partitions, and for
+# tcp/udp into well-known port partitions, so that each ACL's forward
+# and reversed rwfilter only has to read the partitions its protocol
+# and ports can match instead of the whole working file.
+#
+# Port partitions are keyed on either port (rwfilter --aport), which
+# makes them symmetric: forward and reversed criteria read the same
+# partitions. For each split protocol the records go to:
+#   both  - both sport and dport are well-known ports
+#   <n>   - exactly one side is well-known port n
+#   other - neither side is a well-known port
+
+import json
+
+from protocols import port_range
+
+MANIFEST_VERSION = 1
+
+# protocols that get split by port
+PORT_PROTOCOLS = (6, 17)
+
+
+class Partition(object):
+    """Just holding the info for one partition file"""
+
+    def __init__(self, name, filename, protocol, port=None, records=None):
+        self.name = name
+        self.filename = filename
+        self.protocol = protocol
+        self.port = port
+        self.records = records
+
+    def to_dict(self):
+        return {'name': self.name, 'file': self.filename, 'protocol': self.protocol,
+                'port': self.port, 'records': self.records}
+
+    def __repr__(self):
+        return "<Partition: %s, %s records>" % (self.name, self.records)
+
+
+def partition_name(protocol, part):
+    return "p%s-%s" % (protocol, part)
+
+
+def build_partition_commands(rwfile, prefix, protocols, ports):
+    """
+    Return a (list of shell commands, list of Partitions, list of
+    intermediate files to remove once the commands have run) that split
+    the rwfile working file (or list of working file parts). protocols
+    is a list of ints, ports a list of well-known port ints. Partition
+    files are named prefix-<name>.rwf
+    """
+
+    if isinstance(rwfile, list):
+        rwfiles = rwfile
+    else:
+        rwfiles = [rwfile]
+
+    cmds = list()
+    partitions = list()
+    intermediates = list()
+    protocols = sorted(protocols)
+    ports = sorted(set(ports))
+    portlist = ','.join(map(str, ports))
+
+    def part_file(name):
+        return "%s-%s.rwf" % (prefix, name)
+
+    # first split by protocol, chaining the failed records to the next
+    # rwfilter. If there's only one protocol, the working file is it.
+    proto_files = dict()
+    if len(protocols) == 1 and len(rwfiles) == 1:
+        proto_files[protocols[0]] = rwfiles[0]
+    else:
+        stages = list()
+        myinput = ' '.join(rwfiles)
+        for i, proto in enumerate(protocols):
+            proto_files[proto] = part_file(partition_name(proto, 'all'))
+            if i == len(protocols) - 1:
+                stages.append("rwfilter --proto=%d --pass=%s %s" %
+                              (proto, proto_files[proto], myinput))
+            else:
+                stages.append("rwfilter --proto=%d --pass=%s --fail=stdout %s" %
+                              (proto, proto_files[proto], myinput))
+            myinput = 'stdin'
+        cmds.append(' | '.join(stages))
+
+    for proto in protocols:
+        if proto not in PORT_PROTOCOLS or not ports:
+            name = partition_name(proto, 'all')
+            partitions.append(Partition(name, proto_files[proto], proto))
+            continue
+
+        if proto_files[proto] not in rwfiles:
+            intermediates.append(proto_files[proto])
+
+        stages = list()
+        other = partition_name(proto, 'other')
+        name = partition_name(proto, 'both')
+        partitions.append(Partition(name, part_file(name), proto))
+        stages.append("rwfilter --sport=%s --dport=%s --pass=%s --fail=stdout %s" %
+                      (portlist, portlist, part_file(name), proto_files[proto]))
+        for port in ports:
+            name = partition_name(proto, port)
+            partitions.append(Partition(name, part_file(name), proto, port))
+            if port == ports[-1]:
+                stages.append("rwfilter --aport=%d --pass=%s --fail=%s stdin" %
+                              (port, part_file(name), part_file(other)))
+            else:
+                stages.append("rwfilter --aport=%d --pass=%s --fail=stdout stdin" %
+                              (port, part_file(name)))
+        partitions.append(Partition(other, part_file(other), proto))
+        cmds.append(' | '.join(stages))
+
+    return (cmds, partitions, intermediates)
+
+
+def write_manifest(manifestfile, rwfile, ports, partitions):
+    """Save the partition info as a small json manifest"""
+
+    manifest = {'version': MANIFEST_VERSION, 'source': rwfile, 'ports': sorted(ports),
+                'partitions': [p.to_dict() for p in partitions]}
+    with open(manifestfile, 'w') as f:
+        json.dump(manifest, f, indent=1)
+
+
+def read_manifest(manifestfile):
+    """Return the (ports, list of Partitions) from a json manifest"""
+
+    with open(manifestfile, 'r') as f:
+        manifest = json.load(f)
+
+    if manifest.get('version') != MANIFEST_VERSION:
+        raise ValueError("Unsupported partition manifest version in %s" % manifestfile)
+
+    partitions = [Partition(p['name'], p['file'], p['protocol'], p['port'], p['records'])
+                  for p in manifest['partitions']]
+    return (manifest['ports'], partitions)
+
+
+def _port_side_names(protocol, port, ports):
+    """
+    Return the set of partition names that hold every record with the
+    port (acl port value) on either side, or None if that is all of them.
+    """
+
+    try:
+        (low, high) = port_range(port)
+    except ValueError:
+        return None
+
+    # a range only helps if every port in it has its own partition
+    if high - low + 1 > len(ports):
+        return None
+
+    names = set([partition_name(protocol, 'both')])
+    for p in range(low, high + 1):
+        if p not in ports:
+            return None
+        names.add(partition_name(protocol, p))
+    return names
+
+
+def partitions_for(myacler, ports, partitions):
+    """
+    Return the list of partition file names the AclerItem's forward and
+    reversed criteria can match. Empty partitions are left out, so an
+    empty list means the acl can't match anything in the working file.
+    """
+
+    proto = myacler.protocol
+    mine = [p for p in partitions if proto is None or p.protocol == proto]
+
+    wanted = None
+    if proto in PORT_PROTOCOLS and ports:
+        ports = set(ports)
+        for port in (myacler.sport, myacler.dport):
+            if port is None:
+                continue
+            names = _port_side_names(proto, port, ports)
+            if names is not None and (wanted is None or len(names) < len(wanted)):
+                wanted = names
+
+    if wanted is not None:
+        mine = [p for p in mine if p.name in wanted]
+
+    return [p.filename for p in mine if p.records != 0]
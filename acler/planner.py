@@ -0,0 +1,260 @@
+#!/usr/bin/python
+
+# Cost-based pull planning (acler.py --max-working-mb, --plan-only).
+# Before any pull, the repo volume of each hour of the window is sized
+# from the repo files rwfglob lists for the class/types, and turned
+# into working file and runtime estimates using the ratios seen in
+# prior pulls (saved in the results db), or defaults when there is no
+# history yet. Each day is then pulled the cheapest way that keeps
+# every working file under the budget:
+#
+#   anyset      one set pull for the whole day, as acler always did
+#   hourly      runs of consecutive hours, each pulled on its own
+#   split-sets  hourly, but the hours that are over the budget on their
+#               own are pulled once for each group of the ACL set
+#
+# The estimates assume no ACL retires along the way, so after the
+# first pull they are upper bounds.
+
+import math
+import os
+import re
+
+from chunks import day_chunk, day_part_chunk, hour_chunk
+
+# repo files end in the _YYYYMMDD.HH of the hour they hold
+HOUR_FILE = re.compile(r'_(\d{8})\.(\d{2})$')
+
+# used until there is pull history for the class/types
+DEFAULT_PULL_RATIO = 0.05 # working file bytes per repo byte
+DEFAULT_RECORD_BYTES = 16.0 # working file bytes per record
+DEFAULT_SCAN_RATE = 50.0 * 1024 * 1024 # repo bytes pulled per second
+DEFAULT_EVAL_RATE = 100.0 * 1024 * 1024 # working file bytes read per second
+
+# seconds per rwfilter pull for the set build and process startup
+PULL_OVERHEAD = 2.0
+
+MB = 1024.0 * 1024
+
+
+def hour_sizes(paths, getsize=os.path.getsize):
+    """
+    Sum the repo file sizes into a dict of (YYYYMMDD, hour) to bytes.
+    Files not named for an hour are left out.
+    """
+
+    sizes = dict()
+    for path in paths:
+        m = HOUR_FILE.search(path)
+        if m is None:
+            continue
+        key = (m.group(1), int(m.group(2)))
+        sizes[key] = sizes.get(key, 0) + getsize(path)
+    return sizes
+
+
+class PullHistory(object):
+    """
+    Ratios fitted from prior pulls, each a (repo bytes, working file
+    bytes, records, pull seconds, eval seconds, eval passes) tuple.
+    """
+
+    def __init__(self, pulls=None):
+        pulls = [p for p in (pulls or []) if p[0] > 0]
+        self.samples = len(pulls)
+        self.ratio = DEFAULT_PULL_RATIO
+        self.record_bytes = DEFAULT_RECORD_BYTES
+        self.scan_rate = DEFAULT_SCAN_RATE
+        self.eval_rate = DEFAULT_EVAL_RATE
+
+        if not pulls:
+            return
+
+        repo = sum([p[0] for p in pulls])
+        working = sum([p[1] for p in pulls])
+        records = sum([p[2] for p in pulls])
+        pull_seconds = sum([p[3] for p in pulls])
+        eval_seconds = sum([p[4] for p in pulls])
+        eval_bytes = sum([p[1] * p[5] for p in pulls])
+
+        self.ratio = working / float(repo)
+        if records:
+            self.record_bytes = working / float(records)
+        if pull_seconds > 0:
+            self.scan_rate = repo / float(pull_seconds)
+        if eval_seconds > 0 and eval_bytes:
+            self.eval_rate = eval_bytes / float(eval_seconds)
+
+
+class PlannedPull(object):
+    """Just holding the estimates for one planned pull of a chunk"""
+
+    def __init__(self, strategy, chunk, groups, repo_bytes, working_bytes):
+        self.strategy = strategy
+        self.chunk = chunk
+        # number of groups the ACL set is split into, one pull each
+        self.groups = groups
+        self.repo_bytes = repo_bytes
+        # for all groups together
+        self.working_bytes = working_bytes
+        self.seconds = 0.0
+
+
+class DayPlan(object):
+    """The strategy and pulls for one day"""
+
+    def __init__(self, day, strategy, pulls):
+        self.day = day
+        self.strategy = strategy
+        self.pulls = pulls
+
+
+def pack_hours(estimates, limit, first=0):
+    """
+    Split the hours first-23 into runs of consecutive hours whose
+    estimates add up to no more than limit (a single hour may be over
+    it). Returns a list of (first hour, last hour).
+    """
+
+    runs = list()
+    total = 0
+    for hour in range(first, 24):
+        if hour > first and total + estimates[hour] > limit:
+            runs.append((first, hour - 1))
+            first = hour
+            total = 0
+        total += estimates[hour]
+    runs.append((first, 23))
+    return runs
+
+
+class Plan(object):
+    """
+    The planned pulls for a window: the first hour, then each day.
+    budget is the working file bytes limit, or None for no limit.
+    """
+
+    def __init__(self, history, budget, numacls, engine):
+        self.history = history
+        self.budget = budget
+        self.numacls = numacls
+        self.engine = engine
+        self.first_hour = None
+        self.days = list()
+
+    def passes(self, groups):
+        """Times each group's working file is read by the engine"""
+
+        if self.engine in ('inprocess', 'pmap'):
+            return 1.0
+        # forward and reverse rwfilter for each ACL in the group
+        return 2.0 * max(1, self.numacls // groups)
+
+    def estimate(self, strategy, chunk, hours):
+        """PlannedPull for the chunk covering the repo bytes of hours, split to fit"""
+
+        repo_bytes = sum(hours)
+        working = repo_bytes * self.history.ratio
+        groups = 1
+        if self.budget and working > self.budget:
+            strategy = 'split-sets'
+            groups = min(max(1, self.numacls), int(math.ceil(working / float(self.budget))))
+        pull = PlannedPull(strategy, chunk, groups, repo_bytes, working)
+        pull.seconds = groups * (PULL_OVERHEAD + repo_bytes / self.history.scan_rate) + \
+            working * self.passes(groups) / self.history.eval_rate
+        return pull
+
+    def plan_day(self, day, hours, first_hour=0):
+        """
+        Pick the day's strategy from the 24 hourly repo sizes, for the
+        hours from first_hour on (the first day's hour 0 is the first
+        hour pull)
+        """
+
+        estimates = [h * self.history.ratio for h in hours]
+        if not self.budget or sum(estimates[first_hour:]) <= self.budget:
+            chunk = day_chunk(day)
+            if first_hour:
+                chunk = day_part_chunk(day, first_hour, 23)
+            return DayPlan(day, 'anyset', [self.estimate('anyset', chunk, hours[first_hour:])])
+
+        pulls = list()
+        for (first, last) in pack_hours(estimates, self.budget, first_hour):
+            chunk = day_part_chunk(day, first, last)
+            pulls.append(self.estimate('hourly', chunk, hours[first:last + 1]))
+
+        strategy = 'hourly'
+        if [p for p in pulls if p.groups > 1]:
+            strategy = 'split-sets'
+        return DayPlan(day, strategy, pulls)
+
+    def for_day(self, day):
+        for dayplan in self.days:
+            if dayplan.day == day:
+                return dayplan
+        return None
+
+    def pulls(self):
+        ret = [self.first_hour]
+        for dayplan in self.days:
+            ret.extend(dayplan.pulls)
+        return ret
+
+    def num_chunks(self):
+        """Number of run_chunk calls for the first hour and the days"""
+
+        return sum([p.groups for p in self.pulls()])
+
+    def format(self):
+        """Return the plan and its estimated cost as a list of text lines"""
+
+        lines = list()
+        if self.budget:
+            lines.append("Plan for %d assessible ACL's, at most %d MB per working file" %
+                         (self.numacls, self.budget / MB))
+        else:
+            lines.append("Plan for %d assessible ACL's, no working file budget" % self.numacls)
+        if self.history.samples:
+            lines.append("Estimates from %d prior pulls: working file %.3f%% of the repo bytes" %
+                         (self.history.samples, self.history.ratio * 100))
+        else:
+            lines.append("No pull history, assuming working files are %.1f%% of the repo bytes" %
+                         (self.history.ratio * 100))
+
+        for pull in self.pulls():
+            lines.append("  %-16s %-10s %2d pull%s  repo %9.1f MB  working %8.1f MB  ~%ds" %
+                         (pull.chunk.label, pull.strategy, pull.groups,
+                          's' if pull.groups > 1 else ' ', pull.repo_bytes / MB,
+                          pull.working_bytes / pull.groups / MB, pull.seconds))
+
+        pulls = self.pulls()
+        largest = max([p.working_bytes / p.groups for p in pulls])
+        lines.append("Total: %d pulls reading %.1f MB from the repo, largest working file %.1f MB "
+                     "(~%d records), about %ds" %
+                     (self.num_chunks(), sum([p.repo_bytes * p.groups for p in pulls]) / MB,
+                      largest / MB, largest / self.history.record_bytes,
+                      sum([p.seconds for p in pulls])))
+        if self.budget and largest > self.budget:
+            lines.append("Some working files stay over the budget, an hour can't be split further")
+        lines.append("Upper bounds, pulls shrink as ACL's see traffic and retire")
+        return lines
+
+
+def plan_window(days, sizes, history, budget, numacls, engine):
+    """
+    Plan the first hour and day pulls for the list of datetime days,
+    given the (YYYYMMDD, hour) repo sizes from hour_sizes. The first
+    day is only pulled from hour 1 on, after the first hour pull.
+    """
+
+    plan = Plan(history, budget, numacls, engine)
+    for day in days:
+        myday = day.strftime("%Y%m%d")
+        hours = [sizes.get((myday, h), 0) for h in range(24)]
+        if plan.first_hour is None:
+            plan.first_hour = plan.estimate('first hour', hour_chunk(day, 0), hours[:1])
+            # the rest of the first day
+            plan.days.append(plan.plan_day(day, hours, 1))
+        else:
+            plan.days.append(plan.plan_day(day, hours))
+    return plan
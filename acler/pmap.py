@@ -0,0 +1,226 @@
+#!/usr/bin/python
+
+# Prefix map engine (acler.py --engine=pmap). Instead of an rwfilter and
+# rwuniq per ACL and direction, the ACL address blocks (and tcp/udp
+# ports) are labeled in SiLK prefix maps, one rwuniq over the working
+# file counts the records for each combination of source and dest
+# labels, protocol and type, and the rows are scattered back to the
+# ACL's they match, forward and reversed.
+#
+# Overlapping blocks can't share a label, so the blocks are cut into
+# disjoint ranges at every block boundary and each range gets its own
+# label. Each ACL block then covers a contiguous run of labels, and one
+# rwuniq answers every ACL, overlapping or not.
+
+from addresses import cidr_to_range, int_to_ip
+from protocols import port_range
+import bisect
+
+# label for everything outside the ACL blocks and ports
+NO_LABEL = 'none'
+
+# prefix map names, the rwuniq fields are src-<name> and dst-<name>
+ADDRESS_MAP = 'acladdr'
+PORT_MAP = 'aclport'
+
+
+class LabelMap(object):
+    """
+    Disjoint labeled ranges, cut from a list of possibly overlapping
+    (low, high) integer ranges at all of their boundaries.
+    """
+
+    def __init__(self, prefix, ranges):
+        self.prefix = prefix
+
+        # +1 where a range starts, -1 after it ends
+        events = dict()
+        for (low, high) in ranges:
+            events[low] = events.get(low, 0) + 1
+            events[high + 1] = events.get(high + 1, 0) - 1
+
+        self.intervals = list()
+        depth = 0
+        bounds = sorted(events)
+        for (i, bound) in enumerate(bounds):
+            depth += events[bound]
+            if depth > 0 and i + 1 < len(bounds):
+                self.intervals.append((bound, bounds[i + 1] - 1))
+        self.lows = [x[0] for x in self.intervals]
+
+    def span(self, myrange):
+        """Return the (first, last) label numbers covering one of the ranges"""
+
+        first = bisect.bisect_left(self.lows, myrange[0])
+        last = bisect.bisect_right(self.lows, myrange[1]) - 1
+        return (first, last)
+
+    def label(self, i):
+        return "%s%d" % (self.prefix, i)
+
+    def number(self, label):
+        """Label number for a label of this map, or None"""
+
+        if not label.startswith(self.prefix):
+            return None
+        return int(label[len(self.prefix):])
+
+
+def _in(number, span):
+    """Is the label number within the span, where None is any"""
+
+    if span is None:
+        return True
+    return number is not None and span[0] <= number <= span[1]
+
+
+class PmapEvaluator(object):
+    """
+    Builds the prefix map sources and rwuniq fields for a list of
+    AclerItems, and adds the rwuniq rows to the items they match.
+    """
+
+    def __init__(self, items):
+        self.items = items
+
+        blocks = list()
+        ports = dict()
+        for a in items:
+            for block in (a.sip, a.dip):
+                if block is not None:
+                    blocks.append(cidr_to_range(block))
+            for port in (a.sport, a.dport):
+                if port is not None:
+                    ports.setdefault(a.protocol, list()).append(port_range(port))
+
+        self.addresses = LabelMap('a', blocks)
+        self.ports = dict((proto, LabelMap("%dp" % proto, ranges))
+                          for (proto, ranges) in ports.items())
+
+        # (protocol, sip span, sport span, dip span, dport span) per
+        # item, with None for any
+        self.criteria = list()
+        for a in items:
+            sip = dip = sport = dport = None
+            if a.sip is not None:
+                sip = self.addresses.span(cidr_to_range(a.sip))
+            if a.dip is not None:
+                dip = self.addresses.span(cidr_to_range(a.dip))
+            if a.sport is not None:
+                sport = self.ports[a.protocol].span(port_range(a.sport))
+            if a.dport is not None:
+                dport = self.ports[a.protocol].span(port_range(a.dport))
+            self.criteria.append((a.protocol, sip, sport, dip, dport))
+
+    def address_pmap(self):
+        """rwpmapbuild input labeling the disjoint address ranges, or None"""
+
+        if not self.addresses.intervals:
+            return None
+        lines = ["map-name %s" % ADDRESS_MAP, "mode ipv4", "default %s" % NO_LABEL]
+        for (i, (low, high)) in enumerate(self.addresses.intervals):
+            lines.append("%s %s %s" % (int_to_ip(low), int_to_ip(high), self.addresses.label(i)))
+        return "\n".join(lines) + "\n"
+
+    def port_pmap(self):
+        """rwpmapbuild input labeling the disjoint protocol/port ranges, or None"""
+
+        if not self.ports:
+            return None
+        lines = ["map-name %s" % PORT_MAP, "mode proto-port", "default %s" % NO_LABEL]
+        for proto in sorted(self.ports):
+            labels = self.ports[proto]
+            for (i, (low, high)) in enumerate(labels.intervals):
+                lines.append("%d/%d %d/%d %s" % (proto, low, proto, high, labels.label(i)))
+        return "\n".join(lines) + "\n"
+
+    def pmaps(self):
+        """List of (map name, rwpmapbuild input) for the maps the ACL's need"""
+
+        return [(name, text) for (name, text) in ((ADDRESS_MAP, self.address_pmap()),
+                                                  (PORT_MAP, self.port_pmap()))
+                if text is not None]
+
+    def fields(self):
+        """The rwuniq key fields, in the order add_rows reads them"""
+
+        fields = list()
+        for (name, text) in self.pmaps():
+            fields.extend(["src-%s" % name, "dst-%s" % name])
+        fields.extend(['protocol', 'type'])
+        return fields
+
+    def _port_number(self, proto, label):
+        labels = self.ports.get(proto)
+        if labels is None:
+            return None
+        return labels.number(label)
+
+    def add_rows(self, lines):
+        """
+        Add the counts of the rwuniq output lines (fields, then records,
+        bytes and packets, | delimited) to the items they match, both
+        ways. Returns the number of rows read.
+        """
+
+        fields = self.fields()
+        rows = list()
+        by_src = dict()
+        by_dst = dict()
+        by_proto = dict()
+        for line in lines:
+            line = line.strip()
+            if line == '':
+                continue
+            values = line.split('|')
+            keys = dict(zip(fields, values))
+            src = keys.get("src-%s" % ADDRESS_MAP, NO_LABEL)
+            dst = keys.get("dst-%s" % ADDRESS_MAP, NO_LABEL)
+            sport = keys.get("src-%s" % PORT_MAP, NO_LABEL)
+            dport = keys.get("dst-%s" % PORT_MAP, NO_LABEL)
+            proto = int(keys['protocol'])
+            mytype = keys['type']
+            row = (self.addresses.number(src), self.addresses.number(dst),
+                   self._port_number(proto, sport), self._port_number(proto, dport),
+                   proto, mytype, [int(x) for x in values[-3:]])
+            rows.append(row)
+            by_src.setdefault(row[0], list()).append(row)
+            by_dst.setdefault(row[1], list()).append(row)
+            by_proto.setdefault(proto, list()).append(row)
+
+        for (a, criteria) in zip(self.items, self.criteria):
+            (proto, sip, sport, dip, dport) = criteria
+            self._scatter(a, 'F', proto, sip, sport, dip, dport, by_src, by_dst, by_proto)
+            self._scatter(a, 'R', proto, dip, dport, sip, sport, by_src, by_dst, by_proto)
+
+        return len(rows)
+
+    def _scatter(self, a, direction, proto, sip, sport, dip, dport, by_src, by_dst, by_proto):
+        """Add the rows matching one direction's criteria to the item"""
+
+        # only look at the rows that can match the narrowest side
+        if sip is not None:
+            candidates = list()
+            for i in range(sip[0], sip[1] + 1):
+                candidates.extend(by_src.get(i, []))
+        elif dip is not None:
+            candidates = list()
+            for i in range(dip[0], dip[1] + 1):
+                candidates.extend(by_dst.get(i, []))
+        else:
+            candidates = by_proto.get(proto, [])
+
+        totals = dict()
+        for row in candidates:
+            if proto is not None and row[4] != proto:
+                continue
+            if _in(row[0], sip) and _in(row[2], sport) and _in(row[1], dip) and _in(row[3], dport):
+                counts = totals.setdefault(row[5], [0, 0, 0])
+                for j in range(3):
+                    counts[j] += row[6][j]
+
+        for mytype in sorted(totals):
+            (myrecs, mybytes, mypackets) = totals[mytype]
+            a.add_track(mytype, direction + 'R', myrecs)
+            a.add_track(mytype, direction + 'B', mybytes)
+            a.add_track(mytype, direction + 'P', mypackets)
@@ -0,0 +1,193 @@
+#!/usr/bin/python
+
+# Progress, throughput and ETA tracking for a whole acler run. Reports
+# go out as periodic log lines and as a status JSON file, rewritten in
+# place, that other tools can poll to see whether a long run will
+# finish in time.
+
+import json
+import os
+import time
+
+from elapsed_time import elapsed_time
+
+
+def _howlong(seconds):
+    howlong = elapsed_time(int(seconds))
+    if '' == howlong.strip():
+        howlong = '0s'
+    return howlong
+
+
+def _rate(count, seconds):
+    if seconds <= 0:
+        return 0.0
+    return count / float(seconds)
+
+
+class ChunkStats(object):
+    """Just holding the numbers for one repo chunk"""
+
+    def __init__(self, label, acls):
+        self.label = label
+        self.acls_before = acls
+        self.acls_after = acls
+        self.started = time.time()
+        self.finished = None
+        self.pull_seconds = 0.0
+        self.pull_records = 0
+        self.pull_bytes = 0
+        self.scanned = 0
+
+    def to_dict(self):
+        return {'chunk': self.label, 'acls': self.acls_before,
+                'retired': self.acls_before - self.acls_after,
+                'pull_records': self.pull_records, 'pull_bytes': self.pull_bytes,
+                'pull_seconds': round(self.pull_seconds, 3), 'records_scanned': self.scanned,
+                'seconds': round((self.finished or time.time()) - self.started, 3)}
+
+
+class ProgressTracker(object):
+    """
+    Track ACL's remaining, ACL's retired per chunk, records scanned per
+    second, repo pull throughput and an ETA for the whole window.
+    """
+
+    def __init__(self, total_acls, total_chunks, status_file=None, interval=60, logger=None):
+        self.total_acls = total_acls
+        self.remaining = total_acls
+        self.total_chunks = total_chunks
+        self.status_file = status_file
+        self.interval = interval
+        self.logger = logger
+        self.started = time.time()
+        self.last_report = self.started
+        self.phase = 'starting'
+        self.chunks = list()
+        self.current = None
+        self.scanned = 0
+        self.pull_records = 0
+        self.pull_bytes = 0
+        self.pull_seconds = 0.0
+
+    def start_chunk(self, label, remaining):
+        self.remaining = remaining
+        self.current = ChunkStats(label, remaining)
+        self.chunks.append(self.current)
+        self.phase = 'pull'
+        self.report(force=True)
+
+    def pull_done(self, records, seconds, mybytes):
+        self.current.pull_records = records
+        self.current.pull_seconds = seconds
+        self.current.pull_bytes = mybytes
+        self.pull_records += records
+        self.pull_seconds += seconds
+        self.pull_bytes += mybytes
+        self.phase = 'evaluate'
+
+    def scanned_records(self, count):
+        """Called from the evaluation loops as records are checked"""
+        self.scanned += count
+        if self.current is not None:
+            self.current.scanned += count
+        self.report()
+
+    def end_chunk(self, remaining):
+        self.remaining = remaining
+        self.current.acls_after = remaining
+        self.current.finished = time.time()
+        self.phase = 'checkpoint'
+        if self.logger:
+            self.logger.info("Chunk %s retired %d ACL's in %s" %
+                             (self.current.label, self.current.acls_before - remaining,
+                              _howlong(self.current.finished - self.current.started)))
+        self.report(force=True)
+
+    def finish(self):
+        self.phase = 'done'
+        self.report(force=True)
+
+    def eta_seconds(self):
+        """Estimated seconds until the whole window is done"""
+
+        if self.phase == 'done':
+            return 0
+        done = [c for c in self.chunks if c.finished is not None]
+        if not done:
+            return None
+        if self.remaining == 0:
+            return 0
+        per_chunk = sum([c.finished - c.started for c in done]) / float(len(done))
+        left = (self.total_chunks - len(done)) * per_chunk
+        if self.current is not None and self.current.finished is None:
+            left -= time.time() - self.current.started
+        return max(0, left)
+
+    def status(self):
+        """Return the status as a dict"""
+
+        now = time.time()
+        elapsed = now - self.started
+        eta = self.eta_seconds()
+        done = len([c for c in self.chunks if c.finished is not None])
+
+        mystatus = {
+            'pid': os.getpid(),
+            'phase': self.phase,
+            'started': time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(self.started)),
+            'updated': time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(now)),
+            'elapsed_seconds': round(elapsed, 1),
+            'current_chunk': self.current.label if self.current else None,
+            'chunks_done': done,
+            'chunks_total': self.total_chunks,
+            'acls_total': self.total_acls,
+            'acls_remaining': self.remaining,
+            'records_scanned': self.scanned,
+            'records_scanned_per_second': round(_rate(self.scanned, elapsed), 1),
+            'pull_records_per_second': round(_rate(self.pull_records, self.pull_seconds), 1),
+            'pull_bytes_per_second': round(_rate(self.pull_bytes, self.pull_seconds), 1),
+            'eta_seconds': None if eta is None else round(eta, 1),
+            'eta': None if eta is None else
+                time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(now + eta)),
+            'chunks': [c.to_dict() for c in self.chunks],
+        }
+        return mystatus
+
+    def write_status(self, mystatus):
+        """Rewrite the status file, atomically so readers never see half a file"""
+
+        tmpfile = "%s.tmp" % self.status_file
+        with open(tmpfile, 'w') as f:
+            json.dump(mystatus, f, indent=1, sort_keys=True)
+        os.rename(tmpfile, self.status_file)
+
+    def report(self, force=False):
+        """Log a progress line and rewrite the status file, at most every interval seconds"""
+
+        now = time.time()
+        if not force and now - self.last_report < self.interval:
+            return
+        self.last_report = now
+
+        mystatus = self.status()
+
+        if self.status_file:
+            try:
+                self.write_status(mystatus)
+            except (IOError, OSError) as e:
+                if self.logger:
+                    self.logger.warning("Could not write status file %s: %s" % (self.status_file, e))
+
+        if self.logger:
+            if mystatus['eta_seconds'] is None:
+                eta = 'unknown'
+            else:
+                eta = "%s (%s)" % (_howlong(mystatus['eta_seconds']), mystatus['eta'])
+            self.logger.info("Progress: chunk %d/%d %s, %d of %d ACL's remaining, "
+                             "scanning %.0f recs/s, pulling %.0f recs/s %.1f MB/s, ETA %s" %
+                             (mystatus['chunks_done'], self.total_chunks,
+                              mystatus['current_chunk'] or '', self.remaining, self.total_acls,
+                              mystatus['records_scanned_per_second'],
+                              mystatus['pull_records_per_second'],
+                              mystatus['pull_bytes_per_second'] / (1024 * 1024), eta))
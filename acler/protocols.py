@@ -32,3 +32,28 @@ def proto2num(proto):
     else:
         msg = "Unknown protocol %s. Please add protocol to acler/protocols.py." % proto
         raise Exception(msg)
+
+
+# ports that get their own partition when splitting tcp/udp working
+# files, see acler/partitions.py
+well_known_ports = [20, 21, 22, 23, 25, 53, 67, 68, 69, 80, 88, 110, 123,
+                    135, 137, 138, 139, 143, 161, 162, 389, 443, 445, 514,
+                    636, 1433, 1521, 3306, 3389]
+
+
+def port_range(port):
+    """
+    Convert an acl port value (25 or 20-21) to a (low, high) tuple of ints.
+    """
+
+    port = str(port).strip()
+
+    if '-' in port:
+        (low, high) = [int(x) for x in port.split('-')]
+    else:
+        low = high = int(port)
+
+    if not (0 <= low <= high <= 65535):
+        raise ValueError("Invalid port or port range %s" % port)
+
+    return (low, high)
@@ -0,0 +1,323 @@
+#!/usr/bin/python
+
+# Optional SQLite results database. The parsed ACL's are stored once per
+# run, and each checkpoint appends only the per chunk, per type counters
+# that changed since the last one, in a single transaction, so the cost
+# of a checkpoint follows the number of ACL's that saw traffic in the
+# chunk and not the size of the ACL file. The CSV output is an export
+# of the database, and the per chunk history stays queryable after the
+# run, e.g. the first day an ACL saw traffic. It also keeps the actual
+# volume and timing of planned pulls, for the pull planner's estimates,
+# and which chunks each ACL was actually checked against, as held ACL's
+# (split sets, port-only pulls, windows) skip some.
+
+import csv
+import sqlite3
+import sys
+import time
+from datetime import datetime
+
+from acleritem import AclerItem
+from chunks import Chunk
+
+SCHEMA_VERSION = 1
+
+COUNTS = ('FR', 'FB', 'FP', 'RR', 'RB', 'RP')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    started TEXT,
+    infile TEXT,
+    infilecolumn INTEGER,
+    silkclass TEXT,
+    silktypes TEXT,
+    start TEXT,
+    end TEXT,
+    finished TEXT,
+    autonumber INTEGER DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS acls (
+    run INTEGER,
+    line TEXT,
+    acl TEXT,
+    parsed INTEGER,
+    assessible INTEGER,
+    error TEXT,
+    retired_chunk INTEGER,
+    PRIMARY KEY (run, line)
+);
+CREATE TABLE IF NOT EXISTS chunks (
+    id INTEGER PRIMARY KEY,
+    run INTEGER,
+    seq INTEGER,
+    kind TEXT,
+    day TEXT,
+    start TEXT,
+    end TEXT,
+    label TEXT,
+    finished TEXT
+);
+CREATE TABLE IF NOT EXISTS counters (
+    run INTEGER,
+    line TEXT,
+    chunk INTEGER,
+    type TEXT,
+    FR INTEGER, FB INTEGER, FP INTEGER,
+    RR INTEGER, RB INTEGER, RP INTEGER
+);
+CREATE TABLE IF NOT EXISTS checks (
+    run INTEGER,
+    line TEXT,
+    chunk INTEGER
+);
+CREATE TABLE IF NOT EXISTS pulls (
+    silkclass TEXT,
+    silktypes TEXT,
+    engine TEXT,
+    label TEXT,
+    repo_bytes INTEGER,
+    bytes INTEGER,
+    records INTEGER,
+    pull_seconds REAL,
+    eval_seconds REAL,
+    passes REAL,
+    finished TEXT
+);
+CREATE INDEX IF NOT EXISTS counters_line ON counters (run, line, chunk);
+CREATE INDEX IF NOT EXISTS chunks_run ON chunks (run, seq);
+CREATE INDEX IF NOT EXISTS checks_line ON checks (run, line, chunk);
+"""
+
+
+def _now():
+    return time.strftime("%Y-%m-%dT%H:%M:%S")
+
+
+class ResultsDB(object):
+    """
+    SQLite store for the ACL's and per chunk counters of acler runs.
+    Several runs can share one database file.
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.conn = sqlite3.connect(filename)
+        # lines already marked as retired in this run
+        self.retired = set()
+        self.run = None
+        self.seq = 0
+
+        # a schema version this code can't use
+        schema = None
+        with self.conn:
+            self.conn.executescript(SCHEMA)
+            row = self.conn.execute("SELECT value FROM meta WHERE key = 'schema'").fetchone()
+            if row is None:
+                self.conn.execute("INSERT INTO meta (key, value) VALUES ('schema', ?)",
+                                  (str(SCHEMA_VERSION),))
+            elif int(row[0]) != SCHEMA_VERSION:
+                schema = row[0]
+
+        if schema is not None:
+            self.conn.close()
+            raise ValueError("Results db %s is schema version %s, expected %d" %
+                             (filename, schema, SCHEMA_VERSION))
+
+    def close(self):
+        self.conn.close()
+
+    def start_run(self, aclers, infile, infilecolumn, silkclass, silktypes, start, end,
+                  autonumber=False):
+        """Store the run info and the parsed ACL's once. Returns the run id."""
+
+        with self.conn:
+            cur = self.conn.execute(
+                "INSERT INTO runs (started, infile, infilecolumn, silkclass, silktypes, start, end, "
+                "autonumber) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (_now(), infile, infilecolumn, silkclass, silktypes, start, end, int(bool(autonumber))))
+            self.run = cur.lastrowid
+            self.conn.executemany(
+                "INSERT INTO acls (run, line, acl, parsed, assessible, error) VALUES (?, ?, ?, ?, ?, ?)",
+                [(self.run, a.line, a.acl, int(a.parsed), int(bool(a.assess())), a.error)
+                 for a in aclers])
+        return self.run
+
+    def checkpoint(self, chunk, aclers):
+        """
+        Append the counters added since the last checkpoint and the ACL's
+        checked against the chunk, and mark the ACL's that saw traffic as
+        retired in this chunk. Returns the number of ACL's with counters.
+        """
+
+        self.seq += 1
+        changed = 0
+
+        with self.conn:
+            cur = self.conn.execute(
+                "INSERT INTO chunks (run, seq, kind, day, start, end, label, finished) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (self.run, self.seq, chunk.kind, chunk.day.strftime("%Y%m%d"),
+                 chunk.start, chunk.end, chunk.label, _now()))
+            chunkid = cur.lastrowid
+
+            rows = list()
+            retired = list()
+            checks = list()
+            for a in aclers:
+                if a.chunks_checked and a.chunks_checked[-1] is chunk:
+                    checks.append((self.run, a.line, chunkid))
+                pending = a.pop_pending()
+                if not pending:
+                    continue
+                changed += 1
+                for typename in sorted(pending):
+                    counts = pending[typename]
+                    rows.append([self.run, a.line, chunkid, typename] + [counts[c] for c in COUNTS])
+                if a.line not in self.retired and a.has_records():
+                    self.retired.add(a.line)
+                    retired.append((chunkid, self.run, a.line))
+
+            self.conn.executemany("INSERT INTO counters VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+            self.conn.executemany("INSERT INTO checks VALUES (?, ?, ?)", checks)
+            self.conn.executemany("UPDATE acls SET retired_chunk = ? WHERE run = ? AND line = ?",
+                                  retired)
+
+        return changed
+
+    def finish_run(self):
+        with self.conn:
+            self.conn.execute("UPDATE runs SET finished = ? WHERE id = ?", (_now(), self.run))
+
+    def last_run(self):
+        row = self.conn.execute("SELECT max(id) FROM runs").fetchone()
+        return row[0]
+
+    def get_run(self, run):
+        """Return the runs row for a run id as a dict"""
+
+        cur = self.conn.execute("SELECT * FROM runs WHERE id = ?", (run,))
+        row = cur.fetchone()
+        if row is None:
+            raise ValueError("No run %s in results db %s" % (run, self.filename))
+        return dict(zip([d[0] for d in cur.description], row))
+
+    def load_aclers(self, run):
+        """
+        Rebuild the run's AclerItems from the database, with their
+        chunks checked and summed counters, for exporting.
+        """
+
+        chunks = dict()
+        for (chunkid, kind, day, start, end, label) in self.conn.execute(
+                "SELECT id, kind, day, start, end, label FROM chunks WHERE run = ?", (run,)):
+            chunks[chunkid] = Chunk(kind, datetime.strptime(day, "%Y%m%d"), start, end, label)
+
+        items = dict()
+        for (line, acl, parsed, assessible, error) in self.conn.execute(
+                "SELECT line, acl, parsed, assessible, error FROM acls WHERE run = ?", (run,)):
+            a = AclerItem(acl)
+            a.line = line
+            a.parsed = bool(parsed)
+            a.assessible = bool(assessible)
+            a.error = error
+            items[line] = a
+
+        for (line, chunkid) in self.conn.execute(
+                "SELECT k.line, k.chunk FROM checks k JOIN chunks c ON c.id = k.chunk "
+                "WHERE k.run = ? ORDER BY c.seq", (run,)):
+            items[line].add_check(chunks[chunkid])
+
+        for row in self.conn.execute(
+                "SELECT line, type, sum(FR), sum(FB), sum(FP), sum(RR), sum(RB), sum(RP) "
+                "FROM counters WHERE run = ? GROUP BY line, type", (run,)):
+            a = items[row[0]]
+            for (name, count) in zip(COUNTS, row[2:]):
+                a.add_track(row[1], name, count)
+
+        for a in items.values():
+            a.pop_pending()
+
+        return items
+
+    def export_csv(self, run, outfile):
+        """
+        Write the run's results CSV: the input file rows prefixed with
+        the results for each line, as acler's checkpoints write them.
+        """
+
+        items = self.load_aclers(run)
+        myrun = self.get_run(run)
+
+        with open(myrun['infile'], 'rb') as rf:
+            with open(outfile, 'wb') as wf:
+                writer = csv.writer(wf)
+                for (i, v) in enumerate(csv.reader(rf)):
+                    if myrun['autonumber']:
+                        writer.writerow(items[str(i + 1)].get_csv_out_prefix() + v)
+                    else:
+                        writer.writerow(items[v[0].strip()].get_csv_out_prefix() + v[1:])
+
+    def add_pull(self, silkclass, silktypes, engine, label, repo_bytes, mybytes, records,
+                 pull_seconds, eval_seconds, passes):
+        """Save the actual volume and timing of a planned pull for later plans"""
+
+        with self.conn:
+            self.conn.execute("INSERT INTO pulls VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                              (silkclass, silktypes, engine, label, repo_bytes, mybytes, records,
+                               pull_seconds, eval_seconds, passes, _now()))
+
+    def pull_history(self, silkclass, silktypes, engine, limit=50):
+        """
+        Return the most recent pulls for the class, types and engine as
+        (repo bytes, bytes, records, pull seconds, eval seconds, passes).
+        """
+
+        return self.conn.execute(
+            "SELECT repo_bytes, bytes, records, pull_seconds, eval_seconds, passes FROM pulls "
+            "WHERE silkclass = ? AND silktypes = ? AND engine = ? ORDER BY rowid DESC LIMIT ?",
+            (silkclass, silktypes, engine, limit)).fetchall()
+
+    def first_traffic(self, run, line=None):
+        """
+        Return a list of (line, chunk label) for the chunk each ACL first
+        saw traffic in, for one line or all lines that saw traffic.
+        """
+
+        query = "SELECT a.line, c.label FROM acls a JOIN chunks c ON c.id = a.retired_chunk " \
+                "WHERE a.run = ?"
+        params = [run]
+        if line is not None:
+            query += " AND a.line = ?"
+            params.append(line)
+        return self.conn.execute(query, params).fetchall()
+
+
+if __name__ == '__main__':
+    # history queries against a results db, run defaults to the latest
+    # python acler/resultsdb.py results.db first-traffic [line] [run]
+    # python acler/resultsdb.py results.db export outfile.csv [run]
+    db = ResultsDB(sys.argv[1])
+    command = sys.argv[2]
+    if command == 'first-traffic':
+        line = None
+        if len(sys.argv) > 3:
+            line = sys.argv[3]
+        run = db.last_run()
+        if len(sys.argv) > 4:
+            run = int(sys.argv[4])
+        for (line, label) in db.first_traffic(run, line):
+            print("%s,%s" % (line, label))
+    elif command == 'export':
+        run = db.last_run()
+        if len(sys.argv) > 4:
+            run = int(sys.argv[4])
+        db.export_csv(run, sys.argv[3])
+    else:
+        print("Unknown command %s, use first-traffic or export" % command)
+        sys.exit(1)
+    db.close()
@@ -0,0 +1,91 @@
+#!/usr/bin/python
+
+# Sampling pre-pass support. Instead of only checking the first hour
+# of the first day for huge, constant talkers, pull a handful of short,
+# spaced time slices across the whole window with a tight record cap.
+# Any ACL that shows traffic in a slice can be retired before the
+# (much more expensive) day by day pulls begin.
+
+from datetime import datetime, timedelta
+from chunks import Chunk, SAMPLE
+
+DATE_FORMAT = "%Y/%m/%d"
+
+SAMPLE_ORDERS = ('spread', 'chronological', 'newest')
+
+
+class SampleSlice(Chunk):
+    """Chunk covering a few minutes of one repo hour"""
+
+    def __init__(self, begin, minutes):
+        # datetime of the first second of the slice
+        self.begin = begin
+        self.minutes = minutes
+        myhour = begin.strftime("%Y/%m/%d:%H")
+        label = "%sT%s+%dm" % (begin.strftime("%Y%m%d"), begin.strftime("%H%M"), minutes)
+        day = datetime(begin.year, begin.month, begin.day)
+        Chunk.__init__(self, SAMPLE, day, myhour, myhour, label,
+                       ["--stime=%s" % self.get_stime()])
+
+    def get_stime(self):
+        """rwfilter --stime range limiting records to the slice"""
+        last = self.begin + timedelta(minutes=self.minutes) - timedelta(seconds=1)
+        return "%s-%s" % (self.begin.strftime("%Y/%m/%d:%H:%M:%S"),
+                          last.strftime("%Y/%m/%d:%H:%M:%S"))
+
+
+def spread_order(count):
+    """
+    Return the indexes 0..count-1 ordered so that each prefix of the
+    list is spread as evenly as possible across the whole range
+    (van der Corput / bit reversed order). Example for 8: 0 4 2 6 1 5 3 7
+    """
+
+    bits = 0
+    while (1 << bits) < count:
+        bits += 1
+
+    def bit_reversed(i):
+        r = 0
+        for b in range(bits):
+            if i & (1 << b):
+                r |= 1 << (bits - 1 - b)
+        return r
+
+    return sorted(range(count), key=bit_reversed)
+
+
+def build_sample_slices(start, end, every_hours, minutes, order='spread'):
+    """
+    Build the list of SampleSlice items for the YYYY/MM/DD start and end
+    dates (inclusive), one slice of minutes length every every_hours hours.
+    Slices never cross an hour boundary so that each one only reads
+    a single hour of repo files.
+    """
+
+    if every_hours < 1:
+        raise ValueError("Sample interval must be at least one hour")
+
+    if not 1 <= minutes <= 60:
+        raise ValueError("Sample slice length must be 1-60 minutes")
+
+    if order not in SAMPLE_ORDERS:
+        raise ValueError("Unknown sample order %s, must be one of %s" %
+                         (order, ', '.join(SAMPLE_ORDERS)))
+
+    mystart = datetime.strptime(start, DATE_FORMAT)
+    myend = datetime.strptime(end, DATE_FORMAT) + timedelta(days=1)
+    delta = timedelta(hours=every_hours)
+
+    slices = list()
+    mybegin = mystart
+    while mybegin < myend:
+        slices.append(SampleSlice(mybegin, minutes))
+        mybegin += delta
+
+    if order == 'newest':
+        slices.reverse()
+    elif order == 'spread':
+        slices = [slices[i] for i in spread_order(len(slices))]
+
+    return slices
@@ -0,0 +1,487 @@
+#!/usr/bin/python
+
+# Native reader for the uncompressed SiLK flow record formats acler's
+# rwfilter working files use. The file is memory mapped and the records
+# are unpacked in large chunks straight into per-field arrays, without
+# creating a Python RWRec object per flow the way iterating
+# silk.SilkFile does. If numpy happens to be installed, chunks are
+# zero-copy numpy structured array views instead.
+#
+# Anything else (compressed files, other formats or record versions)
+# falls back to reading the file with PySiLK, so callers always get the
+# same RecordChunk columns either way.
+#
+# Run this module against a working file to cross-check its field
+# values against PySiLK:
+#   python acler/silkreader.py /path/to/working.rwf
+
+import array
+import mmap
+import os
+import struct
+import sys
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+SILK_MAGIC = 0xDEADBEEF
+# magic, flags, format, file version, compression, silk version,
+# record size, record version
+GENERIC_HEADER = struct.Struct('>IBBBBIHH')
+HEADER_ENTRY = struct.Struct('>II')
+# file versions 16 and up have variable length header entries
+MIN_FILE_VERSION = 16
+
+FT_RWIPV6ROUTING = 0x0C
+FT_RWGENERIC = 0x16
+
+# tcp_state bit marking an ipv6 record
+IPV6_FLAG = 0x80
+
+# columns every RecordChunk has
+FIELDS = ('stime', 'elapsed', 'sport', 'dport', 'proto', 'flowtype', 'sensor',
+          'packets', 'bytes', 'sip', 'dip')
+
+# (format, record version): (record size, struct format, field names)
+# all records start with the same 40 bytes:
+#   int64 sTime(ms), uint32 elapsed, uint16 sPort, uint16 dPort,
+#   uint8 proto, uint8 flow_type, uint16 sID, uint8 flags,
+#   uint8 init_flags, uint8 rest_flags, uint8 tcp_state,
+#   uint16 application, uint16 memo, uint16 input, uint16 output,
+#   uint32 pkts, uint32 bytes
+RECORD_LAYOUTS = {
+    # then uint32 sIP, uint32 dIP, uint32 nhIP
+    (FT_RWGENERIC, 5): (52, 'qIHHBBH12xIIII4x',
+                        ('stime', 'elapsed', 'sport', 'dport', 'proto', 'flowtype',
+                         'sensor', 'packets', 'bytes', 'sip', 'dip')),
+    # then uint8[16] sIP, dIP, nhIP, always in network byte order
+    (FT_RWIPV6ROUTING, 1): (88, 'qIHHBBH3xB8xII48x',
+                            ('stime', 'elapsed', 'sport', 'dport', 'proto', 'flowtype',
+                             'sensor', 'tcpstate', 'packets', 'bytes')),
+}
+
+# the 16 byte addresses as (high 64 bits, next 32 bits, ipv4 32 bits)
+IPV6_ADDRESSES = '40xQIIQII16x'
+
+# records unpacked per chunk
+CHUNK_RECORDS = 65536
+
+# bytes read to parse the header when the file isn't memory mapped
+HEADER_READ = 1 << 20
+
+
+class UnsupportedSilkFile(Exception):
+    pass
+
+
+def _typecode(size):
+    """array module typecode holding ints of size bytes"""
+
+    for code in ('B', 'H', 'I', 'L', 'Q'):
+        try:
+            if array.array(code).itemsize == size:
+                return code
+        except ValueError:
+            pass
+    raise ValueError("No array typecode for %d byte integers" % size)
+
+
+FIELD_TYPECODES = {
+    'stime': _typecode(8).lower(), 'elapsed': _typecode(4), 'sport': 'H', 'dport': 'H',
+    'proto': 'B', 'flowtype': 'B', 'sensor': 'H', 'packets': _typecode(4),
+    'bytes': _typecode(4), 'sip': _typecode(4), 'dip': _typecode(4),
+}
+
+
+def silk_conf_file():
+    """Find the silk.conf the same way the SiLK tools do"""
+
+    if os.environ.get('SILK_CONFIG_FILE'):
+        return os.environ['SILK_CONFIG_FILE']
+    if os.environ.get('SILK_DATA_ROOTDIR'):
+        return os.path.join(os.environ['SILK_DATA_ROOTDIR'], 'silk.conf')
+    return '/data/silk.conf'
+
+
+def load_flowtype_names(silkconf=None):
+    """
+    Return a dict of flowtype id to type name from the
+    "type <id> <name>" lines of silk.conf
+    """
+
+    if silkconf is None:
+        silkconf = silk_conf_file()
+
+    names = dict()
+    if not os.path.exists(silkconf):
+        return names
+
+    with open(silkconf, 'r') as f:
+        for line in f:
+            parts = line.split('#')[0].split()
+            if len(parts) >= 3 and parts[0] == 'type':
+                try:
+                    names[int(parts[1])] = parts[2]
+                except ValueError:
+                    pass
+    return names
+
+
+class SilkHeader(object):
+    """Just holding the header values the reader needs"""
+
+    def __init__(self, mm):
+        if len(mm) < GENERIC_HEADER.size:
+            raise UnsupportedSilkFile("File too short for a SiLK header")
+
+        (magic, flags, fmt, version, comp, silkver, recsize, recver) = \
+            GENERIC_HEADER.unpack_from(mm, 0)
+
+        if magic != SILK_MAGIC:
+            raise UnsupportedSilkFile("Not a SiLK file")
+
+        self.big_endian = bool(flags & 0x01)
+        if not self.big_endian:
+            # header values after the magic are in the file's byte order
+            (magic, flags, fmt, version, comp, silkver, recsize, recver) = \
+                struct.unpack_from('<IBBBBIHH', mm, 0)
+
+        self.format = fmt
+        self.file_version = version
+        self.compression = comp
+        self.record_size = recsize
+        self.record_version = recver
+
+        if version < MIN_FILE_VERSION:
+            raise UnsupportedSilkFile("SiLK file version %d not supported" % version)
+
+        # walk the header entries to the end marker, entry id 0
+        offset = GENERIC_HEADER.size
+        while True:
+            if offset + HEADER_ENTRY.size > len(mm):
+                raise UnsupportedSilkFile("SiLK header entries run past the end of file")
+            (entry_id, entry_len) = HEADER_ENTRY.unpack_from(mm, offset)
+            if entry_len < HEADER_ENTRY.size:
+                raise UnsupportedSilkFile("Bad SiLK header entry length %d" % entry_len)
+            offset += entry_len
+            if entry_id == 0:
+                break
+        self.length = offset
+
+
+class RecordChunk(object):
+    """
+    One chunk of records as per-field columns (array.array, or numpy
+    arrays when numpy is available), see FIELDS for the names.
+    """
+
+    def __init__(self, count, columns):
+        self.count = count
+        for name in FIELDS:
+            setattr(self, name, columns[name])
+
+    def __len__(self):
+        return self.count
+
+
+class SilkFlowReader(object):
+    """
+    Read a SiLK flow file as RecordChunks. native is True when the file
+    is read directly, False when PySiLK is used instead. The file is
+    memory mapped unless mapped is False, in which case each chunk is
+    read into its own buffer so resident memory stays bounded by the
+    chunk size no matter how big the file is.
+    type_names maps the flowtype ids in the chunks to SiLK type names.
+    """
+
+    def __init__(self, filename, chunk_records=CHUNK_RECORDS, silkconf=None, force_silk=False,
+                 mapped=True):
+        self.filename = filename
+        self.chunk_records = chunk_records
+        self.mapped = mapped
+        self.native = False
+        self.unsupported = None
+        self.skipped = 0
+        self.type_names = dict()
+        self._f = None
+        self._mm = None
+
+        if force_silk:
+            self.unsupported = 'PySiLK reader requested'
+            return
+
+        try:
+            self._open_native()
+            self.type_names = load_flowtype_names(silkconf)
+        except UnsupportedSilkFile as e:
+            self.unsupported = str(e)
+            self.close()
+
+    def _open_native(self):
+        self._f = open(self.filename, 'rb')
+        if os.path.getsize(self.filename) == 0:
+            raise UnsupportedSilkFile("Empty file")
+        if self.mapped:
+            self._mm = mmap.mmap(self._f.fileno(), 0, access=mmap.ACCESS_READ)
+            self.header = SilkHeader(self._mm)
+        else:
+            self.header = SilkHeader(self._f.read(HEADER_READ))
+
+        if self.header.compression != 0:
+            raise UnsupportedSilkFile("Compressed SiLK files not supported")
+
+        key = (self.header.format, self.header.record_version)
+        if key not in RECORD_LAYOUTS:
+            raise UnsupportedSilkFile("SiLK format 0x%02x version %d not supported" % key)
+
+        (self.record_size, self.record_format, self.record_fields) = RECORD_LAYOUTS[key]
+        if self.header.record_size != self.record_size:
+            raise UnsupportedSilkFile("Unexpected record size %d for format 0x%02x" %
+                                      (self.header.record_size, self.header.format))
+
+        if self.header.big_endian:
+            self.endian = '>'
+        else:
+            self.endian = '<'
+        filesize = os.path.getsize(self.filename)
+        self.record_count = (filesize - self.header.length) // self.record_size
+        self.native = True
+
+    def close(self):
+        if self._mm is not None:
+            try:
+                self._mm.close()
+            except BufferError:
+                # a caller still holds numpy views of the records, the
+                # map is unmapped once they are gone
+                pass
+            self._mm = None
+        if self._f is not None:
+            self._f.close()
+            self._f = None
+
+    def chunks(self):
+        """Yield RecordChunks of up to chunk_records records"""
+
+        if not self.native:
+            for chunk in self._silk_chunks():
+                yield chunk
+            return
+
+        start = 0
+        while start < self.record_count:
+            count = min(self.chunk_records, self.record_count - start)
+            offset = self.header.length + start * self.record_size
+            (buf, offset) = self._chunk_buffer(offset, count)
+            if numpy is not None:
+                chunk = self._numpy_chunk(buf, offset, count)
+            else:
+                chunk = self._struct_chunk(buf, offset, count)
+            start += count
+            if chunk.count:
+                yield chunk
+
+    def _chunk_buffer(self, offset, count):
+        """Return the (buffer, offset in buffer) holding count records"""
+
+        if self.mapped:
+            return (self._mm, offset)
+        self._f.seek(offset)
+        return (self._f.read(count * self.record_size), 0)
+
+    def _struct_chunk(self, buf, offset, count):
+        """Unpack count records in one struct call per chunk"""
+
+        fmt = self.record_format
+        nfields = len(self.record_fields)
+        flat = struct.unpack_from("%s%s" % (self.endian, fmt * count), buf, offset)
+
+        columns = dict()
+        for i, name in enumerate(self.record_fields):
+            columns[name] = flat[i::nfields]
+        del flat
+
+        if self.header.format == FT_RWIPV6ROUTING:
+            self._struct_addresses(buf, offset, count, columns)
+
+        return RecordChunk(len(columns['sip']), dict(
+            (name, array.array(FIELD_TYPECODES[name], columns[name])) for name in FIELDS))
+
+    def _struct_addresses(self, buf, offset, count, columns):
+        """Pull ipv4 sip/dip out of the 16 byte ipv6 routing addresses"""
+
+        flat = struct.unpack_from(">%s" % (IPV6_ADDRESSES * count), buf, offset)
+        columns['sip'] = flat[2::6]
+        columns['dip'] = flat[5::6]
+
+        # ipv4 records are stored ipv4-mapped; drop any ipv6 record whose
+        # addresses don't map back to ipv4
+        if [x for x in set(columns['tcpstate']) if x & IPV6_FLAG]:
+            keep = list()
+            for i in range(count):
+                if not columns['tcpstate'][i] & IPV6_FLAG:
+                    keep.append(i)
+                elif flat[i * 6] == 0 and flat[i * 6 + 1] == 0xFFFF and \
+                        flat[i * 6 + 3] == 0 and flat[i * 6 + 4] == 0xFFFF:
+                    keep.append(i)
+            if len(keep) != count:
+                self.skipped += count - len(keep)
+                for name in FIELDS:
+                    mycol = columns[name]
+                    columns[name] = [mycol[i] for i in keep]
+
+    def _numpy_dtype(self):
+        e = self.endian
+        if self.header.format == FT_RWGENERIC:
+            return numpy.dtype([('stime', e + 'i8'), ('elapsed', e + 'u4'), ('sport', e + 'u2'),
+                                ('dport', e + 'u2'), ('proto', 'u1'), ('flowtype', 'u1'),
+                                ('sensor', e + 'u2'), ('_skip1', 'V12'), ('packets', e + 'u4'),
+                                ('bytes', e + 'u4'), ('sip', e + 'u4'), ('dip', e + 'u4'),
+                                ('_skip2', 'V4')])
+        else:
+            return numpy.dtype([('stime', e + 'i8'), ('elapsed', e + 'u4'), ('sport', e + 'u2'),
+                                ('dport', e + 'u2'), ('proto', 'u1'), ('flowtype', 'u1'),
+                                ('sensor', e + 'u2'), ('_skip1', 'V3'), ('tcpstate', 'u1'),
+                                ('_skip2', 'V8'), ('packets', e + 'u4'), ('bytes', e + 'u4'),
+                                ('sip_high', '>u8'), ('sip_mid', '>u4'), ('sip', '>u4'),
+                                ('dip_high', '>u8'), ('dip_mid', '>u4'), ('dip', '>u4'),
+                                ('_skip3', 'V16')])
+
+    def _numpy_chunk(self, buf, offset, count):
+        """Zero-copy structured array view of count records"""
+
+        records = numpy.frombuffer(buf, dtype=self._numpy_dtype(), count=count, offset=offset)
+
+        if self.header.format == FT_RWIPV6ROUTING:
+            ipv6 = (records['tcpstate'] & IPV6_FLAG) != 0
+            if ipv6.any():
+                mapped = (records['sip_high'] == 0) & (records['sip_mid'] == 0xFFFF) & \
+                         (records['dip_high'] == 0) & (records['dip_mid'] == 0xFFFF)
+                keep = ~ipv6 | mapped
+                self.skipped += int(count - keep.sum())
+                records = records[keep]
+
+        return RecordChunk(len(records), dict((name, records[name]) for name in FIELDS))
+
+    def _silk_chunks(self):
+        """Fallback: read the file with PySiLK into the same columns"""
+
+        import silk
+
+        flowtypes = dict()
+
+        def new_columns():
+            return dict((name, array.array(FIELD_TYPECODES[name])) for name in FIELDS)
+
+        columns = new_columns()
+        count = 0
+        for rec in silk.SilkFile(self.filename, silk.READ):
+            sip = rec.sip
+            dip = rec.dip
+            if sip.is_ipv6():
+                sip = sip.to_ipv4()
+            if dip.is_ipv6():
+                dip = dip.to_ipv4()
+            if sip is None or dip is None:
+                self.skipped += 1
+                continue
+
+            typename = rec.classtype[1]
+            if typename not in flowtypes:
+                flowtypes[typename] = len(flowtypes)
+                self.type_names[flowtypes[typename]] = typename
+
+            columns['stime'].append(int(rec.stime_epoch_secs * 1000))
+            columns['elapsed'].append(int(rec.duration_secs * 1000))
+            columns['sport'].append(rec.sport)
+            columns['dport'].append(rec.dport)
+            columns['proto'].append(rec.protocol)
+            columns['flowtype'].append(flowtypes[typename])
+            columns['sensor'].append(0)
+            columns['packets'].append(rec.packets)
+            columns['bytes'].append(rec.bytes)
+            columns['sip'].append(int(sip))
+            columns['dip'].append(int(dip))
+            count += 1
+
+            if count == self.chunk_records:
+                yield RecordChunk(count, columns)
+                columns = new_columns()
+                count = 0
+
+        if count:
+            yield RecordChunk(count, columns)
+
+
+def read_records(filename, chunk_records=CHUNK_RECORDS, silkconf=None):
+    """
+    Yield (sip, dip, sport, dport, proto, bytes, packets, typename)
+    tuples, the record format acler.columnar builds caches from. Without
+    silk.conf type names the file is read with PySiLK, like the inprocess
+    engine does, so the type names match the --types.
+    """
+
+    reader = SilkFlowReader(filename, chunk_records, silkconf)
+    if reader.native and not reader.type_names:
+        reader.close()
+        reader = SilkFlowReader(filename, chunk_records, force_silk=True)
+    chunks = reader.chunks()
+    try:
+        for chunk in chunks:
+            names = [reader.type_names.get(int(x), str(x)) for x in chunk.flowtype]
+            for rec in zip(chunk.sip, chunk.dip, chunk.sport, chunk.dport, chunk.proto,
+                           chunk.bytes, chunk.packets, names):
+                yield rec
+    finally:
+        # numpy chunks are views of the map, which can't be closed
+        # while any of them is alive
+        chunk = rec = None
+        chunks.close()
+        reader.close()
+
+
+def cross_check(filename, silkconf=None):
+    """
+    Compare the native reader's field values to PySiLK's for the same
+    file. Returns the number of mismatched records.
+    """
+
+    native = SilkFlowReader(filename, silkconf=silkconf)
+    if not native.native:
+        print("Native reader does not support %s (%s), nothing to compare" %
+              (filename, native.unsupported))
+        return 0
+
+    pysilk = SilkFlowReader(filename, force_silk=True)
+
+    def rows(reader):
+        for chunk in reader.chunks():
+            for i in range(chunk.count):
+                yield (int(chunk.sip[i]), int(chunk.dip[i]), int(chunk.sport[i]),
+                       int(chunk.dport[i]), int(chunk.proto[i]), int(chunk.packets[i]),
+                       int(chunk.bytes[i]), int(chunk.stime[i]) // 1000,
+                       reader.type_names.get(int(chunk.flowtype[i])))
+
+    mismatches = 0
+    count = 0
+    (nativerows, pysilkrows) = (rows(native), rows(pysilk))
+    for (a, b) in zip(nativerows, pysilkrows):
+        count += 1
+        if a != b:
+            mismatches += 1
+            if mismatches <= 10:
+                print("Record %d differs: native %s, PySiLK %s" % (count, a, b))
+
+    # release the last chunks' views before unmapping
+    nativerows.close()
+    pysilkrows.close()
+    native.close()
+    pysilk.close()
+    print("Compared %d records, %d mismatches" % (count, mismatches))
+    return mismatches
+
+
+if __name__ == '__main__':
+    sys.exit(min(cross_check(sys.argv[1]), 1))
@@ -0,0 +1,154 @@
+#!/usr/bin/python
+
+# Persistent per-ACL state for rolling incremental runs (acler.py
+# --state-file), e.g. nightly from cron. Each ACL line keeps its
+# normalized criteria, the days checked so far, the last day it saw
+# traffic, and cumulative counters, so a run only has to pull the days
+# that became available since the last one, and only for ACL's that
+# haven't seen traffic within the horizon. A changed criteria key (the
+# verdict cache's, so rewriting a line for the same traffic keeps it)
+# means the line was edited and its history starts over.
+#
+# The state is a small JSON file, rewritten atomically at each save.
+
+import json
+import os
+from datetime import datetime, timedelta
+
+from chunks import DAY
+from resultsdb import COUNTS
+from verdictcache import criteria_key, types_key
+
+STATE_VERSION = 1
+DAY_FORMAT = "%Y%m%d"
+
+
+def _day(mystring):
+    if mystring is None:
+        return None
+    return datetime.strptime(mystring, DAY_FORMAT)
+
+
+def _daystring(day):
+    return day.strftime(DAY_FORMAT)
+
+
+def _new_entry(acler):
+    return {'key': criteria_key(acler), 'acl': acler.acl, 'days_checked': 0,
+            'checked_through': None, 'last_seen': None, 'track': dict()}
+
+
+class RollingState(object):
+    """
+    Per ACL line state kept between runs. Entries are dicts of key,
+    acl, days_checked, checked_through and last_seen (YYYYMMDD) and a
+    cumulative track dict like AclerItem.track.
+    """
+
+    def __init__(self, filename, silkclass, silktypes):
+        self.filename = filename
+        self.silkclass = silkclass
+        self.silktypes = types_key(silktypes)
+        self.acls = dict()
+        # entries as they were at the start of this run
+        self.base = dict()
+
+        if os.path.exists(filename):
+            with open(filename, 'r') as f:
+                state = json.load(f)
+            if state.get('version') != STATE_VERSION:
+                raise ValueError("State file %s is version %s, expected %d" %
+                                 (filename, state.get('version'), STATE_VERSION))
+            if state.get('class') != silkclass or types_key(state.get('types') or '') != self.silktypes:
+                raise ValueError("State file %s was built for class %s types %s" %
+                                 (filename, state.get('class'), state.get('types')))
+            self.acls = state['acls']
+
+    def reconcile(self, aclers):
+        """
+        Match the parsed ACL's to their entries, starting new entries for
+        added or edited lines and dropping removed or unassessible ones.
+        Returns the (added, edited, removed) counts.
+        """
+
+        added = edited = 0
+        acls = dict()
+        for a in aclers:
+            if not a.assess():
+                continue
+            entry = self.acls.get(a.line)
+            if entry is None:
+                added += 1
+                entry = _new_entry(a)
+            elif entry['key'] != criteria_key(a):
+                edited += 1
+                entry = _new_entry(a)
+            acls[a.line] = entry
+
+        removed = len([x for x in self.acls if x not in acls])
+        self.acls = acls
+        self.base = json.loads(json.dumps(acls))
+        return (added, edited, removed)
+
+    def is_active(self, line, horizon_start):
+        """True if the line saw traffic on or after the horizon start day"""
+
+        last_seen = _day(self.acls[line]['last_seen'])
+        return last_seen is not None and last_seen >= horizon_start
+
+    def check_from(self, line, horizon_start):
+        """First day the line still needs to be checked for"""
+
+        checked_through = _day(self.acls[line]['checked_through'])
+        if checked_through is None:
+            return horizon_start
+        return max(horizon_start, checked_through + timedelta(days=1))
+
+    def update(self, acler):
+        """
+        Fold this run's chunks and counters for the AclerItem into its
+        entry, on top of the entry as it was at the start of the run.
+        """
+
+        base = self.base[acler.line]
+        entry = json.loads(json.dumps(base))
+
+        days = set([c.day for c in acler.chunks_checked if c.kind == DAY])
+
+        if acler.has_records() and acler.chunks_checked:
+            # retired in the last chunk it was checked against, which
+            # may have been the first hour or a sample of the day
+            seen = acler.chunks_checked[-1].day
+            entry['last_seen'] = _daystring(seen)
+            days.add(seen)
+
+        days = sorted(days)
+        entry['days_checked'] += len(days)
+        if days:
+            entry['checked_through'] = _daystring(days[-1])
+
+        for (typename, counts) in acler.track.items():
+            mytrack = entry['track'].setdefault(typename, dict((c, 0) for c in COUNTS))
+            for c in COUNTS:
+                mytrack[c] += counts[c]
+
+        self.acls[acler.line] = entry
+
+    def summary(self, line):
+        """Days checked summary for the results, e.g. 30D or 12D[last seen 20150730]"""
+
+        entry = self.acls[line]
+        ret = "%dD" % entry['days_checked']
+        if entry['last_seen']:
+            ret += "[last seen %s]" % entry['last_seen']
+        return ret
+
+    def save(self):
+        """Rewrite the state file atomically"""
+
+        state = {'version': STATE_VERSION, 'class': self.silkclass,
+                 'types': self.silktypes, 'acls': self.acls}
+        tmpfile = "%s.tmp" % self.filename
+        with open(tmpfile, 'w') as f:
+            json.dump(state, f, indent=1, sort_keys=True)
+        os.rename(tmpfile, self.filename)
@@ -0,0 +1,97 @@
+#!/usr/bin/python
+
+# Search strategies decide the order the day chunks of the window are
+# pulled in. For "is this rule still used" questions the most recent or
+# the busiest days usually provide evidence the fastest, which retires
+# ACLs sooner and shrinks the remaining pulls.
+
+
+class SearchStrategy(object):
+    """Base strategy, searches days in the order given (chronological)"""
+
+    name = 'chronological'
+
+    def order(self, days):
+        """Return the list of datetime days in the order to search them"""
+        return list(days)
+
+
+class ChronologicalStrategy(SearchStrategy):
+    """Oldest day first, the original acler behavior"""
+
+    name = 'chronological'
+
+
+class NewestFirstStrategy(SearchStrategy):
+    """Most recent day first"""
+
+    name = 'newest'
+
+    def order(self, days):
+        return sorted(days, reverse=True)
+
+
+class BusiestFirstStrategy(SearchStrategy):
+    """
+    Day with the most repo data first. day_size is a callable that
+    takes a datetime day and returns the repo bytes for that day.
+    """
+
+    name = 'busiest'
+
+    def __init__(self, day_size):
+        self.day_size = day_size
+        self.sizes = dict()
+
+    def order(self, days):
+        for day in days:
+            self.sizes[day] = self.day_size(day)
+        # ties keep newest first
+        return sorted(days, key=lambda d: (self.sizes[d], d), reverse=True)
+
+
+class BisectionStrategy(SearchStrategy):
+    """
+    Middle day first, then the middles of each half, and so on, so the
+    first few pulls are spread across the whole window.
+    """
+
+    name = 'bisect'
+
+    def order(self, days):
+        days = sorted(days)
+        ordered = list()
+        # breadth first walk of the [low, high) ranges
+        ranges = [(0, len(days))]
+        while ranges:
+            next_ranges = list()
+            for (low, high) in ranges:
+                if low >= high:
+                    continue
+                mid = (low + high) // 2
+                ordered.append(days[mid])
+                next_ranges.append((low, mid))
+                next_ranges.append((mid + 1, high))
+            ranges = next_ranges
+        return ordered
+
+
+STRATEGIES = ('chronological', 'newest', 'busiest', 'bisect')
+
+
+def get_strategy(name, day_size=None):
+    """Return the SearchStrategy for the strategy name"""
+
+    if name == 'chronological':
+        return ChronologicalStrategy()
+    elif name == 'newest':
+        return NewestFirstStrategy()
+    elif name == 'busiest':
+        if day_size is None:
+            raise ValueError("Busiest strategy requires a day size function")
+        return BusiestFirstStrategy(day_size)
+    elif name == 'bisect':
+        return BisectionStrategy()
+    else:
+        raise ValueError("Unknown search strategy %s, must be one of %s" %
+                         (name, ', '.join(STRATEGIES)))
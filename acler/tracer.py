@@ -0,0 +1,147 @@
+#!/usr/bin/python
+
+# Opt-in timeline tracing (acler.py --trace-file). The run's phases, the
+# in-process sections (parsing, set building, evaluation, CSV writes)
+# and every subprocess launch (command, pid, exit code) are recorded as
+# nested spans and written at exit as Chrome trace event JSON, which
+# chrome://tracing and ui.perfetto.dev open as a timeline. Gaps between
+# the spans are time acler spent outside of any traced section.
+#
+# Without a trace file acler uses a NullTracer, whose spans do nothing,
+# so the tracing calls cost next to nothing.
+
+import json
+import os
+import threading
+import time
+
+
+class NullSpan(object):
+    """Span of a disabled tracer"""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        return False
+
+    def set_arg(self, key, value):
+        pass
+
+
+class NullTracer(object):
+    """Tracer that records nothing"""
+
+    enabled = False
+
+    _span = NullSpan()
+
+    def span(self, name, cat='acler', **args):
+        return self._span
+
+    def complete(self, name, cat, start, end, args=None, tid=None):
+        pass
+
+    def take(self):
+        return list()
+
+    def extend(self, events):
+        pass
+
+    def write(self):
+        pass
+
+
+class Span(object):
+    """One timed section, recorded as a complete event when it ends"""
+
+    def __init__(self, tracer, name, cat, args):
+        self.tracer = tracer
+        self.name = name
+        self.cat = cat
+        self.args = args
+        self.start = None
+
+    def __enter__(self):
+        self.start = time.time()
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        if exc_type is not None:
+            self.args['error'] = exc_type.__name__
+        self.tracer.complete(self.name, self.cat, self.start, time.time(), self.args)
+        return False
+
+    def set_arg(self, key, value):
+        self.args[key] = value
+
+
+class Tracer(object):
+    """
+    Records complete ('X') events for the Chrome trace format. Spans
+    on one thread nest by time. Subprocesses running alongside others
+    get their own track, using their pid as the thread id.
+    """
+
+    enabled = True
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.pid = os.getpid()
+        self.events = list()
+        self.lock = threading.Lock()
+
+    def span(self, name, cat='acler', **args):
+        return Span(self, name, cat, args)
+
+    def complete(self, name, cat, start, end, args=None, tid=None):
+        """Record a section that ran from start to end (time.time() seconds)"""
+
+        pid = os.getpid()
+        if tid is None:
+            tid = threading.current_thread().ident
+        event = {'name': name, 'cat': cat, 'ph': 'X', 'pid': pid, 'tid': tid,
+                 'ts': int(start * 1000000), 'dur': int((end - start) * 1000000)}
+        if args:
+            event['args'] = args
+        with self.lock:
+            self.events.append(event)
+
+    def take(self):
+        """Return the events recorded so far and start over, e.g. in a pool worker"""
+
+        with self.lock:
+            events = self.events
+            self.events = list()
+        return events
+
+    def extend(self, events):
+        """Add events recorded by another process, e.g. a pool worker"""
+
+        with self.lock:
+            self.events.extend(events)
+
+    def metadata(self, events):
+        """Process and thread name events for the pids and tids seen in the events"""
+
+        meta = list()
+        pids = set([e['pid'] for e in events])
+        for pid in sorted(pids):
+            name = 'acler'
+            if pid != self.pid:
+                name = 'acler worker'
+            meta.append({'name': 'process_name', 'ph': 'M', 'pid': pid, 'tid': 0,
+                         'args': {'name': "%s %d" % (name, pid)}})
+        for (pid, tid) in sorted(set([(e['pid'], e['tid']) for e in events
+                                      if 'args' in e and e['args'].get('pid') == e['tid']])):
+            meta.append({'name': 'thread_name', 'ph': 'M', 'pid': pid, 'tid': tid,
+                         'args': {'name': "subprocess %d" % tid}})
+        return meta
+
+    def write(self):
+        """Write the trace file"""
+
+        with self.lock:
+            events = list(self.events)
+        with open(self.filename, 'w') as f:
+            json.dump({'traceEvents': self.metadata(events) + events, 'displayTimeUnit': 'ms'}, f)
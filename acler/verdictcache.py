@@ -0,0 +1,205 @@
+#!/usr/bin/python
+
+# Persistent verdict cache (acler.py --verdict-cache). Inventories from
+# different teams overlap, so the same rule gets checked against the
+# same days run after run. The per type forward/reverse counters an ACL
+# got for a chunk are saved in SQLite, keyed by the class, types, the
+# chunk's time span and the ACL's normalized criteria (protocol and the
+# integer ranges of its addresses and ports, so differently written
+# ACL's for the same traffic share entries). Before a chunk is pulled,
+# the ACL's with a cached verdict for it get the cached counters and
+# are left out of the pull; when every ACL has one, nothing is pulled.
+#
+# No traffic is a verdict too, and the most common one. Only whole
+# chunks are cached, not record capped or time limited pulls. The cache
+# is kept under a number of entries by evicting the least recently used.
+# Port-only pulls that hit their record cap are not cached.
+#
+# Cache statistics:
+#   python acler/verdictcache.py verdicts.db
+
+import json
+import sqlite3
+import sys
+
+from resultsdb import COUNTS
+
+SCHEMA_VERSION = 1
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+CREATE TABLE IF NOT EXISTS verdicts (
+    silkclass TEXT,
+    silktypes TEXT,
+    chunk TEXT,
+    criteria TEXT,
+    counters TEXT,
+    used INTEGER,
+    PRIMARY KEY (silkclass, silktypes, chunk, criteria)
+);
+CREATE INDEX IF NOT EXISTS verdicts_used ON verdicts (used);
+"""
+
+# evict down to this fraction of the limit, so eviction isn't run for
+# every chunk once the cache is full
+EVICT_TO = 0.9
+
+
+def criteria_key(a):
+    """Normalized criteria of an AclerItem, e.g. 6 655360-720895 * 134744072 53"""
+
+    parts = list()
+    for value in a.get_match_criteria(False):
+        if value is None:
+            parts.append('*')
+        elif isinstance(value, tuple):
+            if value[0] == value[1]:
+                parts.append(str(value[0]))
+            else:
+                parts.append("%d-%d" % value)
+        else:
+            parts.append(str(value))
+    return ' '.join(parts)
+
+
+def types_key(silktypes):
+    """Comma separated SiLK types in a fixed order, e.g. in,out for out, in"""
+
+    return ','.join(sorted(x.strip() for x in silktypes.split(',')))
+
+
+def chunk_key(silkclass, silktypes, chunk):
+    """(class, types, time span) part of the keys for a chunk, types in any order"""
+
+    return (silkclass, types_key(silktypes), "%s %s" % (chunk.start, chunk.end))
+
+
+class VerdictCache(object):
+    """
+    SQLite store of the per chunk counters of normalized ACL criteria,
+    least recently used entries evicted past maxentries.
+    """
+
+    def __init__(self, filename, maxentries):
+        self.filename = filename
+        self.maxentries = maxentries
+        self.hits = 0
+        self.misses = 0
+        self.stored = 0
+        self.evicted = 0
+        # several day workers can share the file
+        self.conn = sqlite3.connect(filename, timeout=300)
+
+        # a schema version this code can't use
+        schema = None
+        with self.conn:
+            self.conn.executescript(SCHEMA)
+            row = self.conn.execute("SELECT value FROM meta WHERE key = 'schema'").fetchone()
+            if row is None:
+                self.conn.execute("INSERT INTO meta (key, value) VALUES ('schema', ?)",
+                                  (str(SCHEMA_VERSION),))
+            elif int(row[0]) != SCHEMA_VERSION:
+                schema = row[0]
+
+        if schema is not None:
+            self.conn.close()
+            raise ValueError("Verdict cache %s is schema version %s, expected %d" %
+                             (filename, schema, SCHEMA_VERSION))
+
+    def close(self):
+        self.conn.close()
+
+    def _clock(self):
+        row = self.conn.execute("SELECT max(used) FROM verdicts").fetchone()
+        return (row[0] or 0) + 1
+
+    def fill(self, key, items):
+        """
+        Add the cached counters for the chunk key to the items that have
+        a verdict for it. Returns the list of those items.
+        """
+
+        found = list()
+        used = list()
+        for a in items:
+            mycriteria = criteria_key(a)
+            row = self.conn.execute(
+                "SELECT counters FROM verdicts WHERE silkclass = ? AND silktypes = ? AND "
+                "chunk = ? AND criteria = ?", key + (mycriteria,)).fetchone()
+            if row is None:
+                self.misses += 1
+                continue
+            self.hits += 1
+            counters = json.loads(row[0])
+            for typename in sorted(counters):
+                for (name, count) in zip(COUNTS, counters[typename]):
+                    a.add_track(typename, name, count)
+            found.append(a)
+            used.append(key + (mycriteria,))
+
+        if used:
+            with self.conn:
+                clock = self._clock()
+                self.conn.executemany(
+                    "UPDATE verdicts SET used = %d WHERE silkclass = ? AND silktypes = ? AND "
+                    "chunk = ? AND criteria = ?" % clock, used)
+        return found
+
+    def store(self, key, items):
+        """Save the counters the items got for the chunk key (their chunk_track)"""
+
+        if not items:
+            return
+
+        rows = list()
+        for a in items:
+            counters = dict()
+            for typename in a.chunk_track:
+                counters[typename] = [a.chunk_track[typename][name] for name in COUNTS]
+            rows.append(key + (criteria_key(a), json.dumps(counters, sort_keys=True)))
+
+        with self.conn:
+            clock = self._clock()
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO verdicts (silkclass, silktypes, chunk, criteria, counters, "
+                "used) VALUES (?, ?, ?, ?, ?, %d)" % clock, rows)
+            self.stored += len(rows)
+            self.evict()
+
+    def evict(self):
+        """Drop the least recently used entries once over maxentries"""
+
+        count = self.entries()
+        if count <= self.maxentries:
+            return
+        extra = count - int(self.maxentries * EVICT_TO)
+        self.conn.execute("DELETE FROM verdicts WHERE rowid IN "
+                          "(SELECT rowid FROM verdicts ORDER BY used LIMIT ?)", (extra,))
+        self.evicted += extra
+
+    def entries(self):
+        return self.conn.execute("SELECT count(*) FROM verdicts").fetchone()[0]
+
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        if not lookups:
+            return 0.0
+        return 100.0 * self.hits / lookups
+
+    def format_stats(self):
+        return "Verdict cache: %d hits, %d misses (%.1f%% hit rate), %d stored, %d evicted, " \
+               "%d of at most %d entries" % (self.hits, self.misses, self.hit_rate(), self.stored,
+                                             self.evicted, self.entries(), self.maxentries)
+
+
+if __name__ == '__main__':
+    cache = VerdictCache(sys.argv[1], 0)
+    print("%d entries" % cache.entries())
+    for (silkclass, silktypes, chunks, count) in cache.conn.execute(
+            "SELECT silkclass, silktypes, count(DISTINCT chunk), count(*) FROM verdicts "
+            "GROUP BY silkclass, silktypes"):
+        print("  class %s types %s: %d chunks, %d verdicts" % (silkclass, silktypes, chunks, count))
+    cache.close()
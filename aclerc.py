@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+
+# Thin client for acler.py --daemon. Sends one check job over the
+# daemon's Unix socket and prints the results as they stream back.
+
+import csv
+import json
+import optparse
+import os
+import socket
+import sys
+
+""" process commandline options """
+usage = """usage: ./%prog [options]
+use -h for help / option descriptions
+example: ./%prog -i /path/to/my-acls.csv -I 3 -l 12,15 -s 2015/07/23 -e 2015/07/30
+"""
+parser = optparse.OptionParser(usage)
+parser.add_option("-S", "--socket", dest="socket", help="""Unix socket the acler daemon listens on. Defaults to environment variable ACLER_DAEMON_SOCKET if present.""")
+parser.add_option("-i", "--in-file", dest="infile", help="""CSV file with the ACL entries, with integer line numbers in the first column (see acler.py -h). The daemon keeps it parsed until it changes.""")
+parser.add_option("-I", "--in-file-column", dest="infilecolumn", type="int", help="""One-based column number that contains the ACL entry.""")
+parser.add_option("-l", "--lines", dest="lines", help="""Comma separated list of the line numbers to check. Defaults to all lines in the in-file.""")
+parser.add_option("-s", "--start", dest="start", help="""Rwfilter start-date (no hour). Example --start=2015/07/23. Defaults to the daemon's.""")
+parser.add_option("-e", "--end", dest="end", help="""Rwfilter end-date (no hour). Example --end=2015/07/30. Defaults to the daemon's.""")
+parser.add_option("-c", "--class", dest="silkclass", help="""Rwfilter class. Defaults to the daemon's.""")
+parser.add_option("-t", "--types", dest="silktypes", help="""Rwfilter types. Defaults to the daemon's.""")
+parser.add_option("--engine", dest="engine", help="""rwfilter, inprocess or pmap. Defaults to the daemon's.""")
+parser.add_option("--strategy", dest="strategy", help="""Order the days are searched in, see acler.py -h. Defaults to the daemon's.""")
+parser.add_option("--status", action="store_true", dest="status", help="""Show the daemon's cache info instead of running a check.""")
+parser.add_option("--json", action="store_true", dest="json", help="""Print the daemon's JSON lines messages as is instead of CSV rows of line number, result, and ACL.""")
+(options, args) = parser.parse_args()
+
+if not options.socket:
+    options.socket = os.environ.get('ACLER_DAEMON_SOCKET')
+if not options.socket:
+    print("Daemon socket option [-S] required. See help using -h")
+    sys.exit(1)
+
+if options.status:
+    job = {'command': 'status'}
+else:
+    if not options.infile or not options.infilecolumn:
+        print("Input file [-i] and column [-I] options required. See help using -h")
+        sys.exit(1)
+    job = {'command': 'check', 'infile': os.path.abspath(options.infile),
+           'column': options.infilecolumn}
+    if options.lines:
+        job['lines'] = [x.strip() for x in options.lines.split(',') if x.strip()]
+    for (key, value) in (('start', options.start), ('end', options.end),
+                         ('class', options.silkclass), ('types', options.silktypes),
+                         ('engine', options.engine), ('strategy', options.strategy)):
+        if value:
+            job[key] = value
+
+s = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+try:
+    s.connect(options.socket)
+except socket.error as e:
+    print("Could not connect to the acler daemon at %s: %s" % (options.socket, e))
+    sys.exit(1)
+
+s.sendall((json.dumps(job) + "\n").encode('utf-8'))
+
+writer = csv.writer(sys.stdout)
+returncode = 0
+for line in s.makefile('rb'):
+    if options.json:
+        sys.stdout.write(line.decode('utf-8'))
+        sys.stdout.flush()
+    message = json.loads(line.decode('utf-8'))
+    if message['type'] == 'error':
+        if not options.json:
+            print("Error: %s" % message['error'])
+        returncode = 1
+    elif options.json:
+        continue
+    elif message['type'] == 'result':
+        writer.writerow([message['line'], message['result'], message['acl']])
+        sys.stdout.flush()
+    elif message['type'] == 'status':
+        for key in sorted(message):
+            if key != 'type':
+                print("%s: %s" % (key, message[key]))
+s.close()
+
+sys.exit(returncode)
@@ -1,41 +1,129 @@
 #!/usr/bin/env python
 
 import csv
+import multiprocessing
 import optparse
 import os
+import shutil
 import sys
 
-counter = 1
 
-""" process commandline options """
-usage = """usage: ./%prog [options]
+def read_range(filename, start, end):
+    """Yield the lines of filename that start between byte start and end"""
+
+    with open(filename, 'rb') as f:
+        f.seek(start)
+        while f.tell() < end:
+            line = f.readline()
+            if not line:
+                break
+            yield line
+
+
+def byte_ranges(filename, jobs):
+    """Split filename into about jobs (start, end) byte ranges on line boundaries"""
+
+    size = os.path.getsize(filename)
+    starts = [0]
+    with open(filename, 'rb') as f:
+        for i in range(1, jobs):
+            f.seek(max(starts[-1], size * i // jobs))
+            f.readline()
+            if f.tell() >= size:
+                break
+            if f.tell() > starts[-1]:
+                starts.append(f.tell())
+    return list(zip(starts, starts[1:] + [size]))
+
+
+def count_rows(args):
+    (filename, start, end) = args
+    count = 0
+    for row in csv.reader(read_range(filename, start, end)):
+        count += 1
+    return count
+
+
+def number_rows(args):
+    """Write the rows of one byte range to a part file, numbered from first"""
+
+    (filename, start, end, first, partfile) = args
+    with open(partfile, 'wb') as wf:
+        writer = csv.writer(wf)
+        counter = first
+        for row in csv.reader(read_range(filename, start, end)):
+            writer.writerow([counter] + row)
+            counter += 1
+    return partfile
+
+
+def add_ints(infile, outfile):
+    """Stream the rows through, prepending the line number, in constant memory"""
+
+    with open(infile, 'rb') as rf:
+        with open(outfile, 'wb') as wf:
+            writer = csv.writer(wf)
+            for (counter, row) in enumerate(csv.reader(rf)):
+                writer.writerow([counter + 1] + row)
+
+
+def add_ints_parallel(infile, outfile, jobs):
+    """
+    Number the rows of a large file with a pool of jobs processes: count
+    the rows of each byte range, then write each range numbered from the
+    rows before it into a part file, and join the parts. Each CSV row
+    must be on one line.
+    """
+
+    ranges = byte_ranges(infile, jobs)
+    pool = multiprocessing.Pool(jobs)
+    try:
+        counts = pool.map(count_rows, [(infile, start, end) for (start, end) in ranges])
+
+        work = list()
+        first = 1
+        for (i, (start, end)) in enumerate(ranges):
+            work.append((infile, start, end, first, "%s.part%d" % (outfile, i)))
+            first += counts[i]
+        parts = pool.map(number_rows, work)
+    finally:
+        pool.close()
+        pool.join()
+
+    with open(outfile, 'wb') as wf:
+        for partfile in parts:
+            with open(partfile, 'rb') as rf:
+                shutil.copyfileobj(rf, wf)
+            os.remove(partfile)
+
+
+if __name__ == '__main__':
+
+    """ process commandline options """
+    usage = """usage: ./%prog [options]
 use -h for help / option descriptions 
 example: ./%prog -i /path/to/my/no-integer-csv-file.csv
 """
-parser = optparse.OptionParser(usage)
-parser.add_option("-i", "--in-file", dest="infile", help="""CSV file to prepend tracking line number integers to.""")
-(options, args) = parser.parse_args()
-
-if not options.infile:
-    print("Input file option [-i] required. See help using -h")
-    sys.exit(1)
-
-# get the infile name without extension
-myname = os.path.splitext(os.path.basename(options.infile))[0] 
-mypath = os.path.dirname(options.infile)
-csvoutfilename = "%s-with-integers.csv" % myname
-csvoutfile = "%s/%s" % (mypath, csvoutfilename)
-
-# load list with input csv info
-csvin = list()
-with open(options.infile, 'rb') as rf:
-    reader = csv.reader(rf)
-    for row in reader:
-        row = [counter] + row
-        csvin.append(row)
-        counter += 1
-   
-with open(csvoutfile, 'wb') as wf:
-    writer = csv.writer(wf)
-    for row in csvin:
-        writer.writerow(row)
+    parser = optparse.OptionParser(usage)
+    parser.add_option("-i", "--in-file", dest="infile", help="""CSV file to prepend tracking line number integers to.""")
+    parser.add_option("-j", "--jobs", dest="jobs", default=1, type="int", help="""Number of processes to use for multi-GB files. Each CSV row must be on one line (no quoted line breaks) when using more than one. Defaults to 1.""")
+    (options, args) = parser.parse_args()
+
+    if not options.infile:
+        print("Input file option [-i] required. See help using -h")
+        sys.exit(1)
+
+    if options.jobs < 1:
+        print("Jobs option [-j] must be 1 or higher")
+        sys.exit(1)
+
+    # get the infile name without extension
+    myname = os.path.splitext(os.path.basename(options.infile))[0]
+    mypath = os.path.dirname(options.infile)
+    csvoutfilename = "%s-with-integers.csv" % myname
+    csvoutfile = "%s/%s" % (mypath, csvoutfilename)
+
+    if options.jobs > 1:
+        add_ints_parallel(options.infile, csvoutfile, options.jobs)
+    else:
+        add_ints(options.infile, csvoutfile)
@@ -0,0 +1,149 @@
+# Tests for the compiled match predicates (acler/codegen.py), checked
+# against the interpreted evaluation of the same criteria
+#   python -m unittest discover -s tests
+
+import os
+import random
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'acler'))
+
+import codegen
+from addresses import cidr_to_range
+from inprocess import ChunkedEvaluator
+from silkreader import FIELDS, RecordChunk, numpy
+
+HOSTS = ['10.0.0.1', '10.0.0.2', '10.0.0.3', '10.0.0.200', '10.0.1.5', '8.8.8.8', '8.8.4.4',
+         '192.168.1.1', '192.168.1.77', '39.1.2.3']
+PORTS = [22, 53, 80, 443, 1024, 3389, 8080, 40000, 65535, 0]
+TYPE_NAMES = {0: 'in', 1: 'out', 2: 'inweb'}
+
+
+def ip(address):
+    return cidr_to_range(address + '/32')[0]
+
+
+def host(address):
+    return cidr_to_range(address + '/32')
+
+
+CRITERIA = [
+    # any protocol, any to any
+    (None, None, None, None, None),
+    # any to any by protocol, with a port range, and a /0 block
+    (6, None, None, None, None),
+    (17, None, None, None, (50, 60)),
+    (6, cidr_to_range('0.0.0.0/0'), None, cidr_to_range('0.0.0.0/0'), (0, 65535)),
+    (6, None, (1024, 65535), None, (80, 80)),
+    # blocks and an unaligned address range
+    (6, cidr_to_range('10.0.0.0/24'), None, None, None),
+    (17, None, None, cidr_to_range('8.8.0.0/16'), (53, 53)),
+    (6, (ip('10.0.0.2'), ip('10.0.0.200')), None, None, (22, 3389)),
+    (None, cidr_to_range('192.168.1.0/25'), None, None, None),
+    # enough single host shapes for dict lookups
+    (6, host('10.0.0.1'), None, host('8.8.8.8'), None),
+    (6, host('10.0.0.2'), None, host('8.8.8.8'), None),
+    (6, host('10.0.0.3'), None, host('8.8.4.4'), None),
+    (6, host('192.168.1.1'), None, host('10.0.0.1'), None),
+    (6, host('10.0.0.1'), None, host('8.8.8.8'), None),
+    (17, host('10.0.0.1'), None, host('8.8.8.8'), (53, 53)),
+    (17, host('10.0.0.2'), None, host('8.8.4.4'), (53, 53)),
+    (17, host('10.0.0.3'), None, host('8.8.8.8'), (443, 443)),
+    (17, host('39.1.2.3'), None, host('10.0.1.5'), (8080, 8080)),
+    (None, host('8.8.8.8'), None, None, None),
+    (None, host('8.8.4.4'), None, None, None),
+    (None, host('10.0.1.5'), None, None, None),
+    (None, host('39.1.2.3'), None, None, None),
+]
+
+
+class Criteria(object):
+    """Stand-in AclerItem with fixed match criteria"""
+
+    def __init__(self, criteria):
+        self.criteria = criteria
+        self.track = dict()
+
+    def get_match_criteria(self, reverse=False):
+        (proto, sip, sport, dip, dport) = self.criteria
+        if reverse:
+            return (proto, dip, dport, sip, sport)
+        return self.criteria
+
+    def add_track(self, typename, name, count):
+        self.track[(typename, name)] = self.track.get((typename, name), 0) + count
+
+
+def make_columns(count, seed):
+    rand = random.Random(seed)
+    columns = dict((name, list()) for name in FIELDS)
+    for i in range(count):
+        for (name, value) in (('stime', 1435708800000 + i), ('elapsed', 0), ('sensor', 1),
+                              ('sip', ip(rand.choice(HOSTS))), ('dip', ip(rand.choice(HOSTS))),
+                              ('sport', rand.choice(PORTS)), ('dport', rand.choice(PORTS)),
+                              ('proto', rand.choice((1, 6, 6, 17, 17, 47))),
+                              ('flowtype', rand.choice(sorted(TYPE_NAMES))),
+                              ('bytes', rand.randint(40, 1 << 20)),
+                              ('packets', rand.randint(1, 1000))):
+            columns[name].append(value)
+
+    # and one record at the low end of each criteria, so every one matches
+    for (proto, sip, sport, dip, dport) in CRITERIA:
+        for (name, value) in (('stime', 1435708800000), ('elapsed', 0), ('sensor', 1),
+                              ('sip', (sip or (0, 0))[0]), ('dip', (dip or (0, 0))[0]),
+                              ('sport', (sport or (0, 0))[0]), ('dport', (dport or (0, 0))[0]),
+                              ('proto', proto or 47), ('flowtype', 1), ('bytes', 100),
+                              ('packets', 1)):
+            columns[name].append(value)
+    return columns
+
+
+def numpy_chunk(columns):
+    dtypes = {'stime': 'i8', 'sip': 'u4', 'dip': 'u4', 'sport': 'u2', 'dport': 'u2',
+              'proto': 'u1', 'flowtype': 'u1', 'sensor': 'u2', 'elapsed': 'u4',
+              'bytes': 'u4', 'packets': 'u4'}
+    return RecordChunk(len(columns['sip']), dict((name, numpy.array(columns[name], dtype=dtypes[name]))
+                                                 for name in FIELDS))
+
+
+class CodegenTest(unittest.TestCase):
+
+    def tracks(self, chunks, compiled):
+        items = [Criteria(c) for c in CRITERIA]
+        evaluator = ChunkedEvaluator(items, compiled=compiled)
+        if compiled:
+            self.assertTrue(evaluator.predicates.lookups > 0)
+        for chunk in chunks:
+            evaluator.evaluate(chunk, TYPE_NAMES)
+        return [a.track for a in items]
+
+    def check(self, chunks):
+        interpreted = self.tracks(chunks, False)
+        self.assertEqual(self.tracks(chunks, True), interpreted)
+        # every criteria saw traffic, so the comparison covers them all
+        self.assertEqual([k for (k, track) in enumerate(interpreted) if not track], [])
+
+    def test_records_match_interpreted(self):
+        chunks = [RecordChunk(2000 + len(CRITERIA), make_columns(2000, seed)) for seed in (1, 2)]
+        self.check(chunks)
+
+    def test_vectors_match_interpreted(self):
+        if numpy is None:
+            return
+        self.check([numpy_chunk(make_columns(2000, seed)) for seed in (1, 2)])
+
+    def test_empty_criteria(self):
+        (predicates, reused) = codegen.compile_predicates([])
+        chunk = RecordChunk(10, make_columns(10, 3))
+        self.assertEqual(predicates.match_records(chunk), dict())
+
+    def test_reused_until_criteria_change(self):
+        criteria = [(6, host('10.0.0.1'), None, None, None)]
+        first = codegen.compile_predicates(criteria)[0]
+        self.assertEqual(codegen.compile_predicates(list(criteria)), (first, True))
+        self.assertFalse(codegen.compile_predicates(criteria + [(17, None, None, None, None)])[1])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,175 @@
+# Tests for the columnar cache (acler/columnar.py)
+#   python -m unittest discover -s tests
+
+import os
+import shutil
+import struct
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'acler'))
+
+import columnar
+from addresses import cidr_to_range
+from columnar import ColumnarCache, build_columnar_cache
+from inprocess import ChunkedEvaluator, evaluate_working_file
+from silkreader import SilkFlowReader, read_records
+from test_silkreader import SILK_CONF, pack_generic
+
+# (sip, dip, sport, dport, proto, bytes, packets, typename)
+RECORDS = [
+    (0x0A000001, 0x08080808, 40000, 53, 17, 120, 2, 'out'),
+    (0x08080808, 0x0A000001, 53, 40000, 17, 240, 2, 'in'),
+    (0x0A000002, 0xC0A80001, 50000, 443, 6, 4000, 10, 'out'),
+    (0x0A0000FF, 0xC0A80002, 50001, 22, 6, 1500, 5, 'out'),
+    (0x27000001, 0x0A000001, 1024, 80, 6, 600, 6, 'in'),
+    (0xC0A80001, 0x0A000002, 443, 50000, 6, 9000, 12, 'in'),
+]
+
+
+CRITERIA = [
+    (17, cidr_to_range('10.0.0.1/32'), None, cidr_to_range('8.8.8.8/32'), (53, 53)),
+    (6, cidr_to_range('10.0.0.0/24'), None, None, None),
+    (6, None, None, None, (22, 22)),
+    (6, cidr_to_range('39.0.0.0/8'), None, None, (80, 80)),
+    (1, None, None, None, None),
+    (None, None, None, cidr_to_range('10.0.0.0/30'), None),
+    (6, cidr_to_range('192.168.0.0/16'), (400, 500), None, (50000, 50000)),
+]
+
+# the silk.conf type ids of the RECORDS types
+TYPE_IDS = {'in': 0, 'out': 1}
+
+
+class Criteria(object):
+    """Stand-in AclerItem with fixed match criteria"""
+
+    def __init__(self, criteria):
+        self.criteria = criteria
+        self.track = dict()
+
+    def get_match_criteria(self, reverse=False):
+        (proto, sip, sport, dip, dport) = self.criteria
+        if reverse:
+            return (proto, dip, dport, sip, sport)
+        return self.criteria
+
+    def add_track(self, typename, name, count):
+        self.track[(typename, name)] = self.track.get((typename, name), 0) + count
+
+
+def read_chunks(rwfile, silkconf):
+    reader = SilkFlowReader(rwfile, 2, silkconf, mapped=False)
+    try:
+        for chunk in reader.chunks():
+            yield chunk
+    finally:
+        reader.close()
+
+
+class ColumnarCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.rwfile = os.path.join(self.tmpdir, 'working.rwf')
+        with open(self.rwfile, 'wb') as f:
+            f.write(b'not really a silk file')
+        self.cachefile = os.path.join(self.tmpdir, 'working.col')
+        build_columnar_cache(self.rwfile, self.cachefile, key='20150701', records=RECORDS)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_columns_round_trip(self):
+        cache = ColumnarCache(self.cachefile, key='20150701', source=self.rwfile)
+        try:
+            self.assertEqual(cache.records, len(RECORDS))
+            for (i, name) in enumerate(['sip', 'dip', 'sport', 'dport', 'proto', 'bytes', 'packets']):
+                self.assertEqual(cache.column(name).tolist(), [r[i] for r in RECORDS])
+            names = [cache.type_names[x] for x in cache.column('typeid').tolist()]
+            self.assertEqual(names, [r[7] for r in RECORDS])
+        finally:
+            cache.close()
+
+    def test_rows_for_block(self):
+        cache = ColumnarCache(self.cachefile)
+        try:
+            self.assertEqual(sorted(cache.rows_for_block('sip', '10.0.0.0/24').tolist()), [0, 2, 3])
+            self.assertEqual(sorted(cache.rows_for_block('dip', '10.0.0.1/32').tolist()), [1, 4])
+            self.assertEqual(len(cache.rows_for_block('sip', '172.16.0.0/12')), 0)
+        finally:
+            cache.close()
+
+    def test_rejects_foreign_file(self):
+        with open(self.cachefile, 'wb') as f:
+            f.write(b'PK\x03\x04 some other file format' * 4)
+        self.assertRaises(ValueError, ColumnarCache, self.cachefile)
+
+    def test_rejects_short_file(self):
+        with open(self.cachefile, 'wb') as f:
+            f.write(columnar.MAGIC)
+        self.assertRaises(ValueError, ColumnarCache, self.cachefile)
+
+    def test_rejects_other_version(self):
+        with open(self.cachefile, 'r+b') as f:
+            f.seek(len(columnar.MAGIC))
+            f.write(struct.pack('<I', columnar.CACHE_VERSION + 1))
+        self.assertRaises(ValueError, ColumnarCache, self.cachefile)
+
+    def test_rejects_other_key(self):
+        self.assertRaises(ValueError, ColumnarCache, self.cachefile, '20150702')
+
+    def test_rejects_stale_cache(self):
+        with open(self.rwfile, 'ab') as f:
+            f.write(b'more records')
+        self.assertRaises(ValueError, ColumnarCache, self.cachefile, None, self.rwfile)
+
+    def test_evaluate_cache_tracks(self):
+        items = [Criteria(c) for c in CRITERIA[:5]]
+        evaluator = ChunkedEvaluator(items, compiled=False)
+        cache = ColumnarCache(self.cachefile)
+        try:
+            evaluator.evaluate_cache(cache)
+        finally:
+            cache.close()
+
+        self.assertEqual(items[0].track, {('out', 'FR'): 1, ('out', 'FB'): 120, ('out', 'FP'): 2,
+                                          ('in', 'RR'): 1, ('in', 'RB'): 240, ('in', 'RP'): 2})
+        self.assertEqual(items[1].track.get(('out', 'FR')), 2)
+        self.assertEqual(items[1].track.get(('in', 'RR')), 2)
+        self.assertEqual(items[2].track, {('out', 'FR'): 1, ('out', 'FB'): 1500, ('out', 'FP'): 5})
+        self.assertEqual(items[3].track, {('in', 'FR'): 1, ('in', 'FB'): 600, ('in', 'FP'): 6})
+        self.assertEqual(items[4].track, dict())
+        self.assertEqual(evaluator.records, len(RECORDS))
+
+    def test_evaluate_cache_matches_scan(self):
+        # the RECORDS as a SiLK working file, and its cache
+        silkconf = os.path.join(self.tmpdir, 'silk.conf')
+        with open(silkconf, 'w') as f:
+            f.write(SILK_CONF)
+        with open(self.rwfile, 'wb') as f:
+            f.write(pack_generic([(1435708800000 + i, 0, sp, dp, pr, TYPE_IDS[t], 1, pk, by, si, di)
+                                  for (i, (si, di, sp, dp, pr, by, pk, t)) in enumerate(RECORDS)],
+                                 False))
+        build_columnar_cache(self.rwfile, self.cachefile, '20150701',
+                             read_records(self.rwfile, silkconf=silkconf))
+
+        # the interpreted and compiled scans of the working file, then the cache
+        interpreted = [Criteria(c) for c in CRITERIA]
+        evaluator = ChunkedEvaluator(interpreted, compiled=False)
+        for chunk in read_chunks(self.rwfile, silkconf):
+            evaluator.evaluate(chunk, dict((v, k) for (k, v) in TYPE_IDS.items()))
+        scanned = [Criteria(c) for c in CRITERIA]
+        evaluate_working_file(self.rwfile, scanned, 2, silkconf)
+        cached = [Criteria(c) for c in CRITERIA]
+        evaluate_working_file(self.rwfile, cached, 2, silkconf, caches=[self.cachefile])
+
+        tracks = [a.track for a in interpreted]
+        self.assertEqual([a.track for a in scanned], tracks)
+        self.assertEqual([a.track for a in cached], tracks)
+        self.assertEqual([k for (k, track) in enumerate(tracks) if not track], [4])
+
+
+if __name__ == '__main__':
+    unittest.main()
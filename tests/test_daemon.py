@@ -0,0 +1,55 @@
+# Tests for the daemon mode pieces (acler/daemon.py)
+#   python -m unittest discover -s tests
+
+import os
+import shutil
+import stat
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'acler'))
+
+from daemon import DaemonServer, ENGINES, validate_job
+from strategies import STRATEGIES
+
+JOB = {'command': 'check', 'infile': '/path/acls.csv', 'column': 3, 'start': '2015/07/23',
+       'end': '2015/07/30', 'class': 'all', 'types': 'in,out'}
+
+
+def job(**kwargs):
+    myjob = dict(JOB)
+    myjob.update(kwargs)
+    return myjob
+
+
+class DaemonTest(unittest.TestCase):
+
+    def test_validate_job(self):
+        self.assertEqual(validate_job(JOB), None)
+        for engine in ENGINES:
+            self.assertEqual(validate_job(job(engine=engine)), None)
+        for strategy in STRATEGIES:
+            self.assertEqual(validate_job(job(strategy=strategy)), None)
+
+        for myjob in ([], job(infile=''), job(column=0), job(column='x'), job(start='2015-07-23'),
+                      job(**{'class': 'a;b'}), job(types='in out'), job(lines='12'),
+                      job(engine='rwfilter --pass=/etc'), job(engine='other'),
+                      job(strategy='random')):
+            self.assertNotEqual(validate_job(myjob), None)
+
+    def test_socket_mode(self):
+        tmpdir = tempfile.mkdtemp()
+        umask = os.umask(0)
+        try:
+            socketpath = os.path.join(tmpdir, 'acler.sock')
+            server = DaemonServer(socketpath, None)
+            server.server_close()
+            self.assertEqual(stat.S_IMODE(os.stat(socketpath).st_mode), 0o600)
+        finally:
+            os.umask(umask)
+            shutil.rmtree(tmpdir)
+
+
+if __name__ == '__main__':
+    unittest.main()
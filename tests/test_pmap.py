@@ -0,0 +1,196 @@
+# Tests for the prefix map engine (acler/pmap.py): the disjoint label
+# ranges, and the rwuniq label rows scattered back to the ACL's, checked
+# against each ACL's own criteria
+#   python -m unittest discover -s tests
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'acler'))
+
+from addresses import cidr_to_range
+from cisco_custom import parse_cisco
+from pmap import ADDRESS_MAP, NO_LABEL, PORT_MAP, LabelMap, PmapEvaluator
+
+ACLS = [
+    # nested blocks
+    "access-list 101 permit tcp 10.0.0.0 0.255.255.255 any",
+    "access-list 101 permit tcp 10.1.0.0 0.0.255.255 any eq 80",
+    "access-list 101 permit tcp 10.1.2.0 0.0.0.255 host 192.168.1.1 range 20 25",
+    "access-list 101 permit tcp host 10.1.2.3 any eq 22",
+    # overlapping blocks, 10.1.2.0/23 and 10.1.3.0/24 inside it, and
+    # 10.1.2.128/25 across the /24s
+    "access-list 101 permit udp 10.1.2.0 0.0.1.255 any eq 53",
+    "access-list 101 permit udp 10.1.3.0 0.0.0.255 192.168.1.0 0.0.0.255 range 50 60",
+    "access-list 101 permit udp any 10.1.2.128 0.0.0.127 range 53 55",
+    # adjacent blocks and port ranges
+    "access-list 101 permit tcp 192.168.1.0 0.0.0.127 any range 1000 1999",
+    "access-list 101 permit tcp 192.168.1.128 0.0.0.127 any range 2000 2999",
+    "access-list 101 permit icmp host 192.168.1.1 any",
+    # port-only
+    "access-list 101 permit tcp any any range 21 23",
+]
+
+ADDRESSES = ['10.0.0.1', '10.1.0.1', '10.1.2.0', '10.1.2.3', '10.1.2.127', '10.1.2.128',
+             '10.1.2.255', '10.1.3.0', '10.1.3.255', '10.1.4.0', '10.255.255.255', '11.0.0.0',
+             '192.168.1.0', '192.168.1.1', '192.168.1.127', '192.168.1.128', '192.168.1.255',
+             '8.8.8.8']
+PORTS = [0, 19, 20, 21, 22, 23, 25, 26, 50, 53, 55, 56, 60, 61, 80, 999, 1000, 1999, 2000,
+         2999, 3000, 65535]
+
+
+def ip(address):
+    return cidr_to_range(address + '/32')[0]
+
+
+def flows():
+    """(sip, dip, sport, dport, proto, type, bytes, packets) over every address pair"""
+
+    myflows = list()
+    i = 0
+    for s in ADDRESSES:
+        for d in ADDRESSES:
+            for proto in (1, 6, 17):
+                i += 1
+                sport = PORTS[i % len(PORTS)]
+                dport = PORTS[(i * 7) % len(PORTS)]
+                if proto == 1:
+                    (sport, dport) = (0, 0)
+                myflows.append((ip(s), ip(d), sport, dport, proto, ('in', 'out')[i % 2],
+                                i * 10, i))
+    return myflows
+
+
+def label_number(labels, value):
+    for (i, (low, high)) in enumerate(labels.intervals):
+        if low <= value <= high:
+            return i
+    return None
+
+
+def rwuniq_lines(evaluator, myflows):
+    """What rwuniq with the evaluator's prefix maps and fields would print"""
+
+    def address(value):
+        i = label_number(evaluator.addresses, value)
+        if i is None:
+            return NO_LABEL
+        return evaluator.addresses.label(i)
+
+    def port(proto, value):
+        labels = evaluator.ports.get(proto)
+        if labels is None or label_number(labels, value) is None:
+            return NO_LABEL
+        return labels.label(label_number(labels, value))
+
+    totals = dict()
+    for (sip, dip, sport, dport, proto, mytype, mybytes, packets) in myflows:
+        keys = {'src-%s' % ADDRESS_MAP: address(sip), 'dst-%s' % ADDRESS_MAP: address(dip),
+                'src-%s' % PORT_MAP: port(proto, sport), 'dst-%s' % PORT_MAP: port(proto, dport),
+                'protocol': str(proto), 'type': mytype}
+        key = tuple(keys[x] for x in evaluator.fields())
+        counts = totals.setdefault(key, [0, 0, 0])
+        counts[0] += 1
+        counts[1] += mybytes
+        counts[2] += packets
+    return ['|'.join(list(key) + [str(x) for x in totals[key]]) for key in sorted(totals)]
+
+
+def expected_track(a, myflows):
+    """Per type counters from checking each flow against the ACL's criteria, both ways"""
+
+    track = dict()
+    for (reverse, direction) in ((False, 'F'), (True, 'R')):
+        (proto, sip, sport, dip, dport) = a.get_match_criteria(reverse)
+        for (s, d, sp, dp, p, mytype, mybytes, packets) in myflows:
+            if p != proto:
+                continue
+            if [v for (v, r) in ((s, sip), (sp, sport), (d, dip), (dp, dport))
+                    if r is not None and not r[0] <= v <= r[1]]:
+                continue
+            for (name, count) in (('R', 1), ('B', mybytes), ('P', packets)):
+                key = (mytype, direction + name)
+                track[key] = track.get(key, 0) + count
+    return track
+
+
+class Item(object):
+    """Parsed ACL, with a flat track"""
+
+    def __init__(self, acl):
+        self.a = parse_cisco(acl, True)
+        self.track = dict()
+        for name in ('sip', 'dip', 'sport', 'dport', 'protocol'):
+            setattr(self, name, getattr(self.a, name))
+
+    def get_match_criteria(self, reverse=False):
+        return self.a.get_match_criteria(reverse)
+
+    def add_track(self, typename, name, count):
+        self.track[(typename, name)] = self.track.get((typename, name), 0) + count
+
+
+class LabelMapTest(unittest.TestCase):
+
+    def test_overlapping(self):
+        labels = LabelMap('a', [(0, 10), (5, 15), (20, 20)])
+        self.assertEqual(labels.intervals, [(0, 4), (5, 10), (11, 15), (20, 20)])
+        self.assertEqual(labels.span((0, 10)), (0, 1))
+        self.assertEqual(labels.span((5, 15)), (1, 2))
+        self.assertEqual(labels.span((20, 20)), (3, 3))
+
+    def test_nested(self):
+        labels = LabelMap('a', [(0, 255), (16, 31), (20, 20), (0, 255)])
+        self.assertEqual(labels.intervals, [(0, 15), (16, 19), (20, 20), (21, 31), (32, 255)])
+        self.assertEqual(labels.span((0, 255)), (0, 4))
+        self.assertEqual(labels.span((16, 31)), (1, 3))
+        self.assertEqual(labels.span((20, 20)), (2, 2))
+
+    def test_adjacent_and_edges(self):
+        labels = LabelMap('6p', [(1000, 1999), (2000, 2999), (0, 0), (65535, 65535)])
+        self.assertEqual(labels.intervals, [(0, 0), (1000, 1999), (2000, 2999), (65535, 65535)])
+        self.assertEqual(labels.span((2000, 2999)), (2, 2))
+        self.assertEqual(labels.span((65535, 65535)), (3, 3))
+        self.assertEqual(labels.label(2), '6p2')
+        self.assertEqual(labels.number('6p2'), 2)
+        self.assertEqual(labels.number(NO_LABEL), None)
+        self.assertEqual(labels.number('17p2'), None)
+
+    def test_empty(self):
+        labels = LabelMap('a', [])
+        self.assertEqual(labels.intervals, [])
+
+
+class PmapEvaluatorTest(unittest.TestCase):
+
+    def test_add_rows_matches_criteria(self):
+        items = [Item(x) for x in ACLS]
+        for item in items:
+            self.assertTrue(item.a.parsed, item.a.error)
+        evaluator = PmapEvaluator(items)
+        myflows = flows()
+        lines = rwuniq_lines(evaluator, myflows)
+
+        self.assertEqual(evaluator.add_rows(lines + ['']), len(lines))
+        for item in items:
+            self.assertEqual(item.track, expected_track(item, myflows), item.a.acl)
+        # the flows exercise every ACL
+        self.assertEqual([x.a.acl for x in items if not x.track], [])
+
+    def test_pmap_sources(self):
+        evaluator = PmapEvaluator([Item(ACLS[1]), Item(ACLS[4])])
+        address = evaluator.address_pmap().split("\n")
+        self.assertEqual(address[:3], ["map-name %s" % ADDRESS_MAP, "mode ipv4",
+                                       "default %s" % NO_LABEL])
+        self.assertEqual(address[3:-1], ["10.1.0.0 10.1.1.255 a0", "10.1.2.0 10.1.3.255 a1",
+                                         "10.1.4.0 10.1.255.255 a2"])
+        self.assertEqual(evaluator.port_pmap().split("\n")[3:-1],
+                         ["6/80 6/80 6p0", "17/53 17/53 17p0"])
+        self.assertEqual(evaluator.fields(), ["src-%s" % ADDRESS_MAP, "dst-%s" % ADDRESS_MAP,
+                                              "src-%s" % PORT_MAP, "dst-%s" % PORT_MAP,
+                                              'protocol', 'type'])
+
+
+if __name__ == '__main__':
+    unittest.main()
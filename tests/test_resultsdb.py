@@ -0,0 +1,78 @@
+# Tests for the results database (acler/resultsdb.py)
+#   python -m unittest discover -s tests
+
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import unittest
+from datetime import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'acler'))
+
+import resultsdb
+from acleritem import AclerItem
+from chunks import day_chunk
+from resultsdb import ResultsDB
+
+DAYS = [datetime(2015, 7, d) for d in (1, 2, 3)]
+
+
+def item(line):
+    a = AclerItem("permit ip host 10.0.0.%s any" % line)
+    a.line = line
+    a.parsed = True
+    a.assessible = True
+    return a
+
+
+class ResultsDBTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.tmpdir, 'results.db')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def run_days(self, checked):
+        """Checkpoint each day with only the lines in checked[day] checked"""
+
+        aclers = [item('1'), item('2'), item('3')]
+        db = ResultsDB(self.filename)
+        run = db.start_run(aclers, 'acls.csv', 0, 'all', 'in', '2015/07/01', '2015/07/03')
+        for (day, lines) in zip(DAYS, checked):
+            chunk = day_chunk(day)
+            for a in aclers:
+                if a.line in lines:
+                    if a.line == '2' and day == DAYS[1]:
+                        a.add_track('in', 'FR', 3)
+                    a.add_check(chunk)
+            db.checkpoint(chunk, aclers)
+        return (db, run)
+
+    def test_held_aclers_checks(self):
+        # 1 checked every day, 2 retires on the second day, 3 held on the first
+        (db, run) = self.run_days([('1', '2'), ('1', '2', '3'), ('1', '3')])
+        items = db.load_aclers(run)
+        db.close()
+
+        self.assertEqual([c.label for c in items['1'].chunks_checked],
+                         ['20150701', '20150702', '20150703'])
+        self.assertEqual([c.label for c in items['2'].chunks_checked], ['20150701', '20150702'])
+        self.assertEqual([c.label for c in items['3'].chunks_checked], ['20150702', '20150703'])
+        self.assertTrue(items['2'].has_records())
+        self.assertFalse(items['3'].has_records())
+
+    def test_other_schema(self):
+        conn = sqlite3.connect(self.filename)
+        conn.executescript(resultsdb.SCHEMA)
+        conn.execute("INSERT INTO meta (key, value) VALUES ('schema', '99')")
+        conn.commit()
+        conn.close()
+        self.assertRaises(ValueError, ResultsDB, self.filename)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,208 @@
+# Tests for the native SiLK flow reader (acler/silkreader.py), against
+# working files packed from known records in each supported format
+#   python -m unittest discover -s tests
+
+import os
+import shutil
+import struct
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'acler'))
+
+import silkreader
+from silkreader import FT_RWGENERIC, FT_RWIPV6ROUTING, SilkFlowReader, read_records
+
+# stime, elapsed, sport, dport, proto, flowtype, sensor, packets, bytes, sip, dip
+FIELDS = ('stime', 'elapsed', 'sport', 'dport', 'proto', 'flowtype', 'sensor',
+          'packets', 'bytes', 'sip', 'dip')
+RECORDS = [
+    (1435708800000, 1500, 40000, 53, 17, 0, 3, 2, 120, 0x0A000001, 0x08080808),
+    (1435708801234, 0, 53, 40000, 17, 1, 3, 2, 240, 0x08080808, 0x0A000001),
+    (1435712400999, 60000, 50000, 443, 6, 1, 7, 10, 4000, 0x0A000002, 0xC0A80001),
+    (1435795199000, 4294967295, 0, 0, 1, 0, 65535, 4294967295, 4294967295, 0xFFFFFFFF, 0),
+    (1435708802000, 10, 1024, 80, 6, 0, 1, 6, 600, 0x27000001, 0x0A000001),
+]
+
+SILK_CONF = "class all\n    type 0 in in\n    type 1 out out\nend class\n"
+
+# a silk.conf PySiLK accepts, for comparing the readers
+PYSILK_CONF = """version 2
+sensor 1 S1
+class all
+    sensors S1
+    type 0 in in
+    type 1 out out
+end class
+default-class all
+default-types in out
+"""
+
+try:
+    import silk
+except ImportError:
+    silk = None
+
+
+def header(fmt, recsize, recver, big, compression=0):
+    """SiLK file header with one extra header entry, padded to a record boundary"""
+
+    e = '>' if big else '<'
+    h = struct.pack('>I', 0xDEADBEEF) + struct.pack(e + 'BBBBIHH', int(big), fmt, 16, compression,
+                                                    3001000, recsize, recver)
+    h += struct.pack('>II', 5, 12) + b'abcd'
+    pad = (-(len(h) + 8)) % recsize
+    h += struct.pack('>II', 0, 8 + pad) + b'\0' * pad
+    return h
+
+
+def pack_generic(records, big):
+    e = '>' if big else '<'
+    data = header(FT_RWGENERIC, 52, 5, big)
+    for (st, el, sp, dp, pr, ft, sid, pk, by, si, di) in records:
+        data += struct.pack(e + 'qIHHBBH12xIIIII', st, el, sp, dp, pr, ft, sid, pk, by, si, di, 7)
+    return data
+
+
+def pack_ipv6routing(records, big, ipv6=()):
+    """ipv4-mapped records, except for the indexes in ipv6, which get a real ipv6 sip"""
+
+    e = '>' if big else '<'
+    data = header(FT_RWIPV6ROUTING, 88, 1, big)
+    for (i, (st, el, sp, dp, pr, ft, sid, pk, by, si, di)) in enumerate(records):
+        data += struct.pack(e + 'qIHHBBH3xB8xII', st, el, sp, dp, pr, ft, sid, 0x80, pk, by)
+        if i in ipv6:
+            data += b'\x20\x01' + b'\0' * 14
+        else:
+            data += b'\0' * 10 + b'\xff\xff' + struct.pack('>I', si)
+        data += b'\0' * 10 + b'\xff\xff' + struct.pack('>I', di) + b'\0' * 16
+    return data
+
+
+def reader_rows(reader):
+    """The records of a SilkFlowReader as (sip, dip, sport, dport, proto, packets, bytes, stime secs, type)"""
+
+    rows = list()
+    for chunk in reader.chunks():
+        for i in range(chunk.count):
+            rows.append((int(chunk.sip[i]), int(chunk.dip[i]), int(chunk.sport[i]),
+                         int(chunk.dport[i]), int(chunk.proto[i]), int(chunk.packets[i]),
+                         int(chunk.bytes[i]), int(chunk.stime[i]) // 1000,
+                         reader.type_names.get(int(chunk.flowtype[i]))))
+    chunk = None
+    reader.close()
+    return rows
+
+
+class SilkReaderTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.silkconf = os.path.join(self.tmpdir, 'silk.conf')
+        with open(self.silkconf, 'w') as f:
+            f.write(SILK_CONF)
+        self.numpy = silkreader.numpy
+
+    def tearDown(self):
+        silkreader.numpy = self.numpy
+        shutil.rmtree(self.tmpdir)
+
+    def write(self, name, data):
+        filename = os.path.join(self.tmpdir, name)
+        with open(filename, 'wb') as f:
+            f.write(data)
+        return filename
+
+    def read(self, filename, mapped):
+        reader = SilkFlowReader(filename, 2, self.silkconf, mapped=mapped)
+        self.assertTrue(reader.native, reader.unsupported)
+        rows = list()
+        for chunk in reader.chunks():
+            columns = [[int(x) for x in getattr(chunk, name)] for name in FIELDS]
+            rows.extend(zip(*columns))
+        skipped = reader.skipped
+        chunk = columns = None
+        reader.close()
+        return (rows, skipped)
+
+    def check_formats(self):
+        for big in (False, True):
+            for mapped in (True, False):
+                generic = self.write('generic.rwf', pack_generic(RECORDS, big))
+                self.assertEqual(self.read(generic, mapped), (RECORDS, 0))
+
+                routing = self.write('routing.rwf', pack_ipv6routing(RECORDS, big, ipv6=(1,)))
+                self.assertEqual(self.read(routing, mapped),
+                                 ([r for (i, r) in enumerate(RECORDS) if i != 1], 1))
+
+    def test_formats_numpy(self):
+        if silkreader.numpy is None:
+            return
+        self.check_formats()
+
+    def test_formats_struct(self):
+        silkreader.numpy = None
+        self.check_formats()
+
+    def test_type_names(self):
+        reader = SilkFlowReader(self.write('generic.rwf', pack_generic(RECORDS, False)),
+                                silkconf=self.silkconf)
+        self.assertEqual(reader.type_names, {0: 'in', 1: 'out'})
+        reader.close()
+
+    def test_read_records_closes_map(self):
+        filename = self.write('generic.rwf', pack_generic(RECORDS, False))
+        records = list(read_records(filename, 2, self.silkconf))
+        self.assertEqual([r[:5] for r in records], [(r[9], r[10], r[2], r[3], r[4]) for r in RECORDS])
+        self.assertEqual([r[7] for r in records], ['in', 'out', 'out', 'in', 'in'])
+
+        # stopping early releases the views too
+        records = read_records(filename, 2, self.silkconf)
+        next(records)
+        records.close()
+
+    def test_read_records_without_type_names(self):
+        # no flowtype ids for names, PySiLK reads the file instead
+        filename = self.write('generic.rwf', pack_generic(RECORDS, False))
+        records = read_records(filename, 2, os.path.join(self.tmpdir, 'missing.conf'))
+        if silk is None:
+            self.assertRaises(ImportError, list, records)
+            return
+        self.assertFalse([r for r in records if r[7] in ('0', '1')])
+
+    @unittest.skipUnless(silk is not None, "PySiLK not available")
+    def test_matches_pysilk(self):
+        silkconf = os.path.join(self.tmpdir, 'pysilk.conf')
+        with open(silkconf, 'w') as f:
+            f.write(PYSILK_CONF)
+        environ = os.environ.get('SILK_CONFIG_FILE')
+        os.environ['SILK_CONFIG_FILE'] = silkconf
+        try:
+            records = [r[:6] + (1,) + r[7:] for r in RECORDS]
+            for big in (False, True):
+                for data in (pack_generic(records, big), pack_ipv6routing(records, big)):
+                    filename = self.write('pysilk.rwf', data)
+                    native = SilkFlowReader(filename, 2, silkconf)
+                    self.assertTrue(native.native, native.unsupported)
+                    rows = reader_rows(native)
+                    self.assertEqual(len(rows), len(records))
+                    self.assertEqual(reader_rows(SilkFlowReader(filename, 2, force_silk=True)), rows)
+        finally:
+            if environ is None:
+                del os.environ['SILK_CONFIG_FILE']
+            else:
+                os.environ['SILK_CONFIG_FILE'] = environ
+
+    def test_unsupported_files(self):
+        compressed = header(FT_RWGENERIC, 52, 5, False, compression=1) + b'\0' * 52
+        for data in (b'', b'not a silk file at all, just some text' * 2, compressed,
+                     header(FT_RWGENERIC, 52, 4, False) + b'\0' * 52):
+            reader = SilkFlowReader(self.write('other.rwf', data), silkconf=self.silkconf)
+            self.assertFalse(reader.native)
+            self.assertTrue(reader.unsupported)
+            reader.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,60 @@
+# Tests for the rolling state file (acler/state.py)
+#   python -m unittest discover -s tests
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+from datetime import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'acler'))
+
+from chunks import day_chunk
+from cisco_custom import parse_cisco
+from state import RollingState
+
+
+def item(line, acl):
+    a = parse_cisco(acl)
+    a.line = line
+    return a
+
+
+class RollingStateTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.tmpdir, 'state.json')
+
+        # a first run that saw traffic for line 1 on 20150701
+        state = RollingState(self.filename, 'all', 'in,out')
+        aclers = [item('1', "access-list 101 permit tcp host 10.0.0.1 any eq 22"),
+                  item('2', "access-list 101 permit udp host 10.0.0.2 any eq 53")]
+        state.reconcile(aclers)
+        aclers[0].add_track('in', 'FR', 3)
+        for a in aclers:
+            a.add_check(day_chunk(datetime(2015, 7, 1)))
+            state.update(a)
+        state.save()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_rewritten_line_keeps_history(self):
+        state = RollingState(self.filename, 'all', 'in,out')
+        aclers = [item('1', "access-list 101 permit tcp 10.0.0.1 0.0.0.0 any eq 22"),
+                  item('2', "access-list 101 permit udp host 10.0.0.2 any eq 54")]
+        self.assertEqual(state.reconcile(aclers), (0, 1, 0))
+        self.assertEqual(state.summary('1'), "1D[last seen 20150701]")
+        self.assertEqual(state.summary('2'), "0D")
+
+    def test_types_in_any_order(self):
+        state = RollingState(self.filename, 'all', 'out, in')
+        self.assertEqual(sorted(state.acls), ['1', '2'])
+        self.assertRaises(ValueError, RollingState, self.filename, 'all', 'in')
+        self.assertRaises(ValueError, RollingState, self.filename, 'other', 'in,out')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,55 @@
+# Tests for the verdict cache (acler/verdictcache.py)
+#   python -m unittest discover -s tests
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+from datetime import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'acler'))
+
+from chunks import day_chunk
+from cisco_custom import parse_cisco
+from verdictcache import VerdictCache, chunk_key
+
+
+class VerdictCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.tmpdir, 'verdicts.db')
+        self.chunk = day_chunk(datetime(2015, 7, 1))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_chunk_key_types_order(self):
+        self.assertEqual(chunk_key('all', 'out,in', self.chunk),
+                         chunk_key('all', 'in, out', self.chunk))
+        self.assertNotEqual(chunk_key('all', 'in', self.chunk),
+                            chunk_key('all', 'in,out', self.chunk))
+
+    def test_store_and_fill(self):
+        a = parse_cisco("access-list 101 permit tcp host 10.0.0.1 any eq 22")
+        a.add_track('in', 'FR', 3)
+        cache = VerdictCache(self.filename, 10)
+        cache.store(chunk_key('all', 'in,out', self.chunk), [a])
+
+        b = parse_cisco("access-list 102 permit tcp 10.0.0.1 0.0.0.0 any eq 22")
+        found = cache.fill(chunk_key('all', 'out,in', self.chunk), [b])
+        cache.close()
+        self.assertEqual(found, [b])
+        self.assertTrue(b.has_records())
+
+    def test_other_schema(self):
+        cache = VerdictCache(self.filename, 10)
+        with cache.conn:
+            cache.conn.execute("UPDATE meta SET value = '99' WHERE key = 'schema'")
+        cache.close()
+        self.assertRaises(ValueError, VerdictCache, self.filename, 10)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,102 @@
+# Tests for answering several --windows at once (acler/acleritem.py)
+#   python -m unittest discover -s tests
+
+import os
+import sys
+import unittest
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'acler'))
+
+from chunks import day_chunk, hour_chunk
+from cisco_custom import parse_cisco
+
+END = datetime(2015, 7, 7)
+# (days, first day) of the 1, 3 and 7 day windows ending at END, as acler.py builds them
+WINDOWS = [(x, END - timedelta(days=x - 1)) for x in (1, 3, 7)]
+
+
+def day(n):
+    return datetime(2015, 7, n)
+
+
+def item():
+    a = parse_cisco("access-list 101 permit tcp host 10.0.0.1 any eq 22")
+    a.line = '1'
+    a.windows = WINDOWS
+    return a
+
+
+def check(a, n, records=0):
+    """Check the item against day n, with records seen that day"""
+
+    if records:
+        a.add_track('in', 'FR', records)
+        a.add_track('in', 'FB', 100 * records)
+    a.add_check(day_chunk(day(n)))
+
+
+class WindowsTest(unittest.TestCase):
+
+    def test_newest_first(self):
+        # traffic on the 4th only
+        a = item()
+        self.assertTrue(a.assess())
+        self.assertEqual([a.window_answer(w) for w in WINDOWS], [None, None, None])
+
+        check(a, 7)
+        self.assertEqual([a.window_answer(w) for w in WINDOWS], [False, None, None])
+        self.assertTrue(a.needs_day(day(6)))
+
+        check(a, 6)
+        check(a, 5)
+        self.assertEqual([a.window_answer(w) for w in WINDOWS], [False, False, None])
+        self.assertTrue(a.needs_day(day(4)))
+        self.assertTrue(a.assess())
+
+        check(a, 4, records=2)
+        self.assertEqual([a.window_answer(w) for w in WINDOWS], [False, False, True])
+        for n in range(1, 8):
+            self.assertFalse(a.needs_day(day(n)))
+        self.assertFalse(a.assess())
+
+        self.assertEqual(a.get_window_column(WINDOWS[0]), "No Traffic 1D||")
+        self.assertEqual(a.get_window_column(WINDOWS[1]), "No Traffic 3D||")
+        self.assertTrue(a.get_window_column(WINDOWS[2]).startswith("Traffic 4D|in|"))
+        self.assertEqual(a.get_window_track(WINDOWS[2])['in']['FB'], 200)
+        self.assertEqual(a.get_window_track(WINDOWS[1]), dict())
+
+    def test_chronological(self):
+        # traffic on the 1st answers only the 7 day window
+        a = item()
+        check(a, 1, records=1)
+        self.assertEqual([a.window_answer(w) for w in WINDOWS], [None, None, True])
+        for n in (2, 3, 4):
+            self.assertFalse(a.needs_day(day(n)))
+        self.assertTrue(a.needs_day(day(5)))
+        self.assertTrue(a.needs_day(day(7)))
+
+        # traffic on the 6th answers the 3 day window, the 7th is still needed
+        check(a, 5)
+        check(a, 6, records=1)
+        self.assertEqual([a.window_answer(w) for w in WINDOWS], [None, True, True])
+        self.assertFalse(a.needs_day(day(6)))
+        self.assertTrue(a.needs_day(day(7)))
+        self.assertTrue(a.assess())
+
+        check(a, 7)
+        self.assertEqual([a.window_answer(w) for w in WINDOWS], [False, True, True])
+        self.assertFalse(a.needs_day(day(7)))
+        self.assertFalse(a.assess())
+        self.assertEqual(a.get_window_track(WINDOWS[1])['in']['FR'], 1)
+        self.assertEqual(a.get_window_track(WINDOWS[2])['in']['FR'], 2)
+
+    def test_first_hour_is_not_a_day(self):
+        a = item()
+        a.add_check(hour_chunk(day(7), 0))
+        self.assertEqual(a.window_answer(WINDOWS[0]), None)
+        self.assertTrue(a.needs_day(day(7)))
+
+
+if __name__ == '__main__':
+    unittest.main()